@@ -0,0 +1,321 @@
+"""Auditoria dos planos de consulta do sistema de hotelaria.
+
+Monta um banco sintético grande (schema criado pelas migrações de
+``banco.py``), extrai do código-fonte todas as consultas SQL que o app
+executa e roda ``EXPLAIN QUERY PLAN`` em cada uma. Trechos montados em
+tempo de execução (``{filtros}``, ``{pagina}``, ``{tabela}``...) são
+trocados pelo exemplo registrado em ``EXEMPLOS``, para o plano auditado
+ser o de uma consulta real. A auditoria falha (código de saída 1) quando
+alguma consulta faz ``SCAN`` em uma tabela com mais linhas que o limite, a
+menos que a varredura esteja registrada em ``VARREDURAS_PERMITIDAS``, ou
+quando um trecho interpolado não tem exemplo. As migrações rodam uma vez
+por banco e ficam de fora.
+
+Uso::
+
+    python auditoria_consultas.py [--linhas 200000] [--limite 10000] [-v]
+"""
+import argparse
+import ast
+import os
+import re
+import sys
+import tempfile
+
+from banco import _saldos_razao, abrir_conexao, aplicar_migracoes, reconstruir_noites
+
+# Arquivos cujas consultas são auditadas
+ARQUIVOS = [
+    "hotel.py", "cubo_receita.py", "banco.py", "estoque.py", "disponibilidade.py",
+    "codigos_barras.py", "cache_leituras.py",
+]
+
+# Exemplo de cada trecho interpolado nas consultas: campos de str.format
+# ("{pagina}") e expressões de f-strings ("{_saldos_razao(tabela)}"). Os
+# filtros opcionais aparecem preenchidos, que é o caso mais seletivo a auditar
+EXEMPLOS = {
+    # hotel.py
+    "pagina": "AND (data_entrada, id) < (?, ?)",
+    "filtros": "AND nome LIKE ? AND cpf_digitos >= ? AND cpf_digitos < ?",
+    "filtro_dia": "AND n.dia BETWEEN ? AND ?",
+    # cubo_receita.py
+    "filtro_noites": "AND n.dia IN (?, ?)",
+    "filtro_datas": "AND m.data IN (?, ?)",
+    # banco.py e estoque.py
+    "filtro": "AND id IN (?, ?)",
+    "marcadores": "?, ?",
+    "somas": "COALESCE(SUM(receita_quartos), 0), COALESCE(SUM(noites), 0)",
+    "onde": "WHERE dia >= ? AND dia <= ?",
+    "tabela": "estoque",
+    "movimentacoes": "movimentacoes_estoque",
+    "limite_cauda": "AND m.data <= ?",
+    "limite_retrato": "AND data <= ?",
+    "filtro_produtos": "WHERE p.id = ?",
+    "_saldos_razao(tabela)": _saldos_razao("estoque"),
+}
+
+# Proporção de linhas de cada tabela em relação a --linhas. Tabelas de
+# histórico crescem com o uso; cadastros ficam pequenos.
+PROPORCOES = {
+    "reservas": 1.0,
+    "hospedes": 0.25,
+    "arrumacoes": 0.25,
+    "arrumacoes_itens": 0.5,
+    "movimentacoes_estoque": 1.0,
+    "movimentacoes_estoquelj": 1.0,
+    "comunicados": 0.05,
+    "estoque": 0.01,
+    "estoquelj": 0.05,
+    "funcionarios": 0.0005,
+    "usuarios": 0.0005,
+}
+
+# Varreduras conhecidas e aceitas: (função, tabela) -> motivo
+VARREDURAS_PERMITIDAS = {
+    ("arrumacao", "arrumacoes"): "histórico completo de tarefas",
+    ("modulo_contabil", "reservas"): "CPFs distintos e contagem de clientes",
+    ("reconstruir_noites", "noites_quartos"): "reconstrução completa pela linha de comando",
+}
+
+_PALAVRAS_SQL = {
+    "where", "join", "inner", "left", "cross", "on", "group", "order", "limit",
+    "using", "natural", "set", "values", "union", "as",
+}
+
+
+# -------------------- BANCO SINTÉTICO --------------------
+def _inserir_sequencia(conn, quantidade, sql):
+    # Executa um INSERT ... SELECT sobre a sequência n = 1..quantidade
+    if quantidade <= 0:
+        return
+    conn.execute(f"""
+        WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < {int(quantidade)})
+        {sql}
+    """)
+
+
+def popular_banco_sintetico(conn, linhas):
+    q = {tabela: int(linhas * p) for tabela, p in PROPORCOES.items()}
+
+    _inserir_sequencia(conn, q["hospedes"], """
+        INSERT INTO hospedes (nome, cpf, cpf_digitos, documento, telefone, placa)
+        SELECT 'Hóspede ' || n, printf('%011d', n), printf('%011d', n), 'RG' || n, '55' || n, 'ABC' || (n % 10000)
+        FROM seq
+    """)
+    _inserir_sequencia(conn, q["reservas"], f"""
+        INSERT INTO reservas (nome, cpf, cpf_digitos, data_entrada, data_saida, dia_entrada, dia_saida,
+                              valor, valor_centavos, quarto, status)
+        SELECT 'Hóspede ' || (n % {max(q["hospedes"], 1)}), printf('%011d', n % {max(q["hospedes"], 1)}),
+               printf('%011d', n % {max(q["hospedes"], 1)}),
+               date('2015-01-01', '+' || (n / 40) || ' days'),
+               date('2015-01-01', '+' || (n / 40 + 1 + n % 5) || ' days'),
+               16436 + n / 40, 16436 + n / 40 + 1 + n % 5,
+               150 + n % 200, (150 + n % 200) * 100, ((n % 8) + 1) || '-' || ((n / 8) % 10 + 1),
+               CASE n % 10 WHEN 0 THEN 'Cancelada' WHEN 1 THEN 'Ativa' ELSE 'Finalizada' END
+        FROM seq
+    """)
+    reconstruir_noites(conn)
+    # Saldos altos: as saídas sintéticas abaixo não podem passar do saldo (gatilho do razão)
+    _inserir_sequencia(conn, q["estoque"], """
+        INSERT INTO estoque (nome, categoria, unidade, quantidade, valor_unitario, status, observacao,
+                             estoque_minimo, estoque_maximo)
+        SELECT 'Item ' || n, 'Categoria ' || (n % 17), 'un', 100000 + n % 50, 1 + n % 30, '✅ Ativo', '', 5, 100
+        FROM seq
+    """)
+    _inserir_sequencia(conn, q["estoquelj"], """
+        INSERT INTO estoquelj (nome, categoria, unidade, quantidade, valor_unitario, status, observacao,
+                               codigo_barras, estoque_minimo, estoque_maximo)
+        SELECT 'Produto ' || n, 'Categoria ' || (n % 17), 'un', 100000 + n % 50, 1 + n % 30, '✅ Ativo', '',
+               printf('789%010d', n), 5, 100 FROM seq
+    """)
+    _inserir_sequencia(conn, q["movimentacoes_estoque"], f"""
+        INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, data, hora, valor_total, observacao)
+        SELECT n % {max(q["estoque"], 1)} + 1, CASE n % 3 WHEN 0 THEN 'Entrada' ELSE 'Saída' END, 1 + n % 5,
+               date('2015-01-01', '+' || (n / 50) || ' days'), '10:00:00', 10.0 * (1 + n % 5), '' FROM seq
+    """)
+    _inserir_sequencia(conn, q["movimentacoes_estoquelj"], f"""
+        INSERT INTO movimentacoes_estoquelj (produto_id, tipo, cliente, quarto, quantidade, data, hora,
+                                             valor_total, observacao)
+        SELECT n % {max(q["estoquelj"], 1)} + 1, CASE n % 4 WHEN 0 THEN 'Entrada' ELSE 'Venda' END,
+               'Hóspede ' || n, '1-1', 1 + n % 3, date('2015-01-01', '+' || (n / 50) || ' days'),
+               '10:00:00', 5.0 * (1 + n % 3), '' FROM seq
+    """)
+    _inserir_sequencia(conn, q["arrumacoes"], """
+        INSERT INTO arrumacoes (nome, funcao, quarto, status, data, hora, tempo_previsto)
+        SELECT 'Funcionário ' || (n % 20), 'Limpeza', ((n % 8) + 1) || '-' || ((n / 8) % 10 + 1),
+               CASE WHEN n % 500 = 0 THEN 'Pendente' ELSE 'Concluído' END,
+               date('2015-01-01', '+' || (n / 20) || ' days'), '09:00', '00:45' FROM seq
+    """)
+    _inserir_sequencia(conn, q["arrumacoes_itens"], f"""
+        INSERT INTO arrumacoes_itens (arrumacao_id, produto_id, quantidade, valor_unitario, valor_total, data, hora)
+        SELECT n % {max(q["arrumacoes"], 1)} + 1, n % {max(q["estoque"], 1)} + 1, 1, 2.0, 2.0,
+               date('2015-01-01', '+' || (n / 40) || ' days'), '09:30:00' FROM seq
+    """)
+    _inserir_sequencia(conn, q["comunicados"], """
+        INSERT INTO comunicados (mensagem, destinatario, data, hora)
+        SELECT 'Comunicado ' || n, 'Todos', date('2015-01-01', '+' || (n / 5) || ' days'), '08:00:00' FROM seq
+    """)
+    _inserir_sequencia(conn, q["funcionarios"], """
+        INSERT INTO funcionarios (nome, funcao) SELECT 'Funcionário ' || n, 'Limpeza' FROM seq
+    """)
+    _inserir_sequencia(conn, q["usuarios"], """
+        INSERT INTO usuarios (nome, usuario, senha, funcao)
+        SELECT 'Usuário ' || n, 'usuario' || n, 'senha', 'Recepcionista' FROM seq
+    """)
+    conn.commit()
+
+
+# -------------------- EXTRAÇÃO DAS CONSULTAS --------------------
+def _exemplo(trecho):
+    # Exemplo registrado para o trecho, ou uma marca «trecho» que a auditoria
+    # aponta como trecho sem exemplo
+    return EXEMPLOS.get(trecho, f"«{trecho}»")
+
+
+def _texto_literal(no, constantes):
+    # Texto de uma string literal. Em f-strings, constantes do módulo são
+    # substituídas pelo seu valor e as demais partes interpoladas pelo
+    # exemplo em EXEMPLOS; campos de str.format ("{filtro}") também
+    if isinstance(no, ast.Constant) and isinstance(no.value, str):
+        texto = no.value
+    elif isinstance(no, ast.JoinedStr):
+        partes = []
+        for parte in no.values:
+            if isinstance(parte, ast.Constant) and isinstance(parte.value, str):
+                partes.append(parte.value)
+            elif isinstance(parte, ast.FormattedValue):
+                if isinstance(parte.value, ast.Name) and parte.value.id in constantes:
+                    partes.append(constantes[parte.value.id])
+                else:
+                    partes.append(_exemplo(ast.unparse(parte.value)))
+        texto = "".join(partes)
+    else:
+        return None
+    return re.sub(r"\{(\w+)\}", lambda campo: _exemplo(campo.group(1)), texto)
+
+
+def extrair_consultas(caminho):
+    """Retorna [(função, linha, sql)] para cada literal SQL do arquivo."""
+    with open(caminho, encoding="utf-8") as arquivo:
+        arvore = ast.parse(arquivo.read(), filename=caminho)
+
+    # Strings atribuídas no nível do módulo (ex.: SQL_RECEITA_HOSPEDE), inclusive
+    # f-strings montadas com constantes anteriores
+    constantes = {}
+    for no in arvore.body:
+        if isinstance(no, ast.Assign) and len(no.targets) == 1 and isinstance(no.targets[0], ast.Name):
+            if isinstance(no.value, ast.Constant) and isinstance(no.value.value, str):
+                constantes[no.targets[0].id] = no.value.value
+            elif isinstance(no.value, ast.JoinedStr):
+                constantes[no.targets[0].id] = _texto_literal(no.value, constantes)
+
+    consultas = []
+
+    def visitar(no, funcao):
+        if isinstance(no, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if no.name.startswith("_migracao_"):
+                return
+            funcao = no.name
+        texto = _texto_literal(no, constantes)
+        if texto is not None:
+            # Palavra-chave seguida do resto do comando: "UPDATE" sozinho é nome de evento
+            if re.match(r"\s*(SELECT|UPDATE|DELETE|WITH)\s", texto, re.IGNORECASE):
+                consultas.append((funcao, no.lineno, texto.strip()))
+            return
+        for filho in ast.iter_child_nodes(no):
+            visitar(filho, funcao)
+
+    visitar(arvore, "<módulo>")
+    return consultas
+
+
+def _apelidos(sql, tabelas):
+    # Mapeia nome/apelido usado no plano -> tabela real
+    apelidos = {}
+    for tabela, apelido in re.findall(r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE):
+        if tabela not in tabelas:
+            continue
+        apelidos[tabela] = tabela
+        if apelido and apelido.lower() not in _PALAVRAS_SQL:
+            apelidos[apelido] = tabela
+    return apelidos
+
+
+# -------------------- AUDITORIA --------------------
+def auditar(conn, consultas, limite, verboso=False):
+    """Roda EXPLAIN QUERY PLAN nas consultas e devolve a lista de problemas."""
+    tamanhos = {
+        tabela: conn.execute(f"SELECT COUNT(*) FROM {tabela}").fetchone()[0]
+        for (tabela,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        ).fetchall()
+    }
+
+    problemas = []
+    usadas = set()
+    for funcao, linha, sql in consultas:
+        sem_exemplo = re.findall(r"«(.+?)»", sql)
+        if sem_exemplo:
+            problemas.append(f"{funcao} (linha {linha}): sem exemplo em EXEMPLOS para {', '.join(sem_exemplo)}")
+            continue
+        parametros = [None] * sql.count("?")
+        try:
+            plano = conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros).fetchall()
+        except Exception as e:
+            problemas.append(f"{funcao} (linha {linha}): consulta inválida: {e}")
+            continue
+
+        apelidos = _apelidos(sql, tamanhos)
+        for _, _, _, detalhe in plano:
+            if verboso:
+                print(f"  {funcao}:{linha}: {detalhe}")
+            # Tabelas virtuais (FTS5) usam o índice próprio escolhido no plano
+            encontrado = re.match(r"SCAN (\w+)\b(?! VIRTUAL TABLE INDEX)", detalhe)
+            if not encontrado or encontrado.group(1) not in apelidos:
+                continue
+            tabela = apelidos[encontrado.group(1)]
+            if tamanhos[tabela] <= limite:
+                continue
+            if (funcao, tabela) in VARREDURAS_PERMITIDAS:
+                usadas.add((funcao, tabela))
+                continue
+            problemas.append(
+                f"{funcao} (linha {linha}): {detalhe} em {tamanhos[tabela]} linhas\n    {' '.join(sql.split())}"
+            )
+
+    for funcao, tabela in VARREDURAS_PERMITIDAS.keys() - usadas:
+        print(f"ℹ️ Varredura permitida não ocorre mais, remova-a da lista: {funcao} / {tabela}")
+    return problemas
+
+
+def main(argumentos=None):
+    parser = argparse.ArgumentParser(description="Audita os planos de consulta do sistema de hotelaria.")
+    parser.add_argument("--linhas", type=int, default=200000, help="linhas das maiores tabelas sintéticas")
+    parser.add_argument("--limite", type=int, default=10000, help="maior tabela em que um SCAN é tolerado")
+    parser.add_argument("-v", "--verboso", action="store_true", help="mostra o plano de todas as consultas")
+    args = parser.parse_args(argumentos)
+
+    pasta = os.path.dirname(os.path.abspath(__file__))
+    consultas = []
+    for arquivo in ARQUIVOS:
+        consultas.extend(extrair_consultas(os.path.join(pasta, arquivo)))
+
+    with tempfile.TemporaryDirectory() as temporario:
+        conn = abrir_conexao(os.path.join(temporario, "auditoria.db"))
+        aplicar_migracoes(conn)
+        popular_banco_sintetico(conn, args.linhas)
+        problemas = auditar(conn, consultas, args.limite, args.verboso)
+        conn.close()
+
+    print(f"{len(consultas)} consultas auditadas.")
+    if problemas:
+        print(f"❌ {len(problemas)} varredura(s) completa(s) em tabelas grandes:")
+        for problema in problemas:
+            print(f"- {problema}")
+        return 1
+    print("✅ Nenhuma varredura completa em tabelas grandes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
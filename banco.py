@@ -0,0 +1,1255 @@
+"""Acesso ao banco SQLite do sistema de hotelaria.
+
+O schema é versionado pela tabela ``schema_version``: cada passo de
+``MIGRACOES`` roda uma única vez, em ordem, dentro da sua própria transação.
+O ``hotel.py`` aplica as migrações uma vez por processo; quando a versão
+gravada já é a mais recente nada é executado.
+
+As conexões vêm de ``PoolConexoes``: cada execução do script (uma interação
+de um usuário) pega a sua própria conexão, aberta em modo WAL, e a devolve
+ao terminar. Assim leituras de uma sessão não ficam na fila atrás da
+escrita de outra.
+
+Uso pela linha de comando::
+
+    python banco.py                       # aplica as migrações pendentes
+    python banco.py --reconstruir-noites  # refaz noites_quartos a partir de reservas
+    python banco.py --reconstruir-livro   # refaz livro_diario a partir das movimentações
+    python banco.py --retratos-estoque    # grava retratos do razão do estoque
+    python banco.py --reconstruir-estoque # refaz as quantidades a partir do razão
+    python banco.py --divergencias-estoque          # confere as quantidades com o razão
+    python banco.py --saldo-estoque estoque 12 --data 2024-05-31  # saldo pelo razão
+"""
+import argparse
+import os
+import queue
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+CAMINHO_BANCO = os.environ.get("HOTEL_DB", "hotel.db")
+
+# Ajustes aplicados a cada conexão aberta pelo pool
+PRAGMAS = {
+    "journal_mode": "WAL",      # leitores não bloqueiam o escritor e vice-versa
+    "synchronous": "NORMAL",    # seguro em WAL, sem fsync a cada commit
+    "cache_size": -16000,       # ~16 MB de cache de páginas por conexão
+    "mmap_size": 134217728,     # 128 MB lidos via mmap
+    "temp_store": "MEMORY",
+}
+TIMEOUT_BLOQUEIO = 5.0          # segundos esperando o lock dentro do SQLite
+TENTATIVAS_BLOQUEIO = 5         # novas tentativas após "database is locked"
+
+
+def somente_digitos(texto):
+    """CPF (ou outro documento) só com os dígitos, como gravado em ``cpf_digitos``."""
+    if texto is None:
+        return None
+    return re.sub(r"\D", "", str(texto))
+
+
+# -------------------- VALORES TIPADOS DAS RESERVAS --------------------
+# Em ``reservas`` o dinheiro é gravado em centavos inteiros (``valor_centavos``,
+# valor da diária) e as datas também como número do dia contado a partir de
+# 1970-01-01 (``dia_entrada`` / ``dia_saida``), o mesmo que ``datetime64[D]``.
+EPOCA = date(1970, 1, 1)
+
+
+def ler_data(valor):
+    """Converte date/datetime/texto (ISO ou dd/mm/aaaa) em ``date``; None se inválido."""
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    if not valor:
+        return None
+    texto = str(valor).strip()
+    try:
+        return date.fromisoformat(texto[:10])
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(texto[:10], "%d/%m/%Y").date()
+    except ValueError:
+        return None
+
+
+def numero_dia(valor):
+    data = ler_data(valor)
+    return None if data is None else (data - EPOCA).days
+
+
+def centavos(valor):
+    """Converte reais (número ou texto como "150", "150.5", "R$ 1.234,56") em centavos."""
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        texto = valor.replace("R$", "").strip()
+        if "," in texto:
+            texto = texto.replace(".", "").replace(",", ".")
+        valor = texto
+    try:
+        return int((Decimal(str(valor)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def campos_reserva(data_entrada, data_saida, valor_diaria):
+    """Valida e converte as datas e a diária de uma reserva para gravação.
+
+    Retorna um dicionário com ``data_entrada``/``data_saida`` em ISO,
+    ``dia_entrada``/``dia_saida`` e ``valor_centavos``. Levanta ``ValueError``
+    com a mensagem para o usuário quando algum campo é inválido.
+    """
+    entrada, saida = ler_data(data_entrada), ler_data(data_saida)
+    if entrada is None or saida is None:
+        raise ValueError("Datas de entrada e saída inválidas.")
+    if saida < entrada:
+        raise ValueError("A data de saída não pode ser anterior à data de entrada.")
+
+    valor_centavos = centavos(valor_diaria)
+    if valor_centavos is None or valor_centavos < 0:
+        raise ValueError("Valor da diária inválido.")
+
+    return {
+        "data_entrada": entrada.isoformat(),
+        "data_saida": saida.isoformat(),
+        "dia_entrada": (entrada - EPOCA).days,
+        "dia_saida": (saida - EPOCA).days,
+        "valor_centavos": valor_centavos,
+    }
+
+
+# -------------------- CONEXÕES --------------------
+def _com_retentativa(funcao, *args):
+    # Repete a operação com espera exponencial enquanto o banco estiver bloqueado
+    espera = 0.05
+    for tentativa in range(TENTATIVAS_BLOQUEIO):
+        try:
+            return funcao(*args)
+        except sqlite3.OperationalError as e:
+            mensagem = str(e).lower()
+            bloqueado = "database is locked" in mensagem or "database is busy" in mensagem
+            if not bloqueado or tentativa == TENTATIVAS_BLOQUEIO - 1:
+                raise
+            time.sleep(espera)
+            espera *= 2
+
+
+class CursorHotel(sqlite3.Cursor):
+    def execute(self, sql, parametros=()):
+        return _com_retentativa(super().execute, sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return _com_retentativa(super().executemany, sql, parametros)
+
+
+class ConexaoHotel(sqlite3.Connection):
+    """Conexão cujos cursores repetem comandos quando o banco está bloqueado."""
+
+    def cursor(self, factory=CursorHotel):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+    def commit(self):
+        return _com_retentativa(super().commit)
+
+
+def abrir_conexao(caminho=CAMINHO_BANCO):
+    conexao = sqlite3.connect(
+        caminho,
+        timeout=TIMEOUT_BLOQUEIO,
+        check_same_thread=False,
+        factory=ConexaoHotel,
+    )
+    for pragma, valor in PRAGMAS.items():
+        conexao.execute(f"PRAGMA {pragma} = {valor}")
+    return conexao
+
+
+class PoolConexoes:
+    """Pool de conexões reaproveitadas entre as sessões do Streamlit.
+
+    Cada conexão é usada por uma única thread por vez: ``conexao()`` empresta
+    uma conexão livre (ou abre uma nova) e a devolve ao final do bloco,
+    desfazendo qualquer transação que tenha ficado aberta. Até ``tamanho``
+    conexões ociosas são mantidas; as excedentes são fechadas.
+    """
+
+    def __init__(self, caminho=CAMINHO_BANCO, tamanho=8):
+        self.caminho = caminho
+        self._livres = queue.LifoQueue(maxsize=tamanho)
+
+    @contextmanager
+    def conexao(self):
+        try:
+            conexao = self._livres.get_nowait()
+        except queue.Empty:
+            conexao = abrir_conexao(self.caminho)
+
+        try:
+            yield conexao
+        finally:
+            if conexao.in_transaction:
+                conexao.rollback()
+            try:
+                self._livres.put_nowait(conexao)
+            except queue.Full:
+                conexao.close()
+
+    def fechar(self):
+        while True:
+            try:
+                self._livres.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# -------------------- MIGRAÇÕES --------------------
+def _migracao_001_tabelas_iniciais(cursor):
+    # Tabela de produtos em estoque
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS estoque (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        categoria TEXT,
+        unidade TEXT,
+        quantidade INTEGER DEFAULT 0,
+        valor_unitario REAL DEFAULT 0,
+        status TEXT,
+        observacao TEXT,
+        estoque_minimo INTEGER DEFAULT 0,
+        estoque_maximo INTEGER DEFAULT 0
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS movimentacoes_estoque (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produto_id INTEGER,
+        tipo TEXT,
+        quantidade INTEGER,
+        data TEXT,
+        hora TEXT,
+        valor_total REAL,
+        observacao TEXT,
+        FOREIGN KEY(produto_id) REFERENCES estoque(id)
+    )
+    """)
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS arrumacoes_itens (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        arrumacao_id INTEGER,
+        produto_id INTEGER,
+        quantidade INTEGER,
+        valor_unitario REAL,
+        valor_total REAL,
+        data TEXT,
+        hora TEXT,
+        FOREIGN KEY(arrumacao_id) REFERENCES arrumacoes(id),
+        FOREIGN KEY(produto_id) REFERENCES estoque(id)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        usuario TEXT UNIQUE,
+        senha TEXT,
+        funcao TEXT
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS hospedes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        cpf TEXT,
+        data_nascimento TEXT,
+        documento TEXT,
+        endereco TEXT,
+        telefone TEXT,
+        cidade TEXT,
+        placa TEXT,
+        rg TEXT
+    )
+    ''')
+
+    # Tabela de produtos
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS produtos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        preco REAL,
+        quantidade INTEGER
+    )
+    ''')
+
+    # Tabela de funcionários
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS funcionarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        funcao TEXT,
+        status TEXT
+    )
+    ''')
+
+    # Tabela de arrumações
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS arrumacoes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        funcao TEXT,
+        quarto TEXT,
+        status TEXT,
+        data TEXT,
+        hora TEXT,
+        diferenca_tempo TEXT,
+        tempo_previsto TEXT,
+        observacao TEXT,
+        tempo_gasto TEXT
+    )
+    ''')
+
+    # Tabela de reservas
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS reservas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        cpf TEXT,
+        data_entrada TEXT,
+        data_saida TEXT,
+        valor TEXT,
+        quarto TEXT,
+        status TEXT DEFAULT 'Ativa',
+        motivo_cancelamento TEXT
+    )
+    """)
+
+    # Tabela de quartos
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS quartos (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        quarto TEXT,
+        status TEXT
+    )
+    ''')
+
+    # Tabela de produtos da lojinha
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS estoquelj (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT NOT NULL,
+        categoria TEXT,
+        unidade TEXT,
+        quantidade INTEGER DEFAULT 0,
+        valor_unitario REAL DEFAULT 0,
+        status TEXT,
+        observacao TEXT,
+        codigo_barras TEXT,
+        estoque_minimo INTEGER DEFAULT 0,
+        estoque_maximo INTEGER DEFAULT 0
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS comunicados (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mensagem TEXT,
+        destinatario TEXT,
+        data TEXT,
+        hora TEXT
+    )
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS movimentacoes_estoquelj (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        produto_id INTEGER,
+        tipo TEXT,
+        cliente TEXT,
+        quarto TEXT,
+        quantidade INTEGER,
+        data TEXT,
+        hora TEXT,
+        valor_total REAL,
+        observacao TEXT,
+        FOREIGN KEY(produto_id) REFERENCES estoque(id)
+    )
+    """)
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS produtoslj (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        nome TEXT,
+        preco REAL,
+        quantidade INTEGER
+    )
+    ''')
+
+
+def _migracao_002_popular_quartos(cursor):
+    # Popula os quartos (8 andares x 10 quartos) se estiver vazio
+    cursor.execute("SELECT COUNT(*) FROM quartos")
+    if cursor.fetchone()[0] == 0:
+        cursor.executemany(
+            "INSERT INTO quartos (quarto, status) VALUES (?, ?)",
+            [(f"{andar+1}-{numero+1}", "Livre") for andar in range(8) for numero in range(10)]
+        )
+
+
+# Índices secundários dos caminhos de consulta mais usados pelas telas.
+# (nome, tabela, colunas)
+INDICES = [
+    ("idx_reservas_status", "reservas", "status"),
+    ("idx_reservas_data_entrada", "reservas", "data_entrada"),
+    ("idx_reservas_quarto", "reservas", "quarto"),
+    ("idx_quartos_quarto", "quartos", "quarto"),
+    ("idx_arrumacoes_status", "arrumacoes", "status, quarto"),
+    ("idx_hospedes_nome", "hospedes", "nome"),
+    ("idx_estoque_categoria", "estoque", "categoria"),
+    ("idx_estoquelj_categoria", "estoquelj", "categoria"),
+    ("idx_estoquelj_codigo_barras", "estoquelj", "codigo_barras"),
+    ("idx_mov_estoque_tipo_data", "movimentacoes_estoque", "tipo, data"),
+    ("idx_mov_estoquelj_tipo_data", "movimentacoes_estoquelj", "tipo, data"),
+]
+
+
+def _migracao_003_indices(cursor):
+    for nome, tabela, colunas in INDICES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {nome} ON {tabela} ({colunas})")
+
+
+def _migracao_004_cpf_digitos(cursor):
+    # CPF só com dígitos, preenchido na gravação e indexado, para que a busca
+    # por CPF seja uma igualdade em vez de REPLACE(...) sobre a tabela inteira
+    for tabela in ("reservas", "hospedes"):
+        colunas = [coluna[1] for coluna in cursor.execute(f"PRAGMA table_info({tabela})").fetchall()]
+        if "cpf_digitos" not in colunas:
+            cursor.execute(f"ALTER TABLE {tabela} ADD COLUMN cpf_digitos TEXT")
+
+        linhas = cursor.execute(f"SELECT id, cpf FROM {tabela}").fetchall()
+        cursor.executemany(
+            f"UPDATE {tabela} SET cpf_digitos = ? WHERE id = ?",
+            [(somente_digitos(cpf), id_) for id_, cpf in linhas]
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabela}_cpf_digitos ON {tabela} (cpf_digitos)")
+
+
+def _migracao_005_reservas_tipadas(cursor):
+    # Diária em centavos e datas como número do dia; as datas em texto são
+    # reescritas no formato ISO para que filtros e ordenação funcionem
+    colunas = [coluna[1] for coluna in cursor.execute("PRAGMA table_info(reservas)").fetchall()]
+    for coluna in ("valor_centavos", "dia_entrada", "dia_saida"):
+        if coluna not in colunas:
+            cursor.execute(f"ALTER TABLE reservas ADD COLUMN {coluna} INTEGER")
+
+    atualizacoes = []
+    for id_, data_entrada, data_saida, valor in cursor.execute(
+        "SELECT id, data_entrada, data_saida, valor FROM reservas"
+    ).fetchall():
+        entrada, saida = ler_data(data_entrada), ler_data(data_saida)
+        atualizacoes.append((
+            entrada.isoformat() if entrada else data_entrada,
+            saida.isoformat() if saida else data_saida,
+            numero_dia(entrada),
+            numero_dia(saida),
+            centavos(valor),
+            id_,
+        ))
+    cursor.executemany("""
+        UPDATE reservas
+        SET data_entrada = ?, data_saida = ?, dia_entrada = ?, dia_saida = ?, valor_centavos = ?
+        WHERE id = ?
+    """, atualizacoes)
+
+
+def _criar_gatilhos_versao(cursor, tabela):
+    # Incrementa versoes_tabelas[tabela] a cada INSERT/UPDATE/DELETE na tabela
+    for evento in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_versao_{tabela}_{evento.lower()}
+        AFTER {evento} ON {tabela}
+        BEGIN
+            INSERT INTO versoes_tabelas (tabela, versao) VALUES ('{tabela}', 1)
+            ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1;
+        END
+        """)
+
+
+def _migracao_006_versoes_tabelas(cursor):
+    # Contador de alterações por tabela, usado por caches em memória (como o
+    # mapa de disponibilidade) para saber se ainda refletem o banco
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS versoes_tabelas (
+        tabela TEXT PRIMARY KEY,
+        versao INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    _criar_gatilhos_versao(cursor, "reservas")
+
+
+# -------------------- NOITES DOS QUARTOS --------------------
+# noites_quartos tem uma linha por noite de cada estadia (quarto, dia, reserva,
+# diária). É mantida pelas telas que alteram reservas, na mesma transação, e
+# pode ser refeita do zero com ``reconstruir_noites``. Só estadias ativas ou
+# finalizadas ocupam noites; canceladas e reagendadas não. Um check-out antes
+# da data reservada grava o dia efetivo em ``reservas.dia_checkout``, e as
+# noites vão só até ele (no mínimo uma).
+
+SQL_GERAR_NOITES = """
+    WITH RECURSIVE noites (reserva_id, quarto, dia, fim, valor_centavos) AS (
+        SELECT id, quarto, dia_entrada, MAX(MIN(dia_saida, COALESCE(dia_checkout, dia_saida)), dia_entrada + 1),
+               COALESCE(valor_centavos, 0)
+        FROM reservas
+        WHERE status IN ('Ativa', 'Finalizada') AND dia_entrada IS NOT NULL AND dia_saida IS NOT NULL {filtro}
+        UNION ALL
+        SELECT reserva_id, quarto, dia + 1, fim, valor_centavos FROM noites WHERE dia + 1 < fim
+    )
+    INSERT INTO noites_quartos (reserva_id, quarto, dia, valor_centavos)
+    SELECT reserva_id, quarto, dia, valor_centavos FROM noites
+"""
+
+
+def atualizar_noites(conn, *reserva_ids):
+    """Refaz as noites das reservas indicadas conforme o estado atual delas.
+
+    Deve ser chamada dentro da transação que alterou as reservas.
+    """
+    ids = [int(reserva_id) for reserva_id in reserva_ids]
+    if not ids:
+        return
+    marcadores = ", ".join("?" * len(ids))
+    conn.execute(f"DELETE FROM noites_quartos WHERE reserva_id IN ({marcadores})", ids)
+    conn.execute(SQL_GERAR_NOITES.format(filtro=f"AND id IN ({marcadores})"), ids)
+
+
+def encerrar_noites(conn, reserva_id, dia_saida):
+    """Check-out: grava o dia da saída efetiva e descarta as noites a partir dele."""
+    conn.execute("UPDATE reservas SET dia_checkout = ? WHERE id = ?", (dia_saida, int(reserva_id)))
+    conn.execute("""
+        DELETE FROM noites_quartos
+        WHERE reserva_id = ? AND dia >= ?
+        AND dia > (SELECT MIN(dia) FROM noites_quartos WHERE reserva_id = ?)
+    """, (int(reserva_id), dia_saida, int(reserva_id)))
+
+
+def reconstruir_noites(conn):
+    """Apaga e gera novamente todas as noites a partir de ``reservas``.
+
+    Estadias finalizadas voltam só até o dia efetivo do check-out
+    (``dia_checkout``). Retorna a quantidade de noites geradas.
+    """
+    conn.execute("DELETE FROM noites_quartos")
+    conn.execute(SQL_GERAR_NOITES.format(filtro=""))
+    return conn.execute("SELECT COUNT(*) FROM noites_quartos").fetchone()[0]
+
+
+def _coluna_dia_checkout(cursor):
+    # Usada por SQL_GERAR_NOITES: também é criada na migração 7, que já gera noites
+    colunas = [coluna[1] for coluna in cursor.execute("PRAGMA table_info(reservas)").fetchall()]
+    if "dia_checkout" not in colunas:
+        cursor.execute("ALTER TABLE reservas ADD COLUMN dia_checkout INTEGER")
+
+
+def _migracao_007_noites_quartos(cursor):
+    _coluna_dia_checkout(cursor)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS noites_quartos (
+        reserva_id INTEGER NOT NULL,
+        quarto TEXT NOT NULL,
+        dia INTEGER NOT NULL,
+        valor_centavos INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (reserva_id, dia),
+        FOREIGN KEY (reserva_id) REFERENCES reservas(id)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_noites_quartos_dia ON noites_quartos (dia, quarto)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_noites_quartos_quarto ON noites_quartos (quarto, dia)")
+    reconstruir_noites(cursor)
+
+
+def _migracao_008_versao_quartos(cursor):
+    # O mapa de ocupação em cache só é redesenhado quando algum quarto muda
+    _criar_gatilhos_versao(cursor, "quartos")
+
+
+# -------------------- STATUS DOS QUARTOS --------------------
+# Valores aceitos em quartos.status, gravados exatamente assim. Gatilhos
+# (migração 9) recusam qualquer outro valor, então as telas filtram por
+# igualdade e usam o índice idx_quartos_status.
+STATUS_QUARTO = ("Livre", "Ocupado", "Em Uso", "Em Arrumação", "Em Limpeza", "Em Manutenção", "Bloqueado")
+
+# Status em que o quarto não pode receber um hóspede agora
+STATUS_QUARTO_INDISPONIVEL = ("Em Uso", "Em Arrumação", "Em Limpeza", "Em Manutenção", "Bloqueado")
+
+# Grafias antigas encontradas no banco
+_SINONIMOS_STATUS_QUARTO = {"em arrumacao": "Em Arrumação", "em manutencao": "Em Manutenção"}
+
+
+def status_quarto(texto):
+    """Converte qualquer grafia (caixa, espaços, sem acento) no status canônico."""
+    chave = " ".join(str(texto or "").split()).lower()
+    for status in STATUS_QUARTO:
+        if status.lower() == chave:
+            return status
+    if chave in _SINONIMOS_STATUS_QUARTO:
+        return _SINONIMOS_STATUS_QUARTO[chave]
+    raise ValueError(f"Status de quarto inválido: {texto!r}")
+
+
+def _migracao_009_status_quartos(cursor):
+    # Padroniza os status existentes; valores desconhecidos ficam bloqueados
+    # para revisão em vez de aparecerem como livres
+    atualizacoes = []
+    for id_, status in cursor.execute("SELECT id, status FROM quartos").fetchall():
+        try:
+            novo = status_quarto(status)
+        except ValueError:
+            novo = "Bloqueado"
+        if novo != status:
+            atualizacoes.append((novo, id_))
+    cursor.executemany("UPDATE quartos SET status = ? WHERE id = ?", atualizacoes)
+
+    permitidos = ", ".join(f"'{status}'" for status in STATUS_QUARTO)
+    for evento in ("INSERT", "UPDATE"):
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_quartos_status_{evento.lower()}
+        BEFORE {evento} ON quartos
+        WHEN NEW.status IS NULL OR NEW.status NOT IN ({permitidos})
+        BEGIN
+            SELECT RAISE(ABORT, 'status de quarto inválido');
+        END
+        """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_quartos_status ON quartos (status)")
+
+
+# -------------------- LIVRO DIÁRIO --------------------
+# livro_diario acumula, por dia, os valores que as telas financeiras somam:
+# diárias (de noites_quartos), vendas da lojinha, compras do almoxarifado e
+# custos de arrumação. Gatilhos nas tabelas de origem mantêm os totais na
+# mesma transação em que a noite ou a movimentação é gravada.
+COLUNAS_LIVRO = ("receita_quartos", "noites", "receita_vendas", "compras_almoxarifado", "custo_arrumacao")
+
+# (tabela de origem, coluna do livro, condição sobre a linha {r}, dia, valor em centavos)
+_DIA_MOVIMENTACAO = "CAST(julianday({r}.data) - 2440587.5 AS INTEGER)"
+_CENTAVOS_MOVIMENTACAO = "CAST(ROUND(COALESCE({r}.valor_total, 0) * 100) AS INTEGER)"
+LANCAMENTOS_LIVRO = [
+    ("noites_quartos", "receita_quartos", "1", "{r}.dia", "{r}.valor_centavos"),
+    ("noites_quartos", "noites", "1", "{r}.dia", "1"),
+    ("movimentacoes_estoquelj", "receita_vendas", "{r}.tipo = 'Venda'",
+     _DIA_MOVIMENTACAO, _CENTAVOS_MOVIMENTACAO),
+    ("movimentacoes_estoque", "compras_almoxarifado", "{r}.tipo = 'Entrada'",
+     _DIA_MOVIMENTACAO, _CENTAVOS_MOVIMENTACAO),
+    ("movimentacoes_estoque", "custo_arrumacao",
+     "{r}.tipo = 'Saída' AND LOWER({r}.observacao) LIKE '%arrumação%'",
+     _DIA_MOVIMENTACAO, _CENTAVOS_MOVIMENTACAO),
+    ("movimentacoes_estoquelj", "custo_arrumacao",
+     "{r}.tipo = 'Saída' AND LOWER({r}.observacao) LIKE '%arrumação%'",
+     _DIA_MOVIMENTACAO, _CENTAVOS_MOVIMENTACAO),
+]
+
+
+def _lancar_no_livro(linha, sinal, coluna, condicao, dia, valor):
+    # Soma (ou subtrai) o valor de uma linha de origem no dia correspondente
+    dia, valor, condicao = (expr.format(r=linha) for expr in (dia, valor, condicao))
+    return f"""
+            INSERT INTO livro_diario (dia, {coluna})
+            SELECT {dia}, {sinal} * ({valor}) WHERE {dia} IS NOT NULL AND {condicao}
+            ON CONFLICT(dia) DO UPDATE SET {coluna} = {coluna} + excluded.{coluna};"""
+
+
+def _criar_gatilhos_livro(cursor):
+    tabelas = dict.fromkeys(tabela for tabela, *_ in LANCAMENTOS_LIVRO)
+    for tabela in tabelas:
+        lancamentos = [lancamento for lancamento in LANCAMENTOS_LIVRO if lancamento[0] == tabela]
+        corpos = {
+            "INSERT": [_lancar_no_livro("NEW", 1, *l[1:]) for l in lancamentos],
+            "DELETE": [_lancar_no_livro("OLD", -1, *l[1:]) for l in lancamentos],
+            "UPDATE": [_lancar_no_livro("OLD", -1, *l[1:]) for l in lancamentos]
+                      + [_lancar_no_livro("NEW", 1, *l[1:]) for l in lancamentos],
+        }
+        for evento, corpo in corpos.items():
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_livro_{tabela}_{evento.lower()}
+            AFTER {evento} ON {tabela}
+            BEGIN{"".join(corpo)}
+            END
+            """)
+
+
+def reconstruir_livro_diario(conn):
+    """Apaga e soma novamente todo o livro diário a partir das tabelas de origem.
+
+    Retorna a quantidade de dias com lançamentos.
+    """
+    conn.execute("DELETE FROM livro_diario")
+    for tabela, coluna, condicao, dia, valor in LANCAMENTOS_LIVRO:
+        dia, valor, condicao = (expr.format(r=tabela) for expr in (dia, valor, condicao))
+        conn.execute(f"""
+            INSERT INTO livro_diario (dia, {coluna})
+            SELECT {dia} AS dia_lancamento, SUM({valor}) FROM {tabela}
+            WHERE {dia} IS NOT NULL AND {condicao}
+            GROUP BY dia_lancamento
+            ON CONFLICT(dia) DO UPDATE SET {coluna} = {coluna} + excluded.{coluna}
+        """)
+    return conn.execute("SELECT COUNT(*) FROM livro_diario").fetchone()[0]
+
+
+def totais_livro(conn, inicio=None, fim=None):
+    """Totais do livro diário (centavos/noites) entre dois dias, inclusive.
+
+    Sem datas soma todo o histórico. Retorna um dict com ``COLUNAS_LIVRO``.
+    """
+    filtros, parametros = [], []
+    if inicio is not None:
+        filtros.append("dia >= ?")
+        parametros.append(numero_dia(inicio))
+    if fim is not None:
+        filtros.append("dia <= ?")
+        parametros.append(numero_dia(fim))
+    somas = ", ".join(f"COALESCE(SUM({coluna}), 0)" for coluna in COLUNAS_LIVRO)
+    onde = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+    linha = conn.execute(f"SELECT {somas} FROM livro_diario {onde}", parametros).fetchone()
+    return dict(zip(COLUNAS_LIVRO, linha))
+
+
+def marca_periodo_livro(conn, inicio, fim):
+    """Marca de alteração dos dias entre ``inicio`` e ``fim`` no livro diário.
+
+    Muda sempre que algum lançamento cai dentro do período (e só nesse caso);
+    serve de chave para caches de relatórios por período.
+    """
+    return conn.execute(
+        "SELECT COALESCE(MAX(versao), 0) FROM livro_diario WHERE dia BETWEEN ? AND ?",
+        (numero_dia(inicio), numero_dia(fim))
+    ).fetchone()[0]
+
+
+def _migracao_010_livro_diario(cursor):
+    colunas = ",\n        ".join(f"{coluna} INTEGER NOT NULL DEFAULT 0" for coluna in COLUNAS_LIVRO)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS livro_diario (
+        dia INTEGER PRIMARY KEY,
+        {colunas}
+    )
+    """)
+    _criar_gatilhos_livro(cursor)
+    reconstruir_livro_diario(cursor)
+
+
+def _migracao_011_versao_dias_livro(cursor):
+    # Cada dia do livro guarda o número de sequência da última alteração
+    # (contador global em versoes_tabelas, que nunca volta, nem ao reconstruir)
+    colunas = [coluna[1] for coluna in cursor.execute("PRAGMA table_info(livro_diario)").fetchall()]
+    if "versao" not in colunas:
+        cursor.execute("ALTER TABLE livro_diario ADD COLUMN versao INTEGER NOT NULL DEFAULT 0")
+
+    valores = ", ".join(COLUNAS_LIVRO)
+    for evento in ("INSERT", f"UPDATE OF {valores}"):
+        nome = evento.split()[0].lower()
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_versao_livro_diario_{nome}
+        AFTER {evento} ON livro_diario
+        BEGIN
+            INSERT INTO versoes_tabelas (tabela, versao) VALUES ('livro_diario', 1)
+            ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1;
+            UPDATE livro_diario
+            SET versao = (SELECT versao FROM versoes_tabelas WHERE tabela = 'livro_diario')
+            WHERE dia = NEW.dia;
+        END
+        """)
+    cursor.execute("""
+        INSERT INTO versoes_tabelas (tabela, versao) VALUES ('livro_diario', 1)
+        ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1
+    """)
+    cursor.execute("UPDATE livro_diario SET versao = (SELECT versao FROM versoes_tabelas WHERE tabela = 'livro_diario')")
+
+
+# Tabelas com contador em versoes_tabelas. O livro diário já incrementa o
+# seu (migração 11); as demais recebem os gatilhos genéricos na migração 12.
+TABELAS_VERSIONADAS = frozenset({
+    "usuarios", "funcionarios", "hospedes", "quartos", "reservas", "noites_quartos",
+    "arrumacoes", "arrumacoes_itens", "comunicados", "estoque", "estoquelj",
+    "movimentacoes_estoque", "movimentacoes_estoquelj", "livro_diario",
+})
+
+
+def _migracao_012_versoes_todas_tabelas(cursor):
+    # Contadores de alteração em todas as tabelas lidas pelas telas, usados
+    # pelo cache de leituras compartilhado
+    for tabela in sorted(TABELAS_VERSIONADAS - {"livro_diario"}):
+        _criar_gatilhos_versao(cursor, tabela)
+
+
+# -------------------- BUSCA DE HÓSPEDES --------------------
+# hospedes_busca é um índice FTS5 de conteúdo externo sobre hospedes: guarda
+# só os termos (nome, CPF, documento, telefone, placa) e aponta para o id do
+# hóspede. Gatilhos mantêm o índice em dia a cada gravação em hospedes.
+
+COLUNAS_BUSCA_HOSPEDES = ("nome", "cpf", "cpf_digitos", "documento", "telefone", "placa")
+
+_TERMOS_BUSCA = re.compile(r"\w+")
+
+
+def _migracao_013_busca_hospedes(cursor):
+    colunas = ", ".join(COLUNAS_BUSCA_HOSPEDES)
+    novos = ", ".join(f"new.{coluna}" for coluna in COLUNAS_BUSCA_HOSPEDES)
+    antigos = ", ".join(f"old.{coluna}" for coluna in COLUNAS_BUSCA_HOSPEDES)
+    cursor.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS hospedes_busca USING fts5(
+        {colunas},
+        content='hospedes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+    # Em tabelas de conteúdo externo a remoção precisa dos valores antigos
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_busca_hospedes_insert AFTER INSERT ON hospedes
+    BEGIN
+        INSERT INTO hospedes_busca (rowid, {colunas}) VALUES (new.id, {novos});
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_busca_hospedes_delete AFTER DELETE ON hospedes
+    BEGIN
+        INSERT INTO hospedes_busca (hospedes_busca, rowid, {colunas}) VALUES ('delete', old.id, {antigos});
+    END
+    """)
+    cursor.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_busca_hospedes_update AFTER UPDATE ON hospedes
+    BEGIN
+        INSERT INTO hospedes_busca (hospedes_busca, rowid, {colunas}) VALUES ('delete', old.id, {antigos});
+        INSERT INTO hospedes_busca (rowid, {colunas}) VALUES (new.id, {novos});
+    END
+    """)
+    cursor.execute("INSERT INTO hospedes_busca (hospedes_busca) VALUES ('rebuild')")
+
+
+def buscar_hospedes(conn, texto, limite=10):
+    """Hóspedes que combinam com ``texto``, os mais relevantes primeiro.
+
+    Cada palavra digitada é buscada como prefixo em nome, CPF (com ou sem
+    pontuação), documento, telefone e placa; todas precisam aparecer.
+    Retorna uma lista de (id, nome, cpf).
+    """
+    termos = _TERMOS_BUSCA.findall(texto or "")
+    if not termos:
+        return []
+    consulta = " ".join(f'"{termo}"*' for termo in termos)
+    return conn.execute("""
+        SELECT h.id, h.nome, h.cpf
+        FROM hospedes_busca b
+        JOIN hospedes h ON h.id = b.rowid
+        WHERE hospedes_busca MATCH ?
+        ORDER BY b.rank
+        LIMIT ?
+    """, (consulta, limite)).fetchall()
+
+
+def _migracao_014_indice_cpf_entrada(cursor):
+    # Listagens por CPF paginadas por (data_entrada, id): o índice composto
+    # já entrega as linhas na ordem da página e substitui o de cpf_digitos
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservas_cpf_entrada ON reservas (cpf_digitos, data_entrada)")
+    cursor.execute("DROP INDEX IF EXISTS idx_reservas_cpf_digitos")
+
+
+def _migracao_015_indice_status_saida(cursor):
+    # Estadias de um status com saída numa janela de datas (comprovantes em
+    # lote): uma busca por status, cada uma limitada ao intervalo de dia_saida.
+    # Substitui o índice só de status, que é prefixo deste
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservas_status_saida ON reservas (status, dia_saida)")
+    cursor.execute("DROP INDEX IF EXISTS idx_reservas_status")
+
+
+# -------------------- RAZÃO DO ESTOQUE --------------------
+# As movimentações são o razão do estoque: só recebem INSERT e o saldo de um
+# produto é a soma das suas variações (``variacao``, coluna gerada a partir de
+# tipo e quantidade). ``quantidade`` em estoque/estoquelj é só a projeção do
+# razão, somada por gatilho na mesma transação da movimentação, e pode ser
+# refeita com ``reconstruir_saldos_estoque``. retratos_estoque guarda de tempos
+# em tempos o saldo de cada produto até uma movimentação: o saldo, atual ou em
+# qualquer data, é o último retrato mais a cauda de movimentações depois dele.
+
+# Tabela de saldo -> tabela das suas movimentações (o razão)
+MOVIMENTACOES_ESTOQUE = {
+    "estoque": "movimentacoes_estoque",
+    "estoquelj": "movimentacoes_estoquelj",
+}
+# Tipos que somam ao saldo; os demais (Saída, Venda) subtraem. "Abertura" é o
+# saldo inicial de um produto e pode ser negativa quando acerta o razão
+TIPOS_ENTRADA = ("Entrada", "Abertura")
+INTERVALO_RETRATOS = 200        # movimentações de um produto entre dois retratos
+
+_VARIACAO = "CASE WHEN tipo IN ({}) THEN quantidade ELSE -quantidade END".format(
+    ", ".join(f"'{tipo}'" for tipo in TIPOS_ENTRADA)
+)
+
+# Saldo de cada produto pelo razão: último retrato (até ``limite``) + cauda
+_SQL_SALDOS_RAZAO = """
+    SELECT p.id AS produto_id,
+           COALESCE(r.quantidade, 0) + COALESCE((
+               SELECT SUM(m.variacao) FROM {movimentacoes} m
+               WHERE m.produto_id = p.id AND m.id > COALESCE(r.movimentacao_id, 0) {limite_cauda}
+           ), 0) AS saldo
+    FROM {tabela} p
+    LEFT JOIN retratos_estoque r ON r.tabela = '{tabela}' AND r.produto_id = p.id AND r.movimentacao_id = (
+        SELECT MAX(movimentacao_id) FROM retratos_estoque
+        WHERE tabela = '{tabela}' AND produto_id = p.id {limite_retrato}
+    )
+    {filtro_produtos}
+"""
+
+
+def _saldos_razao(tabela, filtro_produtos="", data=False):
+    limite_cauda = "AND m.data <= :data" if data else ""
+    limite_retrato = "AND data <= :data" if data else ""
+    return _SQL_SALDOS_RAZAO.format(
+        tabela=tabela, movimentacoes=MOVIMENTACOES_ESTOQUE[tabela],
+        limite_cauda=limite_cauda, limite_retrato=limite_retrato, filtro_produtos=filtro_produtos,
+    )
+
+
+def saldo_estoque(conn, tabela, produto_id, data=None):
+    """Saldo do produto pelo razão, hoje ou ao fim do dia ``data``.
+
+    Usa o último retrato tirado até a data (todas as movimentações de um
+    retrato têm data menor ou igual à dele) e soma só a cauda depois dele.
+    """
+    parametros = {"produto_id": int(produto_id)}
+    if data is not None:
+        parametros["data"] = ler_data(data).isoformat()
+    linha = conn.execute(
+        _saldos_razao(tabela, "WHERE p.id = :produto_id", data is not None), parametros
+    ).fetchone()
+    return linha[1] if linha else 0
+
+
+def tirar_retratos(conn, minimo=INTERVALO_RETRATOS):
+    """Grava um retrato dos produtos com ``minimo`` movimentações desde o último.
+
+    A data do retrato é a maior data entre as movimentações que ele cobre.
+    Deve rodar numa transação de escrita. Retorna a quantidade de retratos.
+    """
+    total = 0
+    for tabela, movimentacoes in MOVIMENTACOES_ESTOQUE.items():
+        cursor = conn.execute(f"""
+            INSERT INTO retratos_estoque (tabela, produto_id, movimentacao_id, data, quantidade)
+            SELECT '{tabela}', m.produto_id, MAX(m.id), MAX(m.data), COALESCE(r.quantidade, 0) + SUM(m.variacao)
+            FROM {movimentacoes} m
+            LEFT JOIN retratos_estoque r ON r.tabela = '{tabela}' AND r.produto_id = m.produto_id
+             AND r.movimentacao_id = (
+                SELECT MAX(movimentacao_id) FROM retratos_estoque
+                WHERE tabela = '{tabela}' AND produto_id = m.produto_id
+             )
+            WHERE m.produto_id IS NOT NULL AND m.id > COALESCE(r.movimentacao_id, 0)
+            GROUP BY m.produto_id
+            HAVING COUNT(*) >= ?
+        """, (minimo,))
+        total += cursor.rowcount
+    return total
+
+
+def divergencias_estoque(conn):
+    """Produtos cuja ``quantidade`` difere do razão: [(tabela, id, quantidade, saldo)]."""
+    divergencias = []
+    for tabela in MOVIMENTACOES_ESTOQUE:
+        divergencias.extend(conn.execute(f"""
+            SELECT '{tabela}', p.id, p.quantidade, s.saldo
+            FROM {tabela} p JOIN ({_saldos_razao(tabela)}) s ON s.produto_id = p.id
+            WHERE p.quantidade IS NOT s.saldo
+        """).fetchall())
+    return divergencias
+
+
+def reconstruir_saldos_estoque(conn):
+    """Regrava ``quantidade`` de todos os produtos a partir do razão.
+
+    Retorna a quantidade de produtos corrigidos.
+    """
+    corrigidos = 0
+    for tabela in MOVIMENTACOES_ESTOQUE:
+        cursor = conn.execute(f"""
+            UPDATE {tabela} SET quantidade = s.saldo
+            FROM ({_saldos_razao(tabela)}) s
+            WHERE s.produto_id = {tabela}.id AND {tabela}.quantidade IS NOT s.saldo
+        """)
+        corrigidos += cursor.rowcount
+    return corrigidos
+
+
+def _migracao_016_razao_estoque(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS retratos_estoque (
+        tabela TEXT NOT NULL,
+        produto_id INTEGER NOT NULL,
+        movimentacao_id INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        quantidade INTEGER NOT NULL,
+        PRIMARY KEY (tabela, produto_id, movimentacao_id)
+    ) WITHOUT ROWID
+    """)
+    for tabela, movimentacoes in MOVIMENTACOES_ESTOQUE.items():
+        colunas = [coluna[1] for coluna in cursor.execute(f"PRAGMA table_xinfo({movimentacoes})").fetchall()]
+        if "variacao" not in colunas:
+            cursor.execute(f"""
+                ALTER TABLE {movimentacoes}
+                ADD COLUMN variacao INTEGER GENERATED ALWAYS AS ({_VARIACAO}) VIRTUAL
+            """)
+        # Cauda de um produto: produto_id com o id (rowid) já no fim do índice
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{movimentacoes}_produto ON {movimentacoes} (produto_id)")
+
+        # Abre o razão: a diferença entre o saldo gravado e as movimentações
+        # existentes entra como Abertura, na data da primeira movimentação
+        cursor.execute(f"""
+            INSERT INTO {movimentacoes} (produto_id, tipo, quantidade, data, hora, valor_total, observacao)
+            SELECT p.id, 'Abertura', COALESCE(p.quantidade, 0) - COALESCE(SUM(m.variacao), 0),
+                   COALESCE(MIN(m.data), date('now', 'localtime')), '00:00:00', 0, 'Saldo de abertura do razão'
+            FROM {tabela} p LEFT JOIN {movimentacoes} m ON m.produto_id = p.id
+            GROUP BY p.id
+            HAVING COALESCE(p.quantidade, 0) - COALESCE(SUM(m.variacao), 0) <> 0
+        """)
+
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_razao_{movimentacoes}_saldo
+        BEFORE INSERT ON {movimentacoes}
+        WHEN NEW.tipo NOT IN ({", ".join(f"'{tipo}'" for tipo in TIPOS_ENTRADA)})
+        BEGIN
+            SELECT RAISE(ABORT, 'saldo de estoque insuficiente')
+            WHERE COALESCE((SELECT quantidade FROM {tabela} WHERE id = NEW.produto_id), 0) < NEW.quantidade;
+        END
+        """)
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_razao_{movimentacoes}_insert
+        AFTER INSERT ON {movimentacoes}
+        BEGIN
+            UPDATE {tabela} SET quantidade = COALESCE(quantidade, 0) + NEW.variacao WHERE id = NEW.produto_id;
+        END
+        """)
+        for evento in ("UPDATE", "DELETE"):
+            cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_razao_{movimentacoes}_{evento.lower()}
+            BEFORE {evento} ON {movimentacoes}
+            BEGIN
+                SELECT RAISE(ABORT, 'o razão do estoque só aceita novas movimentações');
+            END
+            """)
+    tirar_retratos(cursor, minimo=1)
+
+
+# -------------------- CÓDIGOS DE BARRAS --------------------
+# Cada código de barras da loja pertence a um só produto (índice UNIQUE). O
+# contador "codigos_barras" em versoes_tabelas muda só quando um produto é
+# incluído, excluído ou tem o código alterado, e não a cada venda, para que o
+# índice em memória (codigos_barras.py) não seja recarregado à toa.
+
+def _migracao_017_codigos_barras(cursor):
+    # Códigos vazios viram NULL; um código repetido fica no produto mais
+    # antigo e os demais o guardam na observação, para revisão
+    cursor.execute("""
+        UPDATE estoquelj SET codigo_barras = NULLIF(TRIM(codigo_barras), '')
+        WHERE codigo_barras IS NOT NULLIF(TRIM(codigo_barras), '')
+    """)
+    cursor.execute("""
+        UPDATE estoquelj
+        SET observacao = TRIM(COALESCE(observacao, '') || ' [código de barras repetido: ' || codigo_barras || ']'),
+            codigo_barras = NULL
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, ROW_NUMBER() OVER (PARTITION BY codigo_barras ORDER BY id) AS ordem
+                FROM estoquelj WHERE codigo_barras IS NOT NULL
+            ) WHERE ordem > 1
+        )
+    """)
+    # A migração 3 criou idx_estoquelj_codigo_barras sem UNIQUE: o índice é
+    # recriado com o mesmo nome, agora único
+    cursor.execute("DROP INDEX IF EXISTS idx_estoquelj_codigo_barras")
+    cursor.execute("CREATE UNIQUE INDEX idx_estoquelj_codigo_barras ON estoquelj (codigo_barras)")
+
+    for evento in ("INSERT", "UPDATE OF codigo_barras", "DELETE"):
+        nome = evento.split()[0].lower()
+        cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_versao_codigos_barras_{nome}
+        AFTER {evento} ON estoquelj
+        BEGIN
+            INSERT INTO versoes_tabelas (tabela, versao) VALUES ('codigos_barras', 1)
+            ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1;
+        END
+        """)
+
+
+def _migracao_018_dia_checkout(cursor):
+    # Dia efetivo do check-out, gravado por encerrar_noites. Para estadias já
+    # finalizadas, as noites ainda em noites_quartos mostram onde terminaram
+    _coluna_dia_checkout(cursor)
+    cursor.execute("""
+        UPDATE reservas SET dia_checkout = (
+            SELECT MAX(n.dia) + 1 FROM noites_quartos n WHERE n.reserva_id = reservas.id
+        )
+        WHERE status = 'Finalizada' AND dia_checkout IS NULL AND dia_saida IS NOT NULL
+        AND (SELECT MAX(n.dia) + 1 FROM noites_quartos n WHERE n.reserva_id = reservas.id) < dia_saida
+    """)
+
+
+def _migracao_019_indice_cliente_quarto(cursor):
+    # CPF do cliente de uma venda no cubo de receitas: a estadia mais recente
+    # do hóspede (nome) no quarto até o dia da venda, direto pelo índice
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reservas_quarto_nome ON reservas (quarto, nome, dia_entrada)"
+    )
+
+
+# Lista ordenada de migrações: (versão, descrição, função que recebe o cursor).
+# Novas alterações de schema entram SEMPRE no final, com a próxima versão.
+# Cada passo deve ser idempotente, pois bancos anteriores ao versionamento já
+# possuem parte das tabelas.
+MIGRACOES = [
+    (1, "Tabelas iniciais", _migracao_001_tabelas_iniciais),
+    (2, "Popula os quartos 8x10", _migracao_002_popular_quartos),
+    (3, "Índices das consultas principais", _migracao_003_indices),
+    (4, "Coluna cpf_digitos em reservas e hóspedes", _migracao_004_cpf_digitos),
+    (5, "Diária em centavos e datas numéricas em reservas", _migracao_005_reservas_tipadas),
+    (6, "Versões das tabelas mantidas por gatilhos", _migracao_006_versoes_tabelas),
+    (7, "Noites dos quartos (noites_quartos)", _migracao_007_noites_quartos),
+    (8, "Versão da tabela quartos mantida por gatilhos", _migracao_008_versao_quartos),
+    (9, "Status dos quartos padronizados", _migracao_009_status_quartos),
+    (10, "Livro diário financeiro", _migracao_010_livro_diario),
+    (11, "Versão por dia no livro diário", _migracao_011_versao_dias_livro),
+    (12, "Versões de todas as tabelas mantidas por gatilhos", _migracao_012_versoes_todas_tabelas),
+    (13, "Índice de busca textual de hóspedes (FTS5)", _migracao_013_busca_hospedes),
+    (14, "Índice de reservas por CPF e data de entrada", _migracao_014_indice_cpf_entrada),
+    (15, "Índice de reservas por status e dia de saída", _migracao_015_indice_status_saida),
+    (16, "Razão do estoque com retratos periódicos", _migracao_016_razao_estoque),
+    (17, "Códigos de barras únicos na loja", _migracao_017_codigos_barras),
+    (18, "Dia efetivo do check-out em reservas", _migracao_018_dia_checkout),
+    (19, "Índice de reservas por quarto e hóspede", _migracao_019_indice_cliente_quarto),
+]
+
+VERSAO_ATUAL = MIGRACOES[-1][0]
+
+
+def versao_schema(conn):
+    """Retorna a versão gravada em ``schema_version`` (0 se não houver)."""
+    try:
+        versao = conn.execute("SELECT MAX(versao) FROM schema_version").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    return versao or 0
+
+
+def versao_tabela(conn, tabela):
+    """Contador de alterações da tabela (0 se ainda não foi alterada)."""
+    linha = conn.execute("SELECT versao FROM versoes_tabelas WHERE tabela = ?", (tabela,)).fetchone()
+    return linha[0] if linha else 0
+
+
+def aplicar_migracoes(conn):
+    """Aplica, em ordem, as migrações ainda não registradas no banco.
+
+    Cada migração roda em uma transação ``BEGIN IMMEDIATE`` e a versão é
+    conferida novamente depois de obter o lock, para que dois processos
+    iniciando juntos não apliquem o mesmo passo duas vezes.
+    Retorna a versão final do schema.
+    """
+    if versao_schema(conn) >= VERSAO_ATUAL:
+        return VERSAO_ATUAL
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        versao INTEGER PRIMARY KEY,
+        descricao TEXT,
+        aplicada_em TEXT
+    )
+    """)
+    conn.commit()
+
+    cursor = conn.cursor()
+    atual = versao_schema(conn)
+    for versao, descricao, migracao in MIGRACOES:
+        if versao <= atual:
+            continue
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            if versao_schema(conn) >= versao:
+                conn.rollback()
+                continue
+            migracao(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version (versao, descricao, aplicada_em) VALUES (?, ?, ?)",
+                (versao, descricao, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return versao_schema(conn)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações e manutenção do banco do hotel.")
+    parser.add_argument("--reconstruir-noites", action="store_true",
+                        help="refaz a tabela noites_quartos a partir de reservas")
+    parser.add_argument("--reconstruir-livro", action="store_true",
+                        help="refaz a tabela livro_diario a partir das noites e movimentações")
+    parser.add_argument("--retratos-estoque", action="store_true",
+                        help="grava retratos dos produtos com movimentações desde o último")
+    parser.add_argument("--reconstruir-estoque", action="store_true",
+                        help="refaz as quantidades do estoque e da loja a partir do razão")
+    parser.add_argument("--divergencias-estoque", action="store_true",
+                        help="lista os produtos cuja quantidade difere do razão (sai com código 1 se houver)")
+    parser.add_argument("--saldo-estoque", nargs=2, metavar=("TABELA", "ID"),
+                        help="saldo de um produto pelo razão (tabela estoque ou estoquelj)")
+    parser.add_argument("--data", help="com --saldo-estoque: saldo ao fim deste dia (AAAA-MM-DD)")
+    args = parser.parse_args()
+    if args.saldo_estoque and args.saldo_estoque[0] not in MOVIMENTACOES_ESTOQUE:
+        parser.error(f"tabela deve ser uma de: {', '.join(MOVIMENTACOES_ESTOQUE)}")
+
+    conexao = abrir_conexao(CAMINHO_BANCO)
+    print(f"Schema do banco {CAMINHO_BANCO} na versão {aplicar_migracoes(conexao)}.")
+    if args.reconstruir_noites:
+        conexao.execute("BEGIN IMMEDIATE")
+        noites = reconstruir_noites(conexao)
+        conexao.commit()
+        print(f"{noites} noites geradas em noites_quartos.")
+    if args.reconstruir_livro:
+        conexao.execute("BEGIN IMMEDIATE")
+        dias = reconstruir_livro_diario(conexao)
+        conexao.commit()
+        print(f"{dias} dias lançados em livro_diario.")
+    if args.retratos_estoque:
+        conexao.execute("BEGIN IMMEDIATE")
+        retratos = tirar_retratos(conexao, minimo=1)
+        conexao.commit()
+        print(f"{retratos} retratos gravados em retratos_estoque.")
+    if args.reconstruir_estoque:
+        conexao.execute("BEGIN IMMEDIATE")
+        corrigidos = reconstruir_saldos_estoque(conexao)
+        conexao.commit()
+        print(f"{corrigidos} produtos corrigidos a partir do razão.")
+    divergencias = []
+    if args.divergencias_estoque:
+        conexao.execute("BEGIN")  # quantidades e razão lidos do mesmo instante
+        divergencias = divergencias_estoque(conexao)
+        conexao.commit()
+        for tabela, produto_id, quantidade, saldo in divergencias:
+            print(f"{tabela} #{produto_id}: quantidade {quantidade}, razão {saldo}")
+        print(f"{len(divergencias)} produto(s) com quantidade diferente do razão.")
+    if args.saldo_estoque:
+        tabela, produto_id = args.saldo_estoque
+        saldo = saldo_estoque(conexao, tabela, produto_id, args.data)
+        print(f"Saldo de {tabela} #{produto_id} pelo razão{f' em {args.data}' if args.data else ''}: {saldo}")
+    conexao.close()
+    if divergencias:
+        raise SystemExit(1)
@@ -0,0 +1,80 @@
+"""Cache de leituras compartilhado entre as sessões do app.
+
+``CacheLeituras`` guarda o resultado de cada consulta (texto SQL +
+parâmetros) junto com as versões das tabelas que ela lê, tiradas de
+``versoes_tabelas`` (contadores mantidos por gatilhos em todas as tabelas
+de ``banco.TABELAS_VERSIONADAS``). Uma gravação em qualquer sessão
+incrementa o contador da tabela; na próxima leitura a entrada fica velha e
+a consulta roda de novo. Enquanto nada muda, as reexecuções do script são
+atendidas da memória.
+
+Consultas feitas dentro de uma transação aberta, ou que leem tabelas sem
+contador, vão direto ao banco.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from banco import TABELAS_VERSIONADAS
+
+_TABELAS_SQL = re.compile(r"\b(?:FROM|JOIN)\s+(\w+)", re.IGNORECASE)
+
+
+class CacheLeituras:
+    def __init__(self, max_itens=512):
+        self._trava = threading.Lock()
+        self._itens = OrderedDict()
+        self._tabelas = {}
+        self.max_itens = max_itens
+        self.acertos = 0
+        self.faltas = 0
+
+    def _tabelas_da_consulta(self, sql):
+        tabelas = self._tabelas.get(sql)
+        if tabelas is None:
+            tabelas = self._tabelas[sql] = frozenset(_TABELAS_SQL.findall(sql))
+        return tabelas
+
+    def _ler(self, conn, tipo, sql, parametros, executar):
+        tabelas = self._tabelas_da_consulta(sql)
+        if conn.in_transaction or not tabelas or not tabelas <= TABELAS_VERSIONADAS:
+            return executar()
+
+        # Versões lidas ANTES da consulta: se algo for gravado no meio, a
+        # entrada apenas nasce velha e é refeita na próxima leitura
+        atuais = dict(conn.execute("SELECT tabela, versao FROM versoes_tabelas").fetchall())
+        versoes = tuple(atuais.get(tabela, 0) for tabela in sorted(tabelas))
+        chave = (tipo, sql, tuple(parametros))
+
+        with self._trava:
+            item = self._itens.get(chave)
+            if item is not None and item[0] == versoes:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return item[1]
+
+        resultado = executar()
+        with self._trava:
+            self.faltas += 1
+            self._itens[chave] = (versoes, resultado)
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+        return resultado
+
+    def consultar(self, conn, sql, parametros=()):
+        """Linhas da consulta (lista de tuplas), do cache quando ainda válidas."""
+        linhas = self._ler(conn, "linhas", sql, parametros, lambda: conn.execute(sql, parametros).fetchall())
+        return list(linhas)
+
+    def consultar_df(self, conn, sql, parametros=()):
+        """Como ``consultar``, mas devolve um DataFrame (cópia, pode ser alterada)."""
+        df = self._ler(conn, "df", sql, parametros,
+                       lambda: pd.read_sql_query(sql, conn, params=tuple(parametros)))
+        return df.copy()
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
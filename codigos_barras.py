@@ -0,0 +1,97 @@
+"""Índice em memória dos códigos de barras da loja (``estoquelj``).
+
+``IndiceCodigosBarras`` é um dicionário código -> id do produto compartilhado
+entre as sessões: a leitura de um código no caixa é uma consulta a esse
+dicionário, sem ir ao banco. No banco, o índice UNIQUE
+``idx_estoquelj_codigo_barras`` garante que cada código é de um só produto.
+
+Como ``MapaDisponibilidade``, o índice guarda a versão ``codigos_barras``
+(``versoes_tabelas``) que reflete. Essa versão é incrementada por gatilhos
+quando um produto é incluído, excluído ou tem o código alterado. As telas
+que cadastram produtos atualizam o índice por ``alterando_codigos``; se
+outro processo alterar os códigos a versão muda e o índice é recarregado.
+"""
+import threading
+from contextlib import contextmanager
+
+from banco import versao_tabela
+
+
+class IndiceCodigosBarras:
+    def __init__(self):
+        self._trava = threading.Lock()
+        self.versao = None
+        self._produtos = {}
+
+    def __len__(self):
+        return len(self._produtos)
+
+    def carregar(self, conn):
+        """Remonta o índice a partir dos códigos gravados em ``estoquelj``."""
+        iniciou = not conn.in_transaction
+        if iniciou:
+            conn.execute("BEGIN")  # leitura consistente da versão e dos códigos
+        try:
+            versao = versao_tabela(conn, "codigos_barras")
+            produtos = dict(conn.execute(
+                "SELECT codigo_barras, id FROM estoquelj WHERE codigo_barras IS NOT NULL"
+            ).fetchall())
+        finally:
+            if iniciou:
+                conn.commit()
+
+        with self._trava:
+            self._produtos = produtos
+            self.versao = versao
+
+    def sincronizar(self, conn):
+        """Recarrega o índice se os códigos mudaram fora das alterações registradas."""
+        if versao_tabela(conn, "codigos_barras") != self.versao:
+            self.carregar(conn)
+        return self
+
+    def produto(self, codigo):
+        """Id do produto com o código de barras, ou None."""
+        return self._produtos.get(str(codigo).strip())
+
+    def aplicar(self, versao_antes, versao_depois, alteracoes):
+        """Aplica alterações já gravadas no banco.
+
+        ``alteracoes`` é uma lista de (código antigo, código novo, id do
+        produto), com None no código ausente (produto novo ou excluído). Se o
+        índice não estava na versão anterior à transação ele é marcado para
+        recarga.
+        """
+        with self._trava:
+            if self.versao != versao_antes:
+                self.versao = None
+                return
+            for antigo, novo, produto_id in alteracoes:
+                if antigo is not None and self._produtos.get(antigo) == produto_id:
+                    del self._produtos[antigo]
+                if novo is not None:
+                    self._produtos[novo] = produto_id
+            self.versao = versao_depois
+
+    @contextmanager
+    def alterando_codigos(self, conn):
+        """Transação de escrita em ``estoquelj`` que atualiza o índice ao confirmar.
+
+        Uso::
+
+            with indice.alterando_codigos(conn) as alteracoes:
+                cursor.execute("INSERT INTO estoquelj ...")
+                alteracoes.append((None, codigo_barras, cursor.lastrowid))
+        """
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        versao_antes = versao_tabela(conn, "codigos_barras")
+        alteracoes = []
+        try:
+            yield alteracoes
+            versao_depois = versao_tabela(conn, "codigos_barras")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        self.aplicar(versao_antes, versao_depois, alteracoes)
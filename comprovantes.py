@@ -0,0 +1,153 @@
+"""Comprovantes de estadia em PDF.
+
+``pdf_comprovante`` monta o PDF (QR Code + ReportLab) a partir de um
+dicionário só com valores simples, sem tocar no banco nem no Streamlit, e
+devolve os bytes. ``assinatura_estadia`` é o hash do conteúdo da estadia:
+junto com o código de autenticação forma a chave do cache de comprovantes,
+de modo que uma alteração na reserva (datas, quarto, diária) gera um PDF
+novo mesmo quando o código continua igual.
+
+Para os picos de check-out, ``gerar_lote`` renderiza vários comprovantes em
+paralelo num ``ProcessPoolExecutor`` (o ReportLab é Python puro e não sai
+do GIL em threads), medindo o tempo de cada documento; ``zip_comprovantes``
+e ``juntar_pdfs`` juntam o lote num único arquivo (ZIP ou PDF de várias
+páginas), sem renderizar nada de novo.
+"""
+import hashlib
+import io
+import json
+import time
+import zipfile
+from concurrent.futures import as_completed
+from datetime import date, timedelta
+
+import qrcode
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Image, Paragraph, SimpleDocTemplate, Spacer
+
+URL_VERIFICACAO = "https://meuhotel.com/comprovante/{codigo}"
+
+# Campos de ``dados`` usados no comprovante
+CAMPOS_COMPROVANTE = (
+    "nome", "cpf", "quarto", "entrada", "saida", "dias", "valor_diaria", "valor_total", "codigo_autenticacao",
+)
+
+
+def dados_comprovante(nome, cpf, quarto, dia_entrada, dia_saida, valor_centavos):
+    """Campos do comprovante a partir das colunas tipadas de ``reservas``.
+
+    ``cpf`` só com dígitos; dias contados desde 1970-01-01.
+    """
+    entrada = date(1970, 1, 1) + timedelta(days=int(dia_entrada))
+    saida = date(1970, 1, 1) + timedelta(days=int(dia_saida))
+    dias = max(int(dia_saida) - int(dia_entrada), 1)
+    valor_diaria = int(valor_centavos or 0) / 100
+    return {
+        "nome": nome,
+        "cpf": cpf,
+        "quarto": quarto,
+        "entrada": entrada.strftime('%d/%m/%Y'),
+        "saida": saida.strftime('%d/%m/%Y'),
+        "dias": dias,
+        "valor_diaria": valor_diaria,
+        "valor_total": dias * valor_diaria,
+        "codigo_autenticacao": f"HTL-{cpf[-4:]}-{entrada.strftime('%d%m')}{saida.strftime('%d%m')}",
+    }
+
+
+def assinatura_estadia(dados):
+    """Hash (SHA-256, hexadecimal) dos campos do comprovante."""
+    conteudo = json.dumps([dados[campo] for campo in CAMPOS_COMPROVANTE], default=str, ensure_ascii=False)
+    return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+
+def _conteudo_comprovante(dados, emitido_em, styles):
+    # Flowables de uma página de comprovante
+    qr_img = qrcode.make(URL_VERIFICACAO.format(codigo=dados["codigo_autenticacao"]))
+    qr_buffer = io.BytesIO()
+    qr_img.save(qr_buffer)
+    qr_buffer.seek(0)
+    dias = dados["dias"]
+
+    return [
+        Paragraph("🏨 Hotel Pousada do Sol", styles['Title']),
+        Spacer(1, 12),
+        Paragraph("📑 COMPROVANTE DE ESTADIA", styles['Heading2']),
+        Spacer(1, 20),
+        Paragraph(f"<b>Nome do Hóspede:</b> {dados['nome']}", styles['Normal']),
+        Paragraph(f"<b>CPF:</b> {dados['cpf']}", styles['Normal']),
+        Paragraph(f"<b>Quarto:</b> {dados['quarto']}", styles['Normal']),
+        Paragraph(f"<b>Check-in:</b> {dados['entrada']}", styles['Normal']),
+        Paragraph(f"<b>Check-out:</b> {dados['saida']}", styles['Normal']),
+        Paragraph(f"<b>Duração:</b> {dias} {'dia' if dias == 1 else 'dias'}", styles['Normal']),
+        Paragraph(f"<b>Valor da Diária:</b> R$ {dados['valor_diaria']:.2f}", styles['Normal']),
+        Paragraph(f"<b>Valor Total:</b> R$ {dados['valor_total']:.2f}", styles['Normal']),
+        Paragraph(f"<b>Código de Autenticação:</b> {dados['codigo_autenticacao']}", styles['Normal']),
+        Spacer(1, 12),
+        Paragraph(f"📅 Emitido em: {emitido_em}", styles['Italic']),
+        Spacer(1, 20),
+        Paragraph("Este documento confirma a estadia conforme os dados acima. Emitido automaticamente pelo sistema de hotelaria.", styles['Normal']),
+        Spacer(1, 20),
+        Paragraph("___________________________", styles['Normal']),
+        Paragraph("Assinatura do Responsável", styles['Normal']),
+        Spacer(1, 20),
+        Image(qr_buffer, 1.5 * inch, 1.5 * inch),
+        Paragraph("🔍 Verificação online disponível via QR Code", styles['Italic'])
+    ]
+
+
+def pdf_comprovante(dados, emitido_em):
+    """Bytes do PDF do comprovante de estadia.
+
+    ``dados`` tem os campos de ``CAMPOS_COMPROVANTE``; datas já formatadas
+    (dd/mm/aaaa) e valores em reais.
+    """
+    buffer = io.BytesIO()
+    SimpleDocTemplate(buffer, pagesize=A4).build(_conteudo_comprovante(dados, emitido_em, getSampleStyleSheet()))
+    return buffer.getvalue()
+
+
+# -------------------- LOTES --------------------
+def _renderizar(dados, emitido_em):
+    # Executado nos processos do pool: PDF e tempo gasto nele
+    inicio = time.perf_counter()
+    pdf = pdf_comprovante(dados, emitido_em)
+    return pdf, time.perf_counter() - inicio
+
+
+def gerar_lote(executor, lista_dados, emitido_em, progresso=None):
+    """Renderiza os comprovantes em paralelo no ``executor``, uma tarefa por documento.
+
+    Retorna [(pdf, segundos)] na ordem de ``lista_dados``; ``progresso(feitos)``
+    é chamado a cada documento concluído, na ordem em que terminam.
+    """
+    futuros = {executor.submit(_renderizar, dados, emitido_em): i for i, dados in enumerate(lista_dados)}
+    resultados = [None] * len(lista_dados)
+    for feitos, futuro in enumerate(as_completed(futuros), 1):
+        resultados[futuros[futuro]] = futuro.result()
+        if progresso:
+            progresso(feitos)
+    return resultados
+
+
+def juntar_pdfs(pdfs):
+    """Bytes de um único PDF com as páginas dos ``pdfs``, na ordem da lista."""
+    from pypdf import PdfReader, PdfWriter
+
+    escritor = PdfWriter()
+    for pdf in pdfs:
+        escritor.append(PdfReader(io.BytesIO(pdf)))
+    buffer = io.BytesIO()
+    escritor.write(buffer)
+    return buffer.getvalue()
+
+
+def zip_comprovantes(lista_dados, pdfs):
+    """Bytes de um ZIP com um PDF por comprovante, numerados na ordem do lote."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as arquivo:
+        for numero, (dados, pdf) in enumerate(zip(lista_dados, pdfs), 1):
+            arquivo.writestr(f"{numero:03d}_comprovante_{dados['codigo_autenticacao']}.pdf", pdf)
+    return buffer.getvalue()
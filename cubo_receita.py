@@ -0,0 +1,336 @@
+"""Cubo de receitas e custos para análises (dia x quarto x hóspede x categoria).
+
+``CuboReceita`` guarda em arrays NumPy, já agregados, os lançamentos que
+alimentam o livro diário: diárias (``noites_quartos``), vendas da lojinha,
+compras do almoxarifado e custos de arrumação. Cada linha do cubo é uma
+combinação (dia, quarto, hóspede, categoria, produto, conta) com o valor em
+centavos, a quantidade (noites ou itens) e as estadias iniciadas no dia.
+Quartos, hóspedes, categorias e produtos ficam codificados como inteiros.
+O hóspede é identificado pelo CPF (``cpf_digitos``) e o nome só serve de
+rótulo; vendas da lojinha chegam ao CPF pela estadia do cliente no quarto
+ou, sem ela, pelo cadastro de hóspedes. Como essa resolução depende de
+``reservas`` e ``hospedes``, as vendas são relidas por inteiro quando a
+versão de uma dessas tabelas muda.
+
+Fatiar e agrupar é feito só com máscaras e ``np.bincount``, sem consultar o
+banco. A atualização é incremental: cada dia do ``livro_diario`` tem a
+marca da sua última alteração e apenas os dias com marca maior que a
+última vista pelo cubo são recarregados.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+from banco import numero_dia, versao_tabela
+from disponibilidade import andar_do_quarto
+
+CONTAS = ("receita_quartos", "receita_vendas", "compras_almoxarifado", "custo_arrumacao")
+CONTAS_RECEITA = ("receita_quartos", "receita_vendas")
+
+DIMENSOES = ("dia", "dia_semana", "andar", "quarto", "hospede", "categoria", "produto", "conta")
+
+# Acima disso é mais rápido recarregar tudo do que filtrar os dias alterados
+LIMITE_DIAS_INCREMENTAIS = 500
+
+_DIA_MOVIMENTACAO = "CAST(julianday(m.data) - 2440587.5 AS INTEGER)"
+_QUARTO_ARRUMACAO = ("CASE WHEN instr(m.observacao, 'quarto ') > 0 "
+                     "THEN trim(substr(m.observacao, instr(m.observacao, 'quarto ') + 7)) ELSE '' END")
+
+# CPF do cliente de uma venda: a estadia mais recente dele no quarto iniciada
+# até o dia da venda; sem ela, o cadastro de hóspedes com o mesmo nome. Só
+# depende de dia, quarto e cliente, que já estão no GROUP BY das vendas
+_CPF_CLIENTE = f"""COALESCE(
+        (SELECT r.cpf_digitos FROM reservas r
+         WHERE r.quarto = m.quarto AND r.nome = m.cliente AND r.cpf_digitos <> ''
+           AND r.dia_entrada <= {_DIA_MOVIMENTACAO}
+         ORDER BY r.dia_entrada DESC LIMIT 1),
+        (SELECT h.cpf_digitos FROM hospedes h
+         WHERE h.nome = m.cliente AND h.cpf_digitos <> '' LIMIT 1),
+        '')"""
+
+# Tabelas de que depende o CPF das vendas (_CPF_CLIENTE)
+TABELAS_CLIENTES = ("reservas", "hospedes")
+
+# Vendas da lojinha, com o cliente resolvido para CPF
+FONTE_VENDAS = f"""
+    SELECT {_DIA_MOVIMENTACAO} AS dia, COALESCE(m.quarto, ''), {_CPF_CLIENTE},
+           COALESCE(m.cliente, ''), COALESCE(p.categoria, ''), COALESCE(p.nome, ''), 'receita_vendas',
+           SUM(CAST(ROUND(COALESCE(m.valor_total, 0) * 100) AS INTEGER)), SUM(m.quantidade), 0
+    FROM movimentacoes_estoquelj m
+    LEFT JOIN estoquelj p ON p.id = m.produto_id
+    WHERE m.tipo = 'Venda' {{filtro_datas}}
+    GROUP BY dia, m.quarto, m.cliente, p.categoria, p.nome
+    """
+
+# Consultas de origem; {filtro_noites} e {filtro_datas} recebem o recorte de dias.
+# Colunas: dia, quarto, CPF do hóspede, nome do hóspede, categoria, produto, conta,
+# valor, quantidade, estadias
+FONTES = [
+    """
+    SELECT n.dia, n.quarto, COALESCE(r.cpf_digitos, ''), COALESCE(r.nome, ''), 'Hospedagem', 'Diária',
+           'receita_quartos', SUM(n.valor_centavos), COUNT(*), SUM(n.dia = r.dia_entrada)
+    FROM noites_quartos n
+    JOIN reservas r ON r.id = n.reserva_id
+    WHERE 1 = 1 {filtro_noites}
+    GROUP BY n.dia, n.quarto, r.cpf_digitos, r.nome
+    """,
+    FONTE_VENDAS,
+    f"""
+    SELECT {_DIA_MOVIMENTACAO} AS dia, '', '', '', COALESCE(p.categoria, ''), COALESCE(p.nome, ''),
+           'compras_almoxarifado',
+           SUM(CAST(ROUND(COALESCE(m.valor_total, 0) * 100) AS INTEGER)), SUM(m.quantidade), 0
+    FROM movimentacoes_estoque m
+    LEFT JOIN estoque p ON p.id = m.produto_id
+    WHERE m.tipo = 'Entrada' {{filtro_datas}}
+    GROUP BY dia, p.categoria, p.nome
+    """,
+    f"""
+    SELECT {_DIA_MOVIMENTACAO} AS dia, {_QUARTO_ARRUMACAO} AS quarto_arrumacao, '', '',
+           COALESCE(p.categoria, ''), COALESCE(p.nome, ''), 'custo_arrumacao',
+           SUM(CAST(ROUND(COALESCE(m.valor_total, 0) * 100) AS INTEGER)), SUM(m.quantidade), 0
+    FROM movimentacoes_estoque m
+    LEFT JOIN estoque p ON p.id = m.produto_id
+    WHERE m.tipo = 'Saída' AND LOWER(m.observacao) LIKE '%arrumação%' {{filtro_datas}}
+    GROUP BY dia, quarto_arrumacao, p.categoria, p.nome
+    """,
+    f"""
+    SELECT {_DIA_MOVIMENTACAO} AS dia, COALESCE(m.quarto, ''), '', '', COALESCE(p.categoria, ''),
+           COALESCE(p.nome, ''), 'custo_arrumacao',
+           SUM(CAST(ROUND(COALESCE(m.valor_total, 0) * 100) AS INTEGER)), SUM(m.quantidade), 0
+    FROM movimentacoes_estoquelj m
+    LEFT JOIN estoquelj p ON p.id = m.produto_id
+    WHERE m.tipo = 'Saída' AND LOWER(m.observacao) LIKE '%arrumação%' {{filtro_datas}}
+    GROUP BY dia, m.quarto, p.categoria, p.nome
+    """,
+]
+
+
+class _Dicionario:
+    # Codifica textos de uma dimensão como inteiros estáveis (0, 1, 2...)
+    def __init__(self):
+        self.valores = []
+        self._codigos = {}
+
+    def codificar(self, textos):
+        codigos = np.empty(len(textos), dtype=np.int32)
+        for i, texto in enumerate(textos):
+            codigo = self._codigos.get(texto)
+            if codigo is None:
+                codigo = self._codigos[texto] = len(self.valores)
+                self.valores.append(texto)
+            codigos[i] = codigo
+        return codigos
+
+    def codigo(self, texto):
+        return self._codigos.get(texto)
+
+
+class CuboReceita:
+    def __init__(self):
+        self._trava = threading.RLock()
+        self.marca = None
+        self.versoes_clientes = None
+        self._dicionarios = {nome: _Dicionario() for nome in ("quarto", "hospede", "categoria", "produto")}
+        self._nomes_hospedes = {}  # CPF -> último nome visto, só para rótulo
+        self._colunas = self._vazio()
+
+    @staticmethod
+    def _vazio():
+        return {
+            "dia": np.zeros(0, dtype=np.int32),
+            "quarto": np.zeros(0, dtype=np.int32),
+            "hospede": np.zeros(0, dtype=np.int32),
+            "categoria": np.zeros(0, dtype=np.int32),
+            "produto": np.zeros(0, dtype=np.int32),
+            "conta": np.zeros(0, dtype=np.int8),
+            "valor": np.zeros(0, dtype=np.int64),
+            "quantidade": np.zeros(0, dtype=np.int64),
+            "estadias": np.zeros(0, dtype=np.int32),
+        }
+
+    def __len__(self):
+        return len(self._colunas["dia"])
+
+    # -------------------- CARGA --------------------
+    def _ler_fontes(self, conn, dias=None, fontes=FONTES):
+        # Lê as consultas de origem (todos os dias ou só os indicados) em colunas
+        if dias is None:
+            filtro_noites = filtro_datas = ""
+            parametros_noites = parametros_datas = []
+        else:
+            marcadores = ", ".join("?" * len(dias))
+            filtro_noites = f"AND n.dia IN ({marcadores})"
+            filtro_datas = f"AND m.data IN ({marcadores})"
+            parametros_noites = list(dias)
+            datas = pd.to_datetime(np.asarray(dias, dtype=np.int64), unit="D")
+            parametros_datas = datas.strftime("%Y-%m-%d").tolist()
+
+        linhas = []
+        for fonte in fontes:
+            eh_noites = "{filtro_noites}" in fonte
+            sql = fonte.format(filtro_noites=filtro_noites, filtro_datas=filtro_datas)
+            linhas.extend(conn.execute(sql, parametros_noites if eh_noites else parametros_datas).fetchall())
+        linhas = [linha for linha in linhas if linha[0] is not None]
+
+        colunas = self._vazio()
+        if not linhas:
+            return colunas
+        dia, quarto, hospede, nome_hospede, categoria, produto, conta, valor, quantidade, estadias = zip(*linhas)
+        colunas["dia"] = np.array(dia, dtype=np.int32)
+        for cpf, nome in zip(hospede, nome_hospede):
+            if cpf and nome:
+                self._nomes_hospedes[cpf] = nome
+        for nome, textos in (("quarto", quarto), ("hospede", hospede), ("categoria", categoria), ("produto", produto)):
+            colunas[nome] = self._dicionarios[nome].codificar([str(texto or "") for texto in textos])
+        colunas["conta"] = np.array([CONTAS.index(c) for c in conta], dtype=np.int8)
+        colunas["valor"] = np.array([v or 0 for v in valor], dtype=np.int64)
+        colunas["quantidade"] = np.array([q or 0 for q in quantidade], dtype=np.int64)
+        colunas["estadias"] = np.array([e or 0 for e in estadias], dtype=np.int32)
+        return colunas
+
+    def atualizar(self, conn):
+        """Recarrega os dias alterados desde a última atualização (ou tudo, na primeira vez).
+
+        Se ``reservas`` ou ``hospedes`` mudaram, as vendas de todos os dias
+        são relidas para o CPF dos clientes ser resolvido de novo.
+        """
+        with self._trava:
+            iniciou = not conn.in_transaction
+            if iniciou:
+                conn.execute("BEGIN")  # marca e lançamentos lidos do mesmo instante
+            try:
+                marca = conn.execute("SELECT COALESCE(MAX(versao), 0) FROM livro_diario").fetchone()[0]
+                versoes_clientes = tuple(versao_tabela(conn, tabela) for tabela in TABELAS_CLIENTES)
+                if marca == self.marca and versoes_clientes == self.versoes_clientes:
+                    return self
+                dias = None
+                if self.marca is not None:
+                    dias = [linha[0] for linha in conn.execute(
+                        "SELECT dia FROM livro_diario WHERE versao > ?", (self.marca,)
+                    ).fetchall()]
+                    if len(dias) > LIMITE_DIAS_INCREMENTAIS:
+                        dias = None
+                novas = self._ler_fontes(conn, dias)
+                vendas = None
+                if dias is not None and versoes_clientes != self.versoes_clientes:
+                    vendas = self._ler_fontes(conn, fontes=[FONTE_VENDAS])
+            finally:
+                if iniciou:
+                    conn.commit()
+
+            if dias is None:
+                self._colunas = novas
+            else:
+                manter = ~np.isin(self._colunas["dia"], np.asarray(dias, dtype=np.int32))
+                self._colunas = _juntar(self._colunas, manter, novas)
+            if vendas is not None:
+                manter = self._colunas["conta"] != CONTAS.index("receita_vendas")
+                self._colunas = _juntar(self._colunas, manter, vendas)
+            self.marca = marca
+            self.versoes_clientes = versoes_clientes
+            return self
+
+    # -------------------- CONSULTAS --------------------
+    def _dimensao(self, nome):
+        # Códigos (e rótulos) de uma dimensão, inclusive as derivadas
+        c = self._colunas
+        if nome == "dia_semana":
+            return (c["dia"].astype(np.int64) + 3) % 7, ["Segunda", "Terça", "Quarta", "Quinta", "Sexta", "Sábado", "Domingo"]
+        if nome == "andar":
+            andares = np.array([andar_do_quarto(q) or 0 for q in self._dicionarios["quarto"].valores], dtype=np.int32)
+            codigos = andares[c["quarto"]] if len(andares) else np.zeros(0, dtype=np.int32)
+            return codigos, [f"Andar {a}" if a else "Sem andar" for a in range(int(andares.max(initial=0)) + 1)]
+        if nome == "conta":
+            return c["conta"].astype(np.int64), list(CONTAS)
+        if nome == "dia":
+            return c["dia"], None
+        if nome == "hospede":
+            # Rótulo com o nome e o CPF: dois hóspedes homônimos continuam distintos
+            return c["hospede"], [
+                f"{self._nomes_hospedes.get(cpf, '')} — CPF {cpf}" if cpf else ""
+                for cpf in self._dicionarios["hospede"].valores
+            ]
+        return c[nome], self._dicionarios[nome].valores
+
+    def _mascara(self, inicio=None, fim=None, contas=None, recorrentes=False, **filtros):
+        c = self._colunas
+        mascara = np.ones(len(c["dia"]), dtype=bool)
+        if inicio is not None:
+            mascara &= c["dia"] >= _dia(inicio)
+        if fim is not None:
+            mascara &= c["dia"] <= _dia(fim)
+        if contas is not None:
+            # Lista vazia: nenhuma conta escolhida, nenhuma linha
+            mascara &= np.isin(c["conta"], [CONTAS.index(conta) for conta in contas])
+        for nome, valores in filtros.items():
+            if valores:
+                codigos, rotulos = self._dimensao(nome)
+                if rotulos is not None:
+                    valores = [rotulos.index(v) for v in valores if v in rotulos]
+                mascara &= np.isin(codigos, valores)
+        if recorrentes:
+            # Hóspedes (por CPF) com mais de uma estadia iniciada em todo o histórico
+            estadias = np.bincount(c["hospede"], weights=c["estadias"], minlength=len(self._dicionarios["hospede"].valores))
+            sem_cpf = self._dicionarios["hospede"].codigo("")
+            if sem_cpf is not None:
+                estadias[sem_cpf] = 0
+            mascara &= estadias[c["hospede"]] > 1
+        return mascara
+
+    def agrupar(self, por, inicio=None, fim=None, contas=None, recorrentes=False, **filtros):
+        """Soma valor (em reais), quantidade e estadias por uma dimensão.
+
+        ``por`` é um nome de ``DIMENSOES``; ``filtros`` recebe listas de rótulos
+        por dimensão (ex.: ``categoria=["Bebidas"]``). Linhas com valor e
+        quantidade zerados são omitidas.
+        """
+        with self._trava:
+            mascara = self._mascara(inicio, fim, contas, recorrentes, **filtros)
+            codigos, rotulos = self._dimensao(por)
+            codigos = codigos[mascara]
+            c = self._colunas
+            if rotulos is None:
+                chaves, codigos = np.unique(codigos, return_inverse=True)
+                rotulos = pd.to_datetime(chaves.astype(np.int64), unit="D").date.tolist()
+            tamanho = len(rotulos)
+            df = pd.DataFrame({
+                por: rotulos,
+                "valor": np.bincount(codigos, weights=c["valor"][mascara], minlength=tamanho) / 100,
+                "quantidade": np.bincount(codigos, weights=c["quantidade"][mascara], minlength=tamanho).astype(np.int64),
+                "estadias": np.bincount(codigos, weights=c["estadias"][mascara], minlength=tamanho).astype(np.int64),
+            })
+        return df[(df["valor"] != 0) | (df["quantidade"] != 0)].reset_index(drop=True)
+
+    def totais(self, inicio=None, fim=None):
+        """Totais por conta (em centavos) no período, mais noites vendidas."""
+        with self._trava:
+            mascara = self._mascara(inicio, fim)
+            c = self._colunas
+            contas = c["conta"][mascara]
+            valores = np.bincount(contas, weights=c["valor"][mascara], minlength=len(CONTAS))
+            noites = c["quantidade"][mascara][contas == CONTAS.index("receita_quartos")].sum()
+        totais = {conta: int(round(valor)) for conta, valor in zip(CONTAS, valores)}
+        totais["noites"] = int(noites)
+        return totais
+
+    def contar_distintos(self, dimensao, inicio=None, fim=None, contas=None):
+        with self._trava:
+            mascara = self._mascara(inicio, fim, contas)
+            codigos, rotulos = self._dimensao(dimensao)
+            codigos = np.unique(codigos[mascara])
+            if rotulos is not None:
+                codigos = [codigo for codigo in codigos if rotulos[codigo] != ""]
+            return len(codigos)
+
+
+def _juntar(colunas, manter, novas):
+    # Linhas de ``colunas`` selecionadas por ``manter`` seguidas de ``novas``
+    return {nome: np.concatenate([coluna[manter], novas[nome]]) for nome, coluna in colunas.items()}
+
+
+def _dia(valor):
+    # Número do dia (desde 1970-01-01) de uma data ou de um número já convertido
+    if isinstance(valor, (int, np.integer)):
+        return int(valor)
+    return numero_dia(valor)
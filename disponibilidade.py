@@ -0,0 +1,239 @@
+"""Disponibilidade dos quartos por período.
+
+``MapaDisponibilidade`` guarda, para cada quarto, quantas reservas ativas
+ocupam cada noite: uma matriz NumPy quartos x noites. Saber se um quarto
+(ou todos os quartos) está livre entre duas datas é uma fatia dessa matriz,
+sem consultar o banco.
+
+O mapa é montado a partir de ``reservas`` e mantido incrementalmente pelas
+telas que alteram reservas, por meio de ``alterando_reservas``. Ele guarda a
+versão da tabela (``versoes_tabelas``, atualizada por gatilhos) que reflete;
+se outro processo alterar reservas a versão muda e o mapa é recarregado.
+
+A consulta feita ao montar a tela é só indicativa: dentro de
+``alterando_reservas``, já com o lock de escrita, ``garantir_livre``
+sincroniza o mapa e confere o quarto de novo antes da gravação.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+
+from banco import numero_dia, versao_tabela
+
+# Noites mantidas além da última reserva conhecida (e antes da primeira)
+MARGEM_DIAS = 400
+
+
+class QuartoOcupado(ValueError):
+    def __init__(self, quarto):
+        self.quarto = quarto
+        super().__init__(f"O quarto {quarto} já está reservado no período.")
+
+
+class QuartoIndisponivel(ValueError):
+    def __init__(self, status):
+        self.status = status
+        super().__init__(f"O quarto está atualmente com status: {status}.")
+
+
+def _intervalo(entrada, saida):
+    # Noites ocupadas por uma estadia: [entrada, saída); no mínimo uma noite
+    inicio = entrada if isinstance(entrada, (int, np.integer)) else numero_dia(entrada)
+    fim = saida if isinstance(saida, (int, np.integer)) else numero_dia(saida)
+    if inicio is None or fim is None:
+        raise ValueError("Datas de entrada e saída inválidas.")
+    return int(inicio), max(int(fim), int(inicio) + 1)
+
+
+def andar_do_quarto(quarto):
+    """Andar de um quarto no formato "andar-número" (ex.: "3-7" -> 3)."""
+    andar = str(quarto).split("-", 1)[0].strip()
+    return int(andar) if andar.isdigit() else None
+
+
+class MapaDisponibilidade:
+    def __init__(self):
+        self._trava = threading.RLock()
+        self.versao = None
+        self.quartos = []
+        self._indice = {}
+        self._andares = np.zeros(0, dtype=np.int32)
+        self._base = numero_dia(date.today()) - MARGEM_DIAS
+        self._ocupacao = np.zeros((0, 2 * MARGEM_DIAS), dtype=np.int16)
+
+    # -------------------- CARGA --------------------
+    def carregar(self, conn):
+        """Remonta o mapa inteiro a partir das reservas ativas."""
+        iniciou = not conn.in_transaction
+        if iniciou:
+            conn.execute("BEGIN")  # leitura consistente da versão e das reservas
+        try:
+            versao = versao_tabela(conn, "reservas")
+            quartos = [linha[0] for linha in conn.execute("SELECT quarto FROM quartos ORDER BY id").fetchall()]
+            reservas = conn.execute("""
+                SELECT quarto, dia_entrada, dia_saida FROM reservas
+                WHERE status = 'Ativa' AND dia_entrada IS NOT NULL AND dia_saida IS NOT NULL
+            """).fetchall()
+        finally:
+            if iniciou:
+                conn.commit()
+
+        for quarto, _, _ in reservas:
+            if quarto not in quartos:
+                quartos.append(quarto)
+
+        hoje = numero_dia(date.today())
+        entradas = np.array([r[1] for r in reservas], dtype=np.int64)
+        saidas = np.maximum(np.array([r[2] for r in reservas], dtype=np.int64), entradas + 1)
+        base = min(hoje, int(entradas.min()) if len(entradas) else hoje) - MARGEM_DIAS
+        fim = max(hoje, int(saidas.max()) if len(saidas) else hoje) + MARGEM_DIAS
+
+        # Soma de diferenças: +1 na entrada e -1 na saída, acumulado por linha
+        indice = {quarto: i for i, quarto in enumerate(quartos)}
+        linhas = np.array([indice[r[0]] for r in reservas], dtype=np.int64)
+        diferencas = np.zeros((len(quartos), fim - base + 1), dtype=np.int32)
+        np.add.at(diferencas, (linhas, entradas - base), 1)
+        np.add.at(diferencas, (linhas, saidas - base), -1)
+        ocupacao = np.cumsum(diferencas, axis=1)[:, :-1].astype(np.int16)
+
+        with self._trava:
+            self.quartos = quartos
+            self._indice = indice
+            self._andares = np.array([andar_do_quarto(q) or 0 for q in quartos], dtype=np.int32)
+            self._base = base
+            self._ocupacao = ocupacao
+            self.versao = versao
+
+    def sincronizar(self, conn):
+        """Recarrega o mapa se ``reservas`` mudou fora das alterações registradas."""
+        if versao_tabela(conn, "reservas") != self.versao:
+            self.carregar(conn)
+        return self
+
+    # -------------------- ALTERAÇÕES --------------------
+    def _garantir(self, quarto, inicio, fim):
+        # Acrescenta a linha do quarto e estende as colunas para cobrir [inicio, fim)
+        if quarto not in self._indice:
+            self._indice[quarto] = len(self.quartos)
+            self.quartos.append(quarto)
+            self._andares = np.append(self._andares, np.int32(andar_do_quarto(quarto) or 0))
+            self._ocupacao = np.vstack([self._ocupacao, np.zeros((1, self._ocupacao.shape[1]), dtype=np.int16)])
+
+        if inicio < self._base:
+            extra = self._base - inicio + MARGEM_DIAS
+            self._ocupacao = np.pad(self._ocupacao, ((0, 0), (extra, 0)))
+            self._base -= extra
+        limite = self._base + self._ocupacao.shape[1]
+        if fim > limite:
+            self._ocupacao = np.pad(self._ocupacao, ((0, 0), (0, fim - limite + MARGEM_DIAS)))
+
+    def reservar(self, quarto, entrada, saida, quantidade=1):
+        inicio, fim = _intervalo(entrada, saida)
+        with self._trava:
+            self._garantir(quarto, inicio, fim)
+            self._ocupacao[self._indice[quarto], inicio - self._base:fim - self._base] += quantidade
+
+    def liberar(self, quarto, entrada, saida):
+        self.reservar(quarto, entrada, saida, -1)
+
+    def aplicar(self, versao_antes, versao_depois, alteracoes):
+        """Aplica alterações já gravadas no banco.
+
+        ``alteracoes`` é uma lista de (quarto, entrada, saída, +1/-1). Se o mapa
+        não estava na versão anterior à transação ele é marcado para recarga.
+        """
+        with self._trava:
+            if self.versao != versao_antes:
+                self.versao = None
+                return
+            for quarto, entrada, saida, quantidade in alteracoes:
+                self.reservar(quarto, entrada, saida, quantidade)
+            self.versao = versao_depois
+
+    @contextmanager
+    def alterando_reservas(self, conn):
+        """Transação de escrita em ``reservas`` que atualiza o mapa ao confirmar.
+
+        Uso::
+
+            with mapa.alterando_reservas(conn) as alteracoes:
+                cursor.execute("INSERT INTO reservas ...")
+                alteracoes.append((quarto, dia_entrada, dia_saida, +1))
+        """
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+        versao_antes = versao_tabela(conn, "reservas")
+        alteracoes = []
+        try:
+            yield alteracoes
+            versao_depois = versao_tabela(conn, "reservas")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        self.aplicar(versao_antes, versao_depois, alteracoes)
+
+    def garantir_livre(self, conn, quarto, entrada, saida, ignorar=None):
+        """Confere o quarto dentro de ``alterando_reservas``, já com o lock de escrita.
+
+        Sincroniza o mapa com o banco (nenhuma outra sessão grava reservas
+        enquanto o lock estiver com esta) e levanta ``QuartoOcupado`` se o
+        período colidir com outra reserva; a transação é então desfeita.
+        """
+        if not conn.in_transaction:
+            raise RuntimeError("garantir_livre deve rodar dentro de alterando_reservas.")
+        self.sincronizar(conn)
+        if not self.livre(quarto, entrada, saida, ignorar=ignorar):
+            raise QuartoOcupado(quarto)
+
+    # -------------------- CONSULTAS --------------------
+    def _janela(self, inicio, fim):
+        # Fatia [inicio, fim) da matriz, limitada à faixa conhecida
+        a = min(max(inicio - self._base, 0), self._ocupacao.shape[1])
+        b = min(max(fim - self._base, 0), self._ocupacao.shape[1])
+        return self._ocupacao[:, a:b]
+
+    def livre(self, quarto, entrada, saida, ignorar=None):
+        """True se nenhuma reserva ativa ocupa o quarto entre entrada e saída.
+
+        ``ignorar`` é a (entrada, saída) de uma reserva do próprio quarto que
+        não deve contar como conflito, por exemplo a que está sendo reagendada.
+        """
+        inicio, fim = _intervalo(entrada, saida)
+        with self._trava:
+            if quarto not in self._indice:
+                return True
+            a = max(inicio, self._base)
+            ocupacao = self._janela(inicio, fim)[self._indice[quarto]].astype(np.int32)
+            if ignorar is not None:
+                propria_inicio, propria_fim = _intervalo(*ignorar)
+                noites = np.arange(a, a + len(ocupacao))
+                ocupacao -= (noites >= propria_inicio) & (noites < propria_fim)
+            return not (ocupacao > 0).any()
+
+    def livres(self, entrada, saida):
+        """Vetor booleano (na ordem de ``self.quartos``) dos quartos livres no período."""
+        inicio, fim = _intervalo(entrada, saida)
+        with self._trava:
+            return ~(self._janela(inicio, fim) > 0).any(axis=1)
+
+    def andares(self):
+        with self._trava:
+            return sorted(set(int(a) for a in self._andares if a))
+
+    def quartos_livres(self, entrada, saida, andares=None, excluir=()):
+        """Todos os quartos livres no período, numa única passada pela matriz.
+
+        ``andares`` restringe a busca a alguns andares; ``excluir`` remove
+        quartos indisponíveis por outro motivo (manutenção, bloqueio...).
+        """
+        with self._trava:
+            mascara = self.livres(entrada, saida)
+            if andares:
+                mascara &= np.isin(self._andares, list(andares))
+            if excluir:
+                excluir = set(excluir)
+                mascara &= np.fromiter((q not in excluir for q in self.quartos), dtype=bool, count=len(self.quartos))
+            return [self.quartos[i] for i in np.flatnonzero(mascara)]
@@ -0,0 +1,51 @@
+"""Demonstração do Resultado do Exercício (DRE) por período.
+
+``calcular_dre`` monta todas as linhas da DRE de um período fatiando o cubo
+de receitas (``cubo_receita.CuboReceita``): totais por conta, noites,
+hóspedes distintos e os produtos mais vendidos saem de uma única máscara
+sobre os arrays do cubo, sem consultar o banco. O resultado não depende de
+nada fora dos dias do período, por isso pode ficar em cache com a chave
+(início, fim, ``marca_periodo_livro``): a marca só muda quando algum
+lançamento dentro do período é alterado.
+"""
+
+
+def calcular_dre(cubo, inicio, fim):
+    """Linhas da DRE entre ``inicio`` e ``fim`` (inclusive), valores em reais."""
+    totais = cubo.totais(inicio, fim)
+    receita_reservas = totais["receita_quartos"] / 100
+    receita_vendas = totais["receita_vendas"] / 100
+    compras_almoxarifado = totais["compras_almoxarifado"] / 100
+    custo_arrumacao = totais["custo_arrumacao"] / 100
+
+    receita_total = receita_reservas + receita_vendas
+    custo_total = compras_almoxarifado + custo_arrumacao
+    lucro_bruto = receita_total - custo_total
+
+    # Hóspedes com alguma noite dentro do período
+    clientes = cubo.contar_distintos("hospede", inicio, fim, contas=["receita_quartos"])
+
+    top_vendas = (
+        cubo.agrupar("produto", inicio, fim, contas=["receita_vendas"])
+        .sort_values("valor", ascending=False)
+        .head(5)
+        .rename(columns={"produto": "nome", "quantidade": "total_qtd", "valor": "total_valor"})
+        [["nome", "total_qtd", "total_valor"]]
+        .reset_index(drop=True)
+    )
+
+    return {
+        "receita_reservas": receita_reservas,
+        "receita_vendas": receita_vendas,
+        "receita_total": receita_total,
+        "compras_almoxarifado": compras_almoxarifado,
+        "custo_arrumacao": custo_arrumacao,
+        "custo_total": custo_total,
+        "lucro_bruto": lucro_bruto,
+        "noites": totais["noites"],
+        "clientes": clientes,
+        "ticket_medio": receita_total / clientes if clientes else 0,
+        "margem_lucro": (lucro_bruto / receita_total * 100) if receita_total else 0,
+        "custo_pct": (custo_total / receita_total * 100) if receita_total else 0,
+        "top_vendas": top_vendas,
+    }
@@ -0,0 +1,171 @@
+"""Movimentações de estoque do almoxarifado (``estoque``) e da loja (``estoquelj``).
+
+As movimentações são o razão do estoque (ver ``banco``): toda entrada ou
+saída é só um INSERT em ``movimentacoes_estoque``/``movimentacoes_estoquelj``,
+e o gatilho do razão soma a variação em ``quantidade`` na mesma transação.
+O código do app nunca grava o saldo diretamente.
+
+A saída confere o saldo com o lock de escrita já obtido por
+``movimentando_estoque`` (BEGIN IMMEDIATE): duas sessões vendendo o mesmo
+item ao mesmo tempo são serializadas pelo SQLite e não perdem baixas. O
+gatilho do razão ainda recusa qualquer saída maior que o saldo. Se não
+houver saldo suficiente nada é gravado e ``EstoqueInsuficiente`` é lançada;
+a recusa do gatilho também chega como ``EstoqueInsuficiente``, nunca como
+``sqlite3.IntegrityError``.
+
+Uso::
+
+    with movimentando_estoque(conn):
+        baixar(conn, "estoque", produto_id, 2, observacao="Uso em arrumação do quarto 1-1")
+        ...
+
+Para vários itens de uma vez (os itens de uma arrumação), ``baixar_lote``
+faz o mesmo com comandos em conjunto: uma leitura de saldos e preços por
+``IN (...)`` e um ``executemany`` para as movimentações, qualquer que seja
+a quantidade de itens.
+"""
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from banco import MOVIMENTACOES_ESTOQUE as MOVIMENTACOES
+
+
+class EstoqueInsuficiente(ValueError):
+    def __init__(self, produto_id, quantidade, disponivel):
+        self.produto_id = produto_id
+        self.quantidade = quantidade
+        self.disponivel = disponivel
+        super().__init__(
+            f"Estoque insuficiente para o produto {produto_id}: "
+            f"{quantidade} solicitado(s), {disponivel} disponível(is)."
+        )
+
+
+@contextmanager
+def movimentando_estoque(conn):
+    """Transação de escrita para uma ou mais baixas: confirma tudo ou nada."""
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def _lancar(conn, tabela, linhas, tipo, observacao, data, hora, extras):
+    # Acrescenta ao razão uma movimentação por (produto_id, quantidade, valor_total)
+    agora = datetime.now()
+    fixos = {
+        "tipo": tipo,
+        "data": data or agora.strftime("%Y-%m-%d"),
+        "hora": hora or agora.strftime("%H:%M:%S"),
+        "observacao": observacao,
+        **extras,
+    }
+    colunas = ["produto_id", "quantidade", "valor_total", *fixos]
+    atual = [None]
+
+    def parametros():
+        # executemany consome uma linha por vez: ``atual`` é a linha recusada
+        for linha in linhas:
+            atual[0] = linha
+            yield (*linha, *fixos.values())
+
+    try:
+        conn.executemany(
+            f"INSERT INTO {MOVIMENTACOES[tabela]} ({', '.join(colunas)}) VALUES ({', '.join('?' * len(colunas))})",
+            parametros(),
+        )
+    except sqlite3.IntegrityError as e:
+        if "saldo de estoque insuficiente" not in str(e):
+            raise
+        produto_id, quantidade = atual[0][0], atual[0][1]
+        linha = conn.execute(f"SELECT quantidade FROM {tabela} WHERE id = ?", (produto_id,)).fetchone()
+        raise EstoqueInsuficiente(produto_id, quantidade, (linha[0] if linha else 0) or 0) from e
+
+
+def baixar(conn, tabela, produto_id, quantidade, tipo="Saída", observacao="", data=None, hora=None, **extras):
+    """Baixa ``quantidade`` do produto, registrando a saída no razão.
+
+    Deve rodar dentro de ``movimentando_estoque``. ``extras`` são colunas
+    adicionais da movimentação (``cliente`` e ``quarto`` na loja). Retorna
+    (valor_unitario, valor_total).
+    """
+    return baixar_lote(conn, tabela, [(produto_id, quantidade)], tipo, observacao, data, hora, **extras)[0]
+
+
+def baixar_lote(conn, tabela, itens, tipo="Saída", observacao="", data=None, hora=None, **extras):
+    """Baixa vários itens com comandos em conjunto, dentro de ``movimentando_estoque``.
+
+    ``itens`` é uma lista de (produto_id, quantidade); o mesmo produto pode
+    aparecer mais de uma vez. Se faltar saldo para qualquer produto nada é
+    baixado e ``EstoqueInsuficiente`` é lançada. Grava uma movimentação por
+    item e retorna [(valor_unitario, valor_total)] na ordem de ``itens``.
+    """
+    if not conn.in_transaction:
+        raise RuntimeError("A baixa de estoque deve rodar dentro de movimentando_estoque.")
+    itens = [(int(produto_id), int(quantidade)) for produto_id, quantidade in itens]
+    if not itens:
+        return []
+    if any(quantidade <= 0 for _, quantidade in itens):
+        raise ValueError("A quantidade da saída deve ser maior que zero.")
+
+    por_produto = {}
+    for produto_id, quantidade in itens:
+        por_produto[produto_id] = por_produto.get(produto_id, 0) + quantidade
+
+    # Saldos e preços de todos os produtos numa leitura; a transação já tem o
+    # lock de escrita, então nada muda entre a leitura e as movimentações
+    marcadores = ", ".join("?" * len(por_produto))
+    saldos = {
+        produto_id: (quantidade, valor_unitario or 0)
+        for produto_id, quantidade, valor_unitario in conn.execute(
+            f"SELECT id, quantidade, valor_unitario FROM {tabela} WHERE id IN ({marcadores})", list(por_produto)
+        ).fetchall()
+    }
+    for produto_id, quantidade in por_produto.items():
+        disponivel = saldos.get(produto_id, (0, 0))[0] or 0
+        if disponivel < quantidade:
+            raise EstoqueInsuficiente(produto_id, quantidade, disponivel)
+
+    valores = [(saldos[produto_id][1], quantidade * saldos[produto_id][1]) for produto_id, quantidade in itens]
+    linhas = [(produto_id, quantidade, total) for (produto_id, quantidade), (_, total) in zip(itens, valores)]
+    _lancar(conn, tabela, linhas, tipo, observacao, data, hora, extras)
+    return valores
+
+
+def dar_entrada(conn, tabela, produto_id, quantidade, valor_unitario=None, tipo="Entrada", observacao=""):
+    """Entrada de ``quantidade`` do produto no razão.
+
+    Deve rodar dentro de uma transação de escrita. Com ``valor_unitario`` o
+    preço do produto passa a ser esse; sem ele vale o atual.
+    ``tipo="Abertura"`` registra a quantidade inicial do cadastro. Retorna o
+    valor total da entrada.
+    """
+    quantidade = int(quantidade)
+    if quantidade <= 0:
+        raise ValueError("A quantidade da entrada deve ser maior que zero.")
+    if valor_unitario is not None:
+        conn.execute(
+            f"UPDATE {tabela} SET valor_unitario = ? WHERE id = ? AND valor_unitario IS NOT ?",
+            (valor_unitario, produto_id, valor_unitario),
+        )
+    valor_unitario = conn.execute(f"SELECT valor_unitario FROM {tabela} WHERE id = ?", (produto_id,)).fetchone()[0]
+    valor_total = quantidade * (valor_unitario or 0)
+    _lancar(conn, tabela, [(produto_id, quantidade, valor_total)], tipo, observacao, None, None, {})
+    return valor_total
+
+
+def registrar_entrada(conn, tabela, produto_id, quantidade, **entrada):
+    """Uma entrada em sua própria transação; mesmo retorno de ``dar_entrada``."""
+    with movimentando_estoque(conn):
+        return dar_entrada(conn, tabela, produto_id, quantidade, **entrada)
+
+
+def registrar_saida(conn, tabela, produto_id, quantidade, **movimentacao):
+    """Uma baixa em sua própria transação; mesmo retorno de ``baixar``."""
+    with movimentando_estoque(conn):
+        return baixar(conn, tabela, produto_id, quantidade, **movimentacao)
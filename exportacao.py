@@ -0,0 +1,74 @@
+"""Exportação de consultas em lotes para CSV ou Parquet.
+
+``exportar`` lê o resultado de uma consulta em lotes (``pd.read_sql_query``
+com ``chunksize``) e grava cada lote no arquivo de destino assim que ele
+chega: a tabela inteira nunca fica em memória, só um lote por vez. No
+Parquet cada lote vira um row group do ``ParquetWriter`` do pyarrow, com o
+esquema fixado pelo primeiro lote.
+"""
+import pandas as pd
+
+# formato -> (tipo MIME, extensão)
+FORMATOS = {
+    "csv": ("text/csv", ".csv"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+TAMANHO_LOTE = 5000
+
+
+def _lotes(conn, sql, parametros, tamanho_lote, transformar):
+    for lote in pd.read_sql_query(sql, conn, params=tuple(parametros), chunksize=tamanho_lote):
+        yield transformar(lote) if transformar else lote
+
+
+def _gravar_csv(lotes, destino, progresso):
+    linhas = 0
+    with open(destino, "w", encoding="utf-8", newline="") as arquivo:
+        for lote in lotes:
+            lote.to_csv(arquivo, header=linhas == 0, index=False)
+            linhas += len(lote)
+            if progresso:
+                progresso(linhas)
+    return linhas
+
+
+def _gravar_parquet(lotes, destino, progresso):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    linhas = 0
+    esquema = escritor = None
+    try:
+        for lote in lotes:
+            if escritor is None:
+                # Colunas só com nulos no primeiro lote ficam como texto
+                esquema = pa.Schema.from_pandas(lote, preserve_index=False)
+                esquema = pa.schema([
+                    campo.with_type(pa.string()) if pa.types.is_null(campo.type) else campo for campo in esquema
+                ])
+                escritor = pq.ParquetWriter(destino, esquema)
+            escritor.write_table(pa.Table.from_pandas(lote, schema=esquema, preserve_index=False))
+            linhas += len(lote)
+            if progresso:
+                progresso(linhas)
+    finally:
+        if escritor is not None:
+            escritor.close()
+    return linhas
+
+
+def exportar(conn, sql, parametros, destino, formato="csv", tamanho_lote=TAMANHO_LOTE,
+             transformar=None, progresso=None):
+    """Grava o resultado de ``sql`` em ``destino`` e retorna o total de linhas.
+
+    ``transformar(df)`` é aplicado a cada lote antes da gravação (formatação,
+    nomes de colunas); ``progresso(linhas)`` é chamado depois de cada lote
+    com as linhas gravadas até ali. Um resultado vazio gera o arquivo só com
+    o cabeçalho (ou o esquema, no Parquet).
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportação desconhecido: {formato}")
+    lotes = _lotes(conn, sql, parametros, tamanho_lote, transformar)
+    if formato == "parquet":
+        return _gravar_parquet(lotes, destino, progresso)
+    return _gravar_csv(lotes, destino, progresso)
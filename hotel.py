@@ -1,214 +1,106 @@
+import html
+import multiprocessing
 import os
 import sqlite3
+import time
+import numpy as np
 import pandas as pd
 import streamlit as st
 import plotly.graph_objects as go
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from st_aggrid import AgGrid, GridOptionsBuilder
-import io
-import base64
-import qrcode
-from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib.units import inch
+import tempfile
 import urllib.parse
 
-conn = sqlite3.connect("hotel.db", check_same_thread=False)
-cursor = conn.cursor()
-
-# Tabela de produtos em estoque
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS estoque (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    categoria TEXT,
-    unidade TEXT,
-    quantidade INTEGER DEFAULT 0,
-    valor_unitario REAL DEFAULT 0,
-    status TEXT,
-    observacao TEXT,
-    estoque_minimo INTEGER DEFAULT 0,
-    estoque_maximo INTEGER DEFAULT 0
-)
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS movimentacoes_estoque (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    produto_id INTEGER,
-    tipo TEXT,
-    quantidade INTEGER,
-    data TEXT,
-    hora TEXT,
-    valor_total REAL,
-    observacao TEXT,
-    FOREIGN KEY(produto_id) REFERENCES estoque(id)
-)
-""")
-conn.commit()
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS arrumacoes_itens (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    arrumacao_id INTEGER,
-    produto_id INTEGER,
-    quantidade INTEGER,
-    valor_unitario REAL,
-    valor_total REAL,
-    data TEXT,
-    hora TEXT,
-    FOREIGN KEY(arrumacao_id) REFERENCES arrumacoes(id),
-    FOREIGN KEY(produto_id) REFERENCES estoque(id)
-)
-''')
-
-cursor.execute('''
-    CREATE TABLE IF NOT EXISTS usuarios (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        nome TEXT,
-        usuario TEXT UNIQUE,
-        senha TEXT,
-        funcao TEXT
-    );
-''')
-
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS hospedes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    cpf TEXT,
-    data_nascimento TEXT,
-    documento TEXT,
-    endereco TEXT,
-    telefone TEXT,
-    cidade TEXT,
-    placa TEXT,
-    rg TEXT
-)
-''')
-
-# Criar tabela de produtos
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS produtos (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT,
-    preco REAL,
-    quantidade INTEGER
-)
-''')
-
-# Criar tabela de funcionários
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS funcionarios (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT,
-    funcao TEXT,
-    status TEXT
-)
-''')
-
-# Criar tabela de arrumações
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS arrumacoes (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT,
-    funcao TEXT,
-    quarto TEXT,
-    status TEXT,
-    data TEXT,
-    hora TEXT,
-    diferenca_tempo TEXT,
-    tempo_previsto TEXT,
-    observacao TEXT,
-    tempo_gasto TEXT
-)
-''')
-
-# Criar tabela de reservas
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS reservas (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT,
-    cpf TEXT,
-    data_entrada TEXT,
-    data_saida TEXT,
-    valor TEXT,
-    quarto TEXT,
-    status TEXT DEFAULT 'Ativa',
-    motivo_cancelamento TEXT
-)
-""")
-
-# Criar tabela de quartos
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS quartos (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    quarto TEXT,
-    status TEXT
-)
-''')
-
-# Tabela de produtos em estoque
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS estoquelj (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT NOT NULL,
-    categoria TEXT,
-    unidade TEXT,
-    quantidade INTEGER DEFAULT 0,
-    valor_unitario REAL DEFAULT 0,
-    status TEXT,
-    observacao TEXT,
-    codigo_barras TEXT,
-    estoque_minimo INTEGER DEFAULT 0,
-    estoque_maximo INTEGER DEFAULT 0
-)
-""")
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS comunicados (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    mensagem TEXT,
-    destinatario TEXT,
-    data TEXT,
-    hora TEXT
-)
-""")
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS movimentacoes_estoquelj (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    produto_id INTEGER,
-    tipo TEXT,
-    cliente TEXT,
-    quarto TEXT,
-    quantidade INTEGER,
-    data TEXT,
-    hora TEXT,
-    valor_total REAL,
-    observacao TEXT,
-    FOREIGN KEY(produto_id) REFERENCES estoque(id)
-)
-""")
-
-# Criar tabela de produtos
-cursor.execute('''
-CREATE TABLE IF NOT EXISTS produtoslj (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    nome TEXT,
-    preco REAL,
-    quantidade INTEGER
-)
-''')
-# Popula os quartos se estiver vazio
-cursor.execute("SELECT COUNT(*) FROM quartos")
-if cursor.fetchone()[0] == 0:
-    for andar in range(8):
-        for numero in range(10):
-            quarto = f"{andar+1}-{numero+1}"
-            cursor.execute("INSERT INTO quartos (quarto, status) VALUES (?, ?)", (quarto, "Livre"))
-    conn.commit()
+from banco import (CAMINHO_BANCO, PoolConexoes, aplicar_migracoes, atualizar_noites, buscar_hospedes,
+                   campos_reserva, STATUS_QUARTO_INDISPONIVEL, encerrar_noites, marca_periodo_livro, numero_dia,
+                   somente_digitos, tirar_retratos, totais_livro, versao_tabela)
+from cache_leituras import CacheLeituras
+from codigos_barras import IndiceCodigosBarras
+from comprovantes import (assinatura_estadia, dados_comprovante, gerar_lote, juntar_pdfs, pdf_comprovante,
+                          zip_comprovantes)
+from cubo_receita import CONTAS_RECEITA, CuboReceita
+from disponibilidade import MapaDisponibilidade, QuartoIndisponivel, QuartoOcupado
+from dre import calcular_dre
+from estoque import (EstoqueInsuficiente, baixar_lote, dar_entrada, movimentando_estoque, registrar_entrada,
+                     registrar_saida)
+from exportacao import FORMATOS, exportar
+
+
+# Receita de quartos de um hóspede em reais: as mesmas noites (e os mesmos
+# status) que os gatilhos lançam no livro diário, para o total por CPF bater
+# com o total geral
+SQL_RECEITA_HOSPEDE = """
+    SELECT COALESCE(SUM(n.valor_centavos), 0) / 100.0
+    FROM reservas r
+    JOIN noites_quartos n ON n.reserva_id = r.id
+    WHERE r.cpf_digitos = ? AND r.status IN ('Ativa', 'Finalizada') {filtro_dia}
+"""
+
+
+# Streamlit reexecuta este script a cada interação; o pool de conexões e as
+# migrações do schema ficam em cache de recurso e rodam uma vez por processo.
+@st.cache_resource(show_spinner=False)
+def obter_pool():
+    pool = PoolConexoes(CAMINHO_BANCO)
+    with pool.conexao() as conexao:
+        aplicar_migracoes(conexao)
+        # Retratos do razão do estoque para os produtos muito movimentados
+        conexao.execute("BEGIN IMMEDIATE")
+        tirar_retratos(conexao)
+        conexao.commit()
+        # Códigos de barras já em memória antes da primeira leitura no caixa
+        _indice_codigos_barras().carregar(conexao)
+    return pool
+
+
+@st.cache_resource(show_spinner=False)
+def _mapa_disponibilidade():
+    return MapaDisponibilidade()
+
+
+def obter_disponibilidade():
+    # Mapa de ocupação por noite compartilhado entre as sessões; é recarregado
+    # apenas se reservas foi alterada sem passar por alterando_reservas
+    return _mapa_disponibilidade().sincronizar(conn)
+
+
+@st.cache_resource(show_spinner=False)
+def _indice_codigos_barras():
+    return IndiceCodigosBarras()
+
+
+def obter_codigos_barras():
+    # Códigos de barras da loja em memória, compartilhados entre as sessões;
+    # recarregados só se estoquelj teve códigos alterados fora do índice
+    return _indice_codigos_barras().sincronizar(conn)
+
+
+@st.cache_resource(show_spinner=False)
+def _cubo_receita():
+    return CuboReceita()
+
+
+@st.cache_resource(show_spinner=False)
+def _cache_leituras():
+    return CacheLeituras()
+
+
+def ler(sql, parametros=()):
+    # Leitura pelo cache compartilhado entre as sessões: só vai ao banco se
+    # alguma tabela lida pela consulta mudou desde a última vez
+    return _cache_leituras().consultar(conn, sql, parametros)
+
+
+def ler_df(sql, parametros=()):
+    return _cache_leituras().consultar_df(conn, sql, parametros)
+
+
+def obter_cubo():
+    # Cubo de receitas compartilhado; recarrega só os dias alterados no livro diário
+    return _cubo_receita().atualizar(conn)
 
-conn.commit()
 
 def main():
     st.set_page_config(page_title="Sistema de Hotelaria", page_icon="🏨", layout="wide")
@@ -259,11 +151,14 @@ def main():
         opcao = st.sidebar.radio("🧰 Contas - Módulos:", [
             "🧹 Contabilidade",
             "📦 Financeiro",
+            "🔎 Análise de Receitas",
         ])
         if opcao == "🧹 Contabilidade":
             modulo_contabil()
         elif opcao == "📦 Financeiro":
             modulo_financeiro()
+        elif opcao == "🔎 Análise de Receitas":
+            analise_receitas()
     elif escolha == "➕ Cadastrar Usuário":
         cadastrar_usuario()
 
@@ -301,7 +196,8 @@ def main():
             "Check in ",
             "Consulta Reservas",
             "Menssagens ",
-            "Estadia "
+            "Estadia ",
+            "Comprovantes em Lote "
         ])
         if opcao == "Cadastrar Produto":
             cadastrar_produto()
@@ -319,6 +215,8 @@ def main():
             mensagens()
         elif opcao == "Estadia ":
             emitir_estadia()
+        elif opcao == "Comprovantes em Lote ":
+            emitir_comprovantes_lote()
 
     elif escolha == "Reservas 🛎️":
         opcao = st.sidebar.radio("🧰 Reservas - Módulos:", [
@@ -436,10 +334,14 @@ def cadastrar_produtoam():
             if nome.strip() == "":
                 st.warning("⚠️ Preencha o nome do produto.")
             else:
+                # O saldo começa em zero; a quantidade inicial entra no razão como Abertura
                 cursor.execute("""
                 INSERT INTO estoque (nome, categoria, unidade, quantidade, valor_unitario, status, observacao, estoque_minimo, estoque_maximo)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (nome, categoria, unidade, quantidade, valor, status, observacao, estoque_minimo, estoque_maximo))
+                VALUES (?, ?, ?, 0, ?, ?, ?, ?, ?)
+                """, (nome, categoria, unidade, valor, status, observacao, estoque_minimo, estoque_maximo))
+                if quantidade > 0:
+                    dar_entrada(conn, "estoque", cursor.lastrowid, quantidade, tipo="Abertura",
+                                observacao="Quantidade inicial do cadastro")
                 conn.commit()
                 st.success("✅ Produto cadastrado com sucesso!")
 
@@ -447,14 +349,14 @@ def cadastrar_produtoam():
 def saida_produtoam():
     st.title("📤 Saída de Produto")
 
-    categorias = [row[0] for row in cursor.execute("SELECT DISTINCT categoria FROM estoque").fetchall()]
+    categorias = [row[0] for row in ler("SELECT DISTINCT categoria FROM estoque")]
     categoria_sel = st.selectbox("📂 Filtrar por Categoria", ["Selecionar Categoria..."] + categorias)
 
     if categoria_sel == "Selecionar Categoria...":
         st.info("👈 Por favor, selecione uma categoria para continuar.")
         return
 
-    produtos = cursor.execute("SELECT id, nome FROM estoque WHERE categoria = ? AND quantidade > 0", (categoria_sel,)).fetchall()
+    produtos = ler("SELECT id, nome FROM estoque WHERE categoria = ? AND quantidade > 0", (categoria_sel,))
 
     if not produtos:
         st.info("📭 Nenhum produto com estoque disponível nesta categoria.")
@@ -492,23 +394,12 @@ def saida_produtoam():
         enviar = st.form_submit_button("📤 Registrar Saída")
 
         if enviar:
-            nova_qtd = qtd - qtd_saida
-            total = qtd_saida * valor
-            data = datetime.now().strftime("%Y-%m-%d")
-            hora = datetime.now().strftime("%H:%M:%S")
-
             try:
-                # Atualiza estoque
-                cursor.execute("UPDATE estoque SET quantidade = ? WHERE id = ?", (nova_qtd, produto_id))
-
-                # Registra movimentação
-                cursor.execute("""
-                    INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, data, hora, valor_total, observacao)
-                    VALUES (?, 'Saída', ?, ?, ?, ?, ?)
-                """, (produto_id, qtd_saida, data, hora, total, observacao))
-
-                conn.commit()
+                # Baixa condicional e movimentação na mesma transação
+                registrar_saida(conn, "estoque", produto_id, qtd_saida, observacao=observacao)
                 st.success(f"✅ Saída registrada com sucesso para o produto **{nome_sel}**!")
+            except EstoqueInsuficiente as e:
+                st.warning(f"⚠️ {e}")
             except Exception as e:
                 st.error(f"❌ Erro ao registrar saída: {e}")
 
@@ -520,7 +411,7 @@ def modulo_almoxarifadoam():
     with st.expander("🔍 Filtros"):
         col1, col2 = st.columns(2)
         filtro_nome = col1.text_input("🔎 Buscar por nome:")
-        categorias = ["Todas"] + [row[0] for row in cursor.execute("SELECT DISTINCT categoria FROM estoquelj").fetchall()]
+        categorias = ["Todas"] + [row[0] for row in ler("SELECT DISTINCT categoria FROM estoquelj")]
         filtro_categoria = col2.selectbox("📂 Filtrar por Categoria", categorias)
 
     # 📦 Consulta com filtros
@@ -540,7 +431,7 @@ def modulo_almoxarifadoam():
         params.append(filtro_categoria)
 
     query += " ORDER BY nome ASC"
-    produtos = cursor.execute(query, tuple(params)).fetchall()
+    produtos = ler(query, tuple(params))
 
     if not produtos:
         st.info("📭 Nenhum item encontrado com os filtros aplicados.")
@@ -574,14 +465,14 @@ def modulo_almoxarifadoam():
     # 📊 Tabela Estilizada com Destaque
     st.markdown("### 📋 Visão Geral dos Itens em Tabela")
 
-    df = pd.read_sql_query("""
+    df = ler_df("""
         SELECT nome AS Produto, categoria AS Categoria, unidade AS Unidade,
             quantidade AS Quantidade, estoque_minimo AS 'Estoque Mínimo',
             estoque_maximo AS 'Estoque Máximo', valor_unitario AS 'Valor Unitário (R$)', status AS Status
         FROM estoque
         WHERE quantidade > 0
         ORDER BY nome ASC
-    """, conn)
+    """)
 
     def destacar_estoque_baixo(row):
         return ['background-color: #ffe6e6' if row['Quantidade'] <= row['Estoque Mínimo'] else '' for _ in row]
@@ -602,14 +493,14 @@ def highlight(row):
 def entrada_produtoam():
     st.title("📥 Entrada de Produto")
 
-    categorias = [row[0] for row in cursor.execute("SELECT DISTINCT categoria FROM estoque").fetchall()]
+    categorias = [row[0] for row in ler("SELECT DISTINCT categoria FROM estoque")]
     categoria_sel = st.selectbox("📂 Filtrar por Categoria", ["Selecionar Categoria..."] + categorias)
 
     if categoria_sel == "Selecionar Categoria...":
         st.info("👈 Por favor, selecione uma categoria.")
         return
 
-    produtos = cursor.execute("SELECT id, nome FROM estoque WHERE categoria = ?", (categoria_sel,)).fetchall()
+    produtos = ler("SELECT id, nome FROM estoque WHERE categoria = ?", (categoria_sel,))
 
     if not produtos:
         st.info("📭 Nenhum produto disponível nesta categoria.")
@@ -653,24 +544,10 @@ def entrada_produtoam():
         enviar = st.form_submit_button("✅ Registrar Entrada")
 
         if enviar:
-            nova_qtd = qtd + qtd_entrada
-            valor_total = qtd_entrada * novo_valor
-            data = datetime.now().strftime("%Y-%m-%d")
-            hora = datetime.now().strftime("%H:%M:%S")
-
             try:
-                # Atualiza estoque
-                cursor.execute("""
-                    UPDATE estoque SET quantidade = ?, valor_unitario = ? WHERE id = ?
-                """, (nova_qtd, novo_valor, produto_id))
-
-                # Registra movimentação
-                cursor.execute("""
-                    INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, data, hora, valor_total, observacao)
-                    VALUES (?, 'Entrada', ?, ?, ?, ?, ?)
-                """, (produto_id, qtd_entrada, data, hora, valor_total, observacao))
-
-                conn.commit()
+                # A entrada é só uma movimentação no razão; o saldo é somado pelo banco
+                registrar_entrada(conn, "estoque", produto_id, qtd_entrada, valor_unitario=novo_valor,
+                                  observacao=observacao)
                 st.success(f"✅ Entrada registrada com sucesso para o produto **{nome_sel}**!")
             except Exception as e:
                 st.error(f"❌ Erro ao registrar entrada: {e}")
@@ -680,8 +557,6 @@ def cadastrar_funcionario():
     nome = st.text_input("Nome do Funcionário")
     funcao = st.selectbox("Função", ["Arrumação", "Limpeza", "Manutenção", "Recepção"])
     if st.button("Salvar"):
-        conn = sqlite3.connect("hotel.db")
-        cursor = conn.cursor()
         cursor.execute("INSERT INTO funcionarios (nome, funcao) VALUES (?, ?)", (nome, funcao))
         conn.commit()
         st.success("Funcionário cadastrado com sucesso!")
@@ -689,28 +564,42 @@ def cadastrar_funcionario():
 def agendar_estadia():
     st.title("🔔 Check-in Rápido")
 
-    with st.form("form_checkin_rapido", clear_on_submit=True):
-        # Seleção de hóspede
-        hospedes = cursor.execute("SELECT nome FROM hospedes").fetchall()
-        nomes_hospedes = ["Selecione um hóspede..."] + [h[0] for h in hospedes]
-        nome = st.selectbox("🧑 Nome do hóspede", nomes_hospedes)
-
-        if nome != "Selecione um hóspede...":
-            resultado = cursor.execute("SELECT cpf FROM hospedes WHERE nome = ?", (nome,)).fetchone()
-            cpf = resultado[0] if resultado else ""
-        else:
-            cpf = ""
+    # Período e andar primeiro: a lista de quartos mostra só os livres
+    mapa = obter_disponibilidade()
+    col1, col2, col3 = st.columns(3)
+    data_entrada = col1.date_input("📅 Data de Entrada", datetime.today())
+    data_saida = col2.date_input("📅 Data de Saída", datetime.today() + timedelta(days=1))
+    andares = col3.multiselect("🏢 Andar", mapa.andares(), placeholder="Todos")
+
+    # Situação física atual do quarto só importa para entradas a partir de hoje
+    entrada_hoje = data_entrada <= datetime.today().date()
+    indisponiveis = []
+    if entrada_hoje:
+        marcadores = ", ".join("?" * len(STATUS_QUARTO_INDISPONIVEL))
+        indisponiveis = [linha[0] for linha in ler(
+            f"SELECT quarto FROM quartos WHERE status IN ({marcadores})", STATUS_QUARTO_INDISPONIVEL
+        )]
+    lista_quartos = mapa.quartos_livres(data_entrada, data_saida, andares=andares, excluir=indisponiveis)
+    st.caption(f"🛏️ {len(lista_quartos)} quarto(s) livre(s) no período.")
+
+    # Busca de hóspede (nome, CPF, documento, telefone ou placa) no índice textual
+    busca = st.text_input("🔎 Buscar hóspede", placeholder="Nome, CPF, documento, telefone ou placa")
+    # O nº do cadastro no rótulo distingue hóspedes homônimos; a escolha é pelo id
+    encontrados = {
+        f"{nome} — CPF {cpf or 'não informado'} (nº {hospede_id})": (hospede_id, nome, cpf)
+        for hospede_id, nome, cpf in buscar_hospedes(conn, busca)
+    }
+    if busca and not encontrados:
+        st.info("📭 Nenhum hóspede encontrado.")
+    escolhido = st.selectbox("🧑 Hóspede", list(encontrados), index=None, placeholder="Selecione um hóspede...")
+    _, nome, cpf = encontrados.get(escolhido, (None, "", ""))
 
-        st.text_input("🆔 CPF", value=cpf, disabled=True)
+    with st.form("form_checkin_rapido", clear_on_submit=True):
+        st.text_input("🆔 CPF", value=cpf or "", disabled=True)
 
-        # Seleção de quarto
-        lista_quartos = [f"{i+1}-{j+1}" for i in range(8) for j in range(10)]
+        # Seleção de quarto (apenas os livres no período)
         quarto = st.selectbox("🛏️ Quarto", lista_quartos)
 
-        # Datas
-        data_entrada = st.date_input("📅 Data de Entrada", datetime.today())
-        data_saida = st.date_input("📅 Data de Saída", datetime.today() + timedelta(days=1))
-
         # Calcula quantidade de dias
         dias = (data_saida - data_entrada).days
         if dias <= 0:
@@ -725,6 +614,10 @@ def agendar_estadia():
 
         confirmar = st.form_submit_button("✅ Realizar Check-in")
 
+        if quarto is None:
+            st.warning("⚠️ Nenhum quarto livre para o período e andar escolhidos.")
+            return
+
         # Verifica status do quarto
         cursor.execute("SELECT status FROM quartos WHERE quarto = ?", (quarto,))
         resultado = cursor.fetchone()
@@ -733,25 +626,48 @@ def agendar_estadia():
             st.error(f"❌ O quarto {quarto} não está cadastrado no sistema.")
             return
 
-        status_quarto = resultado[0].strip().lower()
-        if status_quarto in ["ocupado", "em uso", "em arrumação", "em limpeza", "bloqueado"]:
-            st.warning(f"⚠️ O quarto {quarto} está atualmente com status: {status_quarto.capitalize()}.")
+        # Conflito com outras reservas no período escolhido (pode ter mudado desde a busca)
+        if not mapa.livre(quarto, data_entrada, data_saida):
+            st.warning(f"⚠️ O quarto {quarto} já está reservado entre {data_entrada.strftime('%d/%m/%Y')} e {data_saida.strftime('%d/%m/%Y')}.")
+            return
+
+        status_quarto = resultado[0]
+        if entrada_hoje and status_quarto in STATUS_QUARTO_INDISPONIVEL:
+            st.warning(f"⚠️ O quarto {quarto} está atualmente com status: {status_quarto}.")
             return
 
         if confirmar:
             if not nome or not cpf or not quarto or valor_diaria <= 0:
                 st.warning("⚠️ Preencha todos os campos obrigatórios.")
             else:
-                # Registrar reserva
-                cursor.execute("""
-                    INSERT INTO reservas (nome, cpf, quarto, data_entrada, data_saida, valor, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (nome, cpf, quarto, data_entrada, data_saida, valor_total, "Ativa"))
+                try:
+                    campos = campos_reserva(data_entrada, data_saida, valor_diaria)
+                except ValueError as e:
+                    st.warning(f"⚠️ {e}")
+                    return
 
-                # Atualizar status do quarto
-                cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Ocupado", quarto))
+                try:
+                    with mapa.alterando_reservas(conn) as alteracoes:
+                        # Confere de novo já com o lock: outra sessão pode ter reservado o quarto
+                        mapa.garantir_livre(conn, quarto, campos["dia_entrada"], campos["dia_saida"])
+
+                        # Registrar reserva (valor = diária)
+                        cursor.execute("""
+                            INSERT INTO reservas (nome, cpf, cpf_digitos, quarto, data_entrada, data_saida, valor, status,
+                                                  dia_entrada, dia_saida, valor_centavos)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """, (nome, cpf, somente_digitos(cpf), quarto, campos["data_entrada"], campos["data_saida"],
+                              valor_diaria, "Ativa", campos["dia_entrada"], campos["dia_saida"], campos["valor_centavos"]))
+                        atualizar_noites(conn, cursor.lastrowid)
+                        alteracoes.append((quarto, campos["dia_entrada"], campos["dia_saida"], 1))
+
+                        # Atualizar status do quarto (reservas futuras não mudam a situação atual)
+                        if entrada_hoje:
+                            cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Ocupado", quarto))
+                except QuartoOcupado:
+                    st.warning(f"⚠️ O quarto {quarto} acabou de ser reservado por outra sessão no período. Escolha outro quarto.")
+                    return
 
-                conn.commit()
                 st.success(f"✅ Reserva registrada para {nome} no quarto {quarto} ({dias} diárias, total R$ {valor_total:.2f}).")
 
 def gerenciar_ocupacoes():
@@ -762,12 +678,13 @@ def gerenciar_ocupacoes():
     if tipo == "✅ Check-in":
         st.subheader("🔑 Confirmar Check-in")
 
-        reservas_checkin = pd.read_sql_query("""
-            SELECT r.id, r.nome, r.cpf, r.quarto, r.data_entrada, r.data_saida, r.valor
+        reservas_checkin = ler_df("""
+            SELECT r.id, r.nome, r.cpf, r.quarto, r.data_entrada, r.data_saida, COALESCE(r.valor_centavos, 0) AS valor_centavos
             FROM reservas r
             JOIN quartos q ON r.quarto = q.quarto
-            WHERE r.status = 'Ativa' AND LOWER(q.status) = 'ocupado'
-        """, conn)
+            WHERE r.status = 'Ativa' AND COALESCE(r.dia_entrada, 0) <= ?
+            AND q.status IN ('Ocupado', 'Livre')
+        """, (numero_dia(datetime.today()),))
 
         if reservas_checkin.empty:
             st.info("📭 Nenhuma reserva aguardando check-in.")
@@ -781,25 +698,26 @@ def gerenciar_ocupacoes():
         - 🛏️ **Quarto reservado:** `{dados['quarto']}`
         - 📅 **Entrada:** `{pd.to_datetime(dados['data_entrada']).strftime('%d/%m/%Y')}`
         - 📅 **Saída:** `{pd.to_datetime(dados['data_saida']).strftime('%d/%m/%Y')}`
-        - 💵 **Valor:** R$ {float(dados['valor']):.2f}
+        - 💵 **Diária:** R$ {dados['valor_centavos'] / 100:.2f}
         """)
 
         if st.button("✅ Confirmar Check-in"):
-            cursor.execute("UPDATE reservas SET status = ? WHERE id = ?", ("Ativa", dados["id"]))
-            cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Em Uso", dados["quarto"]))
-            conn.commit()
+            with obter_disponibilidade().alterando_reservas(conn):
+                cursor.execute("UPDATE reservas SET status = ? WHERE id = ?", ("Ativa", int(dados["id"])))
+                cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Em Uso", dados["quarto"]))
             st.success(f"🏨 Check-in confirmado para {dados['nome']}. Quarto {dados['quarto']} agora está Em Uso.")
             st.rerun()
 
     else:
         st.subheader("📤 Confirmar Check-out")
 
-        reservas_checkout = pd.read_sql_query("""
-            SELECT r.id, r.nome, r.cpf, r.quarto, r.data_entrada, r.data_saida, r.valor, q.status as status_quarto
+        reservas_checkout = ler_df("""
+            SELECT r.id, r.nome, r.cpf, r.quarto, r.data_entrada, r.data_saida, r.dia_entrada, r.dia_saida,
+                COALESCE(r.valor_centavos, 0) AS valor_centavos, q.status as status_quarto
             FROM reservas r
             JOIN quartos q ON r.quarto = q.quarto
-            WHERE r.status = 'Ativa' AND LOWER(q.status) = 'em uso'
-        """, conn)
+            WHERE r.status = 'Ativa' AND q.status = 'Em Uso'
+        """)
 
         if reservas_checkout.empty:
             st.info("📭 Nenhuma hospedagem com quarto em uso para check-out.")
@@ -813,30 +731,80 @@ def gerenciar_ocupacoes():
         - 🛏️ **Quarto:** `{dados['quarto']}`
         - 📅 **Entrada:** `{pd.to_datetime(dados['data_entrada']).strftime('%d/%m/%Y')}`
         - 📅 **Saída:** `{pd.to_datetime(dados['data_saida']).strftime('%d/%m/%Y')}`
-        - 💵 **Valor:** R$ {float(dados['valor']):.2f}
+        - 💵 **Diária:** R$ {dados['valor_centavos'] / 100:.2f}
         """)
 
         if st.button("📤 Confirmar Check-out"):
-        # Finaliza a reserva e libera o quarto
-            cursor.execute("UPDATE reservas SET status = ? WHERE id = ?", ("Finalizada", dados["id"]))
-            cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Livre", dados["quarto"]))
-            conn.commit()
+            # Finaliza a reserva e libera o quarto
+            with obter_disponibilidade().alterando_reservas(conn) as alteracoes:
+                cursor.execute("UPDATE reservas SET status = ? WHERE id = ?", ("Finalizada", int(dados["id"])))
+                cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Livre", dados["quarto"]))
+                encerrar_noites(conn, int(dados["id"]), numero_dia(datetime.today()))
+                if pd.notna(dados["dia_entrada"]) and pd.notna(dados["dia_saida"]):
+                    alteracoes.append((dados["quarto"], int(dados["dia_entrada"]), int(dados["dia_saida"]), -1))
             st.success(f"✅ Check-out realizado com sucesso para {dados['nome']}! Quarto {dados['quarto']} agora está Livre.")
             st.rerun()
 
 # Consultar Reserva
+# Linhas por página nas listagens de reservas
+TAMANHO_PAGINA = 50
+
+
+def paginar_reservas(chave, consulta, contagem, parametros=(), tamanho=TAMANHO_PAGINA):
+    """Uma página de reservas e o total de linhas do filtro.
+
+    Paginação por chave: a página seguinte começa logo depois do último
+    (data_entrada, id) da atual, então o banco lê apenas as linhas da página,
+    em qualquer posição do histórico. ``consulta`` deve selecionar ``id`` e
+    ``data_entrada``, ter o campo ``{pagina}`` no fim do WHERE e terminar em
+    ``ORDER BY data_entrada DESC, id DESC LIMIT ?``; ``contagem`` é o
+    ``COUNT(*)`` com o mesmo filtro. As chaves de início das páginas já
+    visitadas ficam em ``st.session_state[chave]`` e voltam à primeira página
+    quando o filtro muda.
+    """
+    parametros = list(parametros)
+    total = ler(contagem, parametros)[0][0]
+
+    assinatura = (contagem, tuple(parametros))
+    estado = st.session_state.get(chave)
+    if estado is None or estado["filtro"] != assinatura:
+        estado = st.session_state[chave] = {"filtro": assinatura, "inicios": [None]}
+    inicios = estado["inicios"]
+
+    if inicios[-1] is None:
+        df = ler_df(consulta.format(pagina=""), parametros + [tamanho + 1])
+    else:
+        df = ler_df(consulta.format(pagina="AND (data_entrada, id) < (?, ?)"),
+                    parametros + list(inicios[-1]) + [tamanho + 1])
+
+    # Uma linha a mais indica se existe próxima página
+    tem_proxima = len(df) > tamanho
+    df = df.head(tamanho)
+
+    def avancar():
+        ultima = df.iloc[-1]
+        inicios.append((ultima["data_entrada"], int(ultima["id"])))
+
+    col1, col2, col3 = st.columns([1, 3, 1])
+    col1.button("◀ Anterior", key=f"{chave}_anterior", disabled=len(inicios) == 1, on_click=inicios.pop)
+    col2.caption(f"Página {len(inicios)} de {max(1, -(-total // tamanho))} · {total} reserva(s)")
+    col3.button("Próxima ▶", key=f"{chave}_proxima", disabled=not tem_proxima, on_click=avancar)
+
+    return df.drop(columns="id"), total
+
+
 def consultar_reserva():
     st.title("🔍 Consultar Reserva")
 
-    cpf = st.text_input("Digite o CPF do hóspede:").replace(".", "").replace("-", "").replace(" ", "").strip()
+    cpf = somente_digitos(st.text_input("Digite o CPF do hóspede:"))
 
     if cpf:
-        df = pd.read_sql_query("""
-            SELECT nome, cpf, quarto, data_entrada, data_saida, status
+        df, _ = paginar_reservas("paginas_consulta_reserva", """
+            SELECT id, nome, cpf, quarto, data_entrada, data_saida, status
             FROM reservas
-            WHERE REPLACE(REPLACE(REPLACE(cpf, '.', ''), '-', ''), ' ', '') = ?
-            ORDER BY data_entrada DESC
-        """, conn, params=(cpf,))
+            WHERE cpf_digitos = ? {pagina}
+            ORDER BY data_entrada DESC, id DESC LIMIT ?
+        """, "SELECT COUNT(*) FROM reservas WHERE cpf_digitos = ?", (cpf,))
 
         if df.empty:
             st.info("⚠️ Nenhuma reserva encontrada para este CPF.")
@@ -850,356 +818,101 @@ def consultar_reserva():
 
             # Configura o AgGrid
             gb = GridOptionsBuilder.from_dataframe(df)
-            gb.configure_pagination()
             gb.configure_side_bar()
             gb.configure_default_column(groupable=True, value=True, editable=False, filter=True)
             grid_options = gb.build()
 
             AgGrid(df, gridOptions=grid_options, theme="streamlit", height=400, fit_columns_on_grid_load=True)
-def agendar_estadia():
-    st.title("🔔 Check-in Rápido")
-
-    with st.form("form_checkin_rapido", clear_on_submit=True):
-        # Seleção de hóspede
-        hospedes = cursor.execute("SELECT nome FROM hospedes").fetchall()
-        nomes_hospedes = ["Selecione um hóspede..."] + [h[0] for h in hospedes]
-        nome = st.selectbox("🧑 Nome do hóspede", nomes_hospedes)
-
-        if nome != "Selecione um hóspede...":
-            resultado = cursor.execute("SELECT cpf FROM hospedes WHERE nome = ?", (nome,)).fetchone()
-            cpf = resultado[0] if resultado else ""
-        else:
-            cpf = ""
-
-        st.text_input("🆔 CPF", value=cpf, disabled=True)
-
-        # Seleção de quarto
-        lista_quartos = [f"{i+1}-{j+1}" for i in range(8) for j in range(10)]
-        quarto = st.selectbox("🛏️ Quarto", lista_quartos)
-
-        # Datas
-        data_entrada = st.date_input("📅 Data de Entrada", datetime.today())
-        data_saida = st.date_input("📅 Data de Saída", datetime.today() + timedelta(days=1))
-
-        # Calcula quantidade de dias
-        dias = (data_saida - data_entrada).days
-        if dias <= 0:
-            dias = 1  # pelo menos 1 diária
-
-        # Valor da diária
-        valor_diaria = st.number_input("💵 Valor da diária", min_value=0.0, step=0.01)
-
-        # Total calculado
-        valor_total = dias * valor_diaria
-        st.info(f"💰 Total da Reserva: R$ {valor_total:.2f} ({dias} diárias)")
-
-        confirmar = st.form_submit_button("✅ Realizar Check-in")
-
-        # Verifica status do quarto
-        cursor.execute("SELECT status FROM quartos WHERE quarto = ?", (quarto,))
-        resultado = cursor.fetchone()
-
-        if resultado is None:
-            st.error(f"❌ O quarto {quarto} não está cadastrado no sistema.")
-            return
-
-        status_quarto = resultado[0].strip().lower()
-        if status_quarto in ["ocupado", "em uso", "em arrumação", "em limpeza", "bloqueado"]:
-            st.warning(f"⚠️ O quarto {quarto} está atualmente com status: {status_quarto.capitalize()}.")
-            return
-
-        if confirmar:
-            if not nome or not cpf or not quarto or valor_diaria <= 0:
-                st.warning("⚠️ Preencha todos os campos obrigatórios.")
-            else:
-                # Registrar reserva
-                cursor.execute("""
-                    INSERT INTO reservas (nome, cpf, quarto, data_entrada, data_saida, valor, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (nome, cpf, quarto, data_entrada, data_saida, valor_total, "Ativa"))
-
-                # Atualizar status do quarto
-                cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Ocupado", quarto))
-
-                conn.commit()
-                st.success(f"✅ Reserva registrada para {nome} no quarto {quarto} ({dias} diárias, total R$ {valor_total:.2f}).")
-
-def historico_estadias():
-    st.header("📖 Histórico de Estadia")
-    st.markdown("### 🔍 Filtros de Pesquisa")
-
-    col1, col2 = st.columns(2)
-    with col1:
-        data_inicio = st.date_input("🗓️ De:", datetime.now() - timedelta(days=30))
-        nome_filtro = st.text_input("🧑 Filtrar por nome")
-    with col2:
-        data_fim = st.date_input("🗓️ Até:", datetime.now())
-        cpf_filtro = st.text_input("🆔 Filtrar por CPF")
-
-    query = """
-        SELECT nome, cpf, quarto, data_entrada, data_saida, status, motivo_cancelamento
-        FROM reservas
-        WHERE date(data_entrada) BETWEEN ? AND ?
-    """
-    params = [str(data_inicio), str(data_fim)]
-
-    if nome_filtro:
-        query += " AND nome LIKE ?"
-        params.append(f"%{nome_filtro}%")
-    if cpf_filtro:
-        query += " AND cpf LIKE ?"
-        params.append(f"%{cpf_filtro}%")
-
-    query += " ORDER BY data_entrada DESC"
-    df = pd.read_sql_query(query, conn, params=params)
-
-    st.markdown("---")
-
-    if df.empty:
-        st.warning("⚠️ Nenhuma estadia encontrada com os filtros aplicados.")
-    else:
-        st.success(f"✅ {len(df)} estadia(s) encontrada(s) entre {data_inicio.strftime('%d/%m/%Y')} e {data_fim.strftime('%d/%m/%Y')}.")
-
-        st.markdown("### 📋 Visualização das Reservas")
-
-        # Formatar datas
-        df["data_entrada"] = pd.to_datetime(df["data_entrada"]).dt.strftime("%d/%m/%Y")
-        df["data_saida"] = pd.to_datetime(df["data_saida"]).dt.strftime("%d/%m/%Y")
-
-        # Reorganizar colunas e renomear
-        df = df[["nome", "cpf", "quarto", "data_saida", "data_entrada", "status", "motivo_cancelamento"]]
-        df.columns = ["Nome", "CPF", "Quarto", "Data Saída", "Data Entrada", "Status", "Motivo Cancelamento"]
-
-        # AgGrid interativa
-        gb = GridOptionsBuilder.from_dataframe(df)
-        gb.configure_pagination()
-        gb.configure_side_bar()
-        gb.configure_default_column(groupable=True, value=True, editable=False)
-        grid_options = gb.build()
-
-        AgGrid(df, gridOptions=grid_options, theme="streamlit", height=450, fit_columns_on_grid_load=True)
-
-        # Exportar CSV
-        csv = df.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            label="📥 Baixar histórico em CSV",
-            data=csv,
-            file_name=f"historico_estadias_{data_inicio}_{data_fim}.csv",
-            mime="text/csv"
-        )
-
-# 🔹 3. Consultar detalhes de reservas
-def detalhes_reservas():
-    st.header("🧾 Detalhes de Reservas")
-    busca = st.text_input("🔍 Buscar por CPF ou número do quarto")
-
-    if busca:
-        df = pd.read_sql_query("""
-            SELECT nome, cpf, quarto, data_entrada, data_saida
-            FROM reservas
-            WHERE cpf LIKE ? OR quarto LIKE ?
-            ORDER BY data_entrada DESC
-        """, conn, params=(f"%{busca}%", f"%{busca}%"))
-
-        if df.empty:
-            st.warning("Nenhuma reserva encontrada.")
-        else:
-            st.dataframe(df, use_container_width=True)
-    else:
-        st.info("Digite um CPF ou número do quarto para buscar.")
-
-def reagendar_estadia():
-    st.header("🔁 Reagendar Estadia")
-
-    reservas = cursor.execute("""
-        SELECT id, nome, quarto, data_entrada, data_saida, cpf
-        FROM reservas
-        WHERE status = 'Ativa'
-    """).fetchall()
-
-    if not reservas:
-        st.info("❌ Nenhuma reserva ativa disponível para reagendamento.")
-        return
-
-    opcoes = [f"{r[1]} - Quarto {r[2]} (ID: {r[0]})" for r in reservas]
-    selecao = st.selectbox("📋 Selecione uma reserva para reagendar", opcoes)
-
-    if selecao:
-        reserva_id = int(selecao.split("ID: ")[-1].replace(")", ""))
-        dados = cursor.execute("""
-            SELECT nome, cpf, quarto, data_entrada, data_saida 
-            FROM reservas WHERE id = ?
-        """, (reserva_id,)).fetchone()
-
-        nome, cpf, quarto, antiga_entrada, antiga_saida = dados
-
-        nova_entrada = st.date_input("📅 Novo Check-in", value=pd.to_datetime(antiga_entrada))
-        nova_saida = st.date_input("📅 Novo Check-out", value=pd.to_datetime(antiga_saida))
-        motivo = st.text_area("✏️ Motivo do Reagendamento", max_chars=300)
-
-        if st.button("🔄 Confirmar Reagendamento"):
-            if not motivo.strip():
-                st.warning("⚠️ Por favor, informe o motivo do reagendamento.")
-                return
-
-            # Atualiza reserva antiga com status e motivo
-            cursor.execute("""
-                UPDATE reservas 
-                SET status = ?, motivo_cancelamento = ?
-                WHERE id = ?
-            """, ("Reagendada", motivo, reserva_id))
-
-            # Cria nova reserva como ativa
-            cursor.execute("""
-                INSERT INTO reservas (nome, cpf, data_entrada, data_saida, quarto, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (nome, cpf, str(nova_entrada), str(nova_saida), quarto, "Ativa"))
-
-            conn.commit()
-            st.success(f"✅ Reserva reagendada com sucesso para {nome} no quarto {quarto} de {nova_entrada.strftime('%d/%m/%Y')} a {nova_saida.strftime('%d/%m/%Y')}.")
-
-def cancelar_reserva():
-    st.header("❌ Cancelar Reserva")
-
-    reservas = cursor.execute("""
-        SELECT id, nome, quarto, data_entrada, data_saida
-        FROM reservas
-        WHERE status = 'Ativa'
-    """).fetchall()
-
-    if not reservas:
-        st.info("✅ Nenhuma reserva ativa disponível para cancelamento.")
-        return
-
-    opcoes = [f"{r[1]} - Quarto {r[2]} (ID: {r[0]})" for r in reservas]
-    selecao = st.selectbox("📋 Selecione uma reserva para cancelar", opcoes)
-
-    if selecao:
-        reserva_id = int(selecao.split("ID: ")[-1].replace(")", ""))
-        dados = cursor.execute("SELECT nome, quarto FROM reservas WHERE id = ?", (reserva_id,)).fetchone()
-        nome, quarto = dados
-
-        motivo = st.text_area("✏️ Motivo do Cancelamento", max_chars=300)
-
-        if st.button("🚫 Confirmar Cancelamento"):
-            if not motivo.strip():
-                st.warning("⚠️ Por favor, informe o motivo do cancelamento.")
-                return
-
-            # Atualiza status da reserva para "Cancelada" e salva o motivo
-            cursor.execute("""
-                UPDATE reservas 
-                SET status = ?, motivo_cancelamento = ?
-                WHERE id = ?
-            """, ("Cancelada", motivo, reserva_id))
-
-            # Atualiza o status do quarto para "Livre"
-            cursor.execute("""
-                UPDATE quartos 
-                SET status = 'Livre'
-                WHERE quarto = ?
-            """, (quarto,))
-
-            conn.commit()
-            st.success(f"❌ Reserva cancelada com sucesso. Quarto {quarto} está agora disponível.")
 def mostrar_ocupacao_quartos():
     st.subheader("Ocupação dos Quartos")
 
-    # Padronizar os status antes de exibir
-    mapeamento_status = {
-        "livre": "Livre",
-        "ocupado": "Ocupado",
-        "em arrumacao": "Em Arrumação",
-        "em arrumação": "Em Arrumação",
-        "em limpeza": "Em Limpeza",
-        "bloqueado": "Bloqueado"
-    }
-
-    # Buscar todos os quartos com id e status
-    cursor.execute("SELECT id, status FROM quartos")
-    quartos = cursor.fetchall()
-
-    # Atualiza status no banco para o padrão correto
-    for quarto_id, status in quartos:
-        status_formatado = status.strip().lower()
-        novo_status = mapeamento_status.get(status_formatado)
-        if novo_status and novo_status != status:
-            cursor.execute("UPDATE quartos SET status = ? WHERE id = ?", (novo_status, quarto_id))
-    conn.commit()
-
-    # Buscar dados atualizados
-    cursor.execute("SELECT quarto, status FROM quartos")
-    dados = cursor.fetchall()
+    # O mapa só é refeito quando a tabela quartos muda (versão mantida por gatilhos)
+    quartos_df, fig = _mapa_quartos(versao_tabela(conn, "quartos"))
 
-    if not dados:
+    if quartos_df.empty:
         st.warning("Nenhum quarto cadastrado.")
         return
 
-    # Criar DataFrame atualizado
-    quartos_df = pd.DataFrame(dados, columns=["Quarto", "Status"])
-
-    # Configurações de mapa
-    andares = 8
-    quartos_por_andar = 10
-
-    # Mapeamento cores status
-    status_dict = {
-        "Livre": "green",
-        "Ocupado": "red",
-        "Em Arrumação": "yellow",
-        "Em Limpeza": "orange",
-        "Bloqueado": "gray"
-    }
-
-    fig = go.Figure()
+    st.plotly_chart(fig)
 
-    for _, row in quartos_df.iterrows():
-        andar, numero_quarto = row["Quarto"].split("-")
-        x = int(andar) - 1
-        y = int(numero_quarto) - 1
-        cor = status_dict.get(row["Status"], "blue")
+    # Selecionar quarto e mostrar detalhes
+    quarto_selecionado = st.selectbox("Selecione um Quarto para Detalhes", quartos_df["Quarto"].tolist())
+    if quarto_selecionado:
+        quarto_info = quartos_df[quartos_df["Quarto"] == quarto_selecionado].iloc[0]
+        st.write(f"Detalhes do Quarto {quarto_selecionado}:")
+        st.write(f"Status: {quarto_info['Status']}")
 
-        fig.add_trace(go.Scatter(
-            x=[x],
-            y=[y],
-            mode='markers',
-            marker=dict(size=40, color=cor, line=dict(width=2, color='black')),
-            text=f"Quarto {row['Quarto']} - {row['Status']}",
-            hoverinfo="text",
-            name=row['Quarto']
-        ))
+# Cores do mapa de ocupação por status
+CORES_STATUS = {
+    "Livre": "green",
+    "Ocupado": "red",
+    "Em Uso": "blue",
+    "Em Arrumação": "yellow",
+    "Em Limpeza": "orange",
+    "Em Manutenção": "purple",
+    "Bloqueado": "gray"
+}
+
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _mapa_quartos(versao):
+    # Um único trace com todos os quartos: posições, cores e textos em arrays.
+    # ``versao`` é a versão da tabela quartos e serve apenas de chave do cache.
+    quartos_df = pd.read_sql_query("SELECT quarto AS Quarto, status AS Status FROM quartos", conn)
+    if quartos_df.empty:
+        return quartos_df, None
+
+    partes = quartos_df["Quarto"].str.split("-", n=1, expand=True).reindex(columns=[0, 1])
+    andar = pd.to_numeric(partes[0], errors="coerce").to_numpy()
+    numero = pd.to_numeric(partes[1], errors="coerce").to_numpy()
+    validos = ~(np.isnan(andar) | np.isnan(numero))
+    x = andar[validos].astype(int) - 1
+    y = numero[validos].astype(int) - 1
+    visiveis = quartos_df[validos]
+
+    andares = int(x.max()) + 1 if len(x) else 1
+    quartos_por_andar = int(y.max()) + 1 if len(y) else 1
+    tamanho = max(6, min(35, 560 // max(andares, quartos_por_andar)))
+
+    fig = go.Figure(go.Scatter(
+        x=x,
+        y=y,
+        mode='markers',
+        marker=dict(
+            size=tamanho,
+            color=visiveis["Status"].map(CORES_STATUS).to_numpy(),
+            line=dict(width=2 if tamanho >= 20 else 1, color='black')
+        ),
+        text=("Quarto " + visiveis["Quarto"] + " - " + visiveis["Status"]).to_numpy(),
+        hoverinfo="text"
+    ))
 
+    # Com muitos andares/quartos os rótulos são espaçados para não sobrepor
+    passo_x = max(1, andares // 20)
+    passo_y = max(1, quartos_por_andar // 20)
     fig.update_layout(
         title="Mapa de Ocupação dos Quartos",
         xaxis=dict(
             tickmode='array',
-            tickvals=list(range(andares)),
-            ticktext=[f"Andar {i+1}" for i in range(andares)],
+            tickvals=list(range(0, andares, passo_x)),
+            ticktext=[f"Andar {i+1}" for i in range(0, andares, passo_x)],
             title="Andares",
             autorange="reversed"
         ),
         yaxis=dict(
             tickmode='array',
-            tickvals=list(range(quartos_por_andar)),
-            ticktext=[f"Quarto {i+1}" for i in range(quartos_por_andar)],
+            tickvals=list(range(0, quartos_por_andar, passo_y)),
+            ticktext=[f"Quarto {i+1}" for i in range(0, quartos_por_andar, passo_y)],
             title="Quartos"
         ),
         showlegend=False,
         plot_bgcolor="white",
-        height=600,
-        width=900,
+        height=max(600, quartos_por_andar * (tamanho + 6)),
+        width=max(900, andares * (tamanho + 6)),
         hoverlabel=dict(bgcolor="white", font_size=13)
     )
+    return quartos_df, fig
 
-    fig.update_traces(marker=dict(size=35))
-    st.plotly_chart(fig)
-
-    # Selecionar quarto e mostrar detalhes
-    quarto_selecionado = st.selectbox("Selecione um Quarto para Detalhes", quartos_df["Quarto"].tolist())
-    if quarto_selecionado:
-        quarto_info = quartos_df[quartos_df["Quarto"] == quarto_selecionado].iloc[0]
-        st.write(f"Detalhes do Quarto {quarto_selecionado}:")
-        st.write(f"Status: {quarto_info['Status']}")
 
 def atualizar_status_quarto(quarto):
     cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Ocupado", quarto))
@@ -1218,9 +931,9 @@ def cadastrar_hospede():
 
         if cadastrar:
             cursor.execute('''
-                INSERT INTO hospedes (nome, documento, telefone, cpf, placa, data_nascimento)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (nome, documento, telefone, cpf, placa, data))
+                INSERT INTO hospedes (nome, documento, telefone, cpf, cpf_digitos, placa, data_nascimento)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (nome, documento, telefone, cpf, somente_digitos(cpf), placa, data))
             conn.commit()
             st.success(f"🛎️ Hóspede {nome} cadastrado com sucesso ✅")
 
@@ -1237,70 +950,115 @@ def historico_estadias():
         data_fim = st.date_input("🗓️ Até:", datetime.now())
         cpf_filtro = st.text_input("🆔 Filtrar por CPF")
 
-    query = """
-        SELECT nome, cpf, quarto, data_entrada, data_saida, status, motivo_cancelamento
-        FROM reservas
-        WHERE date(data_entrada) BETWEEN ? AND ?
-    """
+    # Filtros pelos índices: período em data_entrada, CPF como prefixo de cpf_digitos
+    filtros = ""
     params = [str(data_inicio), str(data_fim)]
 
     if nome_filtro:
-        query += " AND nome LIKE ?"
+        filtros += " AND nome LIKE ?"
         params.append(f"%{nome_filtro}%")
-    if cpf_filtro:
-        query += " AND cpf LIKE ?"
-        params.append(f"%{cpf_filtro}%")
-
-    query += " ORDER BY data_entrada DESC"
-    df = pd.read_sql_query(query, conn, params=params)
+    cpf_digitos = somente_digitos(cpf_filtro)
+    if cpf_digitos:
+        filtros += " AND cpf_digitos >= ? AND cpf_digitos < ?"
+        params += [cpf_digitos, cpf_digitos + ":"]  # ":" vem logo depois de "9"
 
     st.markdown("---")
 
+    df, total = paginar_reservas("paginas_historico", f"""
+        SELECT id, nome, cpf, quarto, data_entrada, data_saida, status, motivo_cancelamento
+        FROM reservas
+        WHERE data_entrada >= ? AND data_entrada < date(?, '+1 day') {filtros} {{pagina}}
+        ORDER BY data_entrada DESC, id DESC LIMIT ?
+    """, f"""
+        SELECT COUNT(*) FROM reservas
+        WHERE data_entrada >= ? AND data_entrada < date(?, '+1 day') {filtros}
+    """, params)
+
     if df.empty:
         st.warning("⚠️ Nenhuma estadia encontrada com os filtros aplicados.")
     else:
-        st.success(f"✅ {len(df)} estadia(s) encontrada(s) entre {data_inicio.strftime('%d/%m/%Y')} e {data_fim.strftime('%d/%m/%Y')}.")
+        st.success(f"✅ {total} estadia(s) encontrada(s) entre {data_inicio.strftime('%d/%m/%Y')} e {data_fim.strftime('%d/%m/%Y')}.")
 
         st.markdown("### 📋 Visualização das Reservas")
 
-        # Formatar datas
-        df["data_entrada"] = pd.to_datetime(df["data_entrada"]).dt.strftime("%d/%m/%Y")
-        df["data_saida"] = pd.to_datetime(df["data_saida"]).dt.strftime("%d/%m/%Y")
-
-        # Reorganizar colunas e renomear
-        df = df[["nome", "cpf", "quarto", "data_saida", "data_entrada", "status", "motivo_cancelamento"]]
-        df.columns = ["Nome", "CPF", "Quarto", "Data Saída", "Data Entrada", "Status", "Motivo Cancelamento"]
+        df = _formatar_historico(df)
 
-        # AgGrid interativa
+        # AgGrid interativa (recebe só a página atual)
         gb = GridOptionsBuilder.from_dataframe(df)
-        gb.configure_pagination()
         gb.configure_side_bar()
         gb.configure_default_column(groupable=True, value=True, editable=False)
         grid_options = gb.build()
 
         AgGrid(df, gridOptions=grid_options, theme="streamlit", height=450, fit_columns_on_grid_load=True)
 
-        # Exportar CSV
-        csv = df.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            label="📥 Baixar histórico em CSV",
-            data=csv,
-            file_name=f"historico_estadias_{data_inicio}_{data_fim}.csv",
-            mime="text/csv"
-        )
+        # Exportação do histórico completo do filtro, lido e gravado em lotes
+        col1, col2 = st.columns([1, 2])
+        formato = col1.radio("📦 Formato", ["CSV", "Parquet"], horizontal=True)
+        if col2.button("📄 Exportar histórico completo"):
+            tipo, extensao = FORMATOS[formato.lower()]
+            barra = st.progress(0.0, text="Exportando...")
+
+            def progresso(feitas):
+                barra.progress(min(feitas / total, 1.0), text=f"{feitas} de {total} linha(s)")
+
+            with tempfile.NamedTemporaryFile(suffix=extensao, delete=False) as temporario:
+                caminho = temporario.name
+            try:
+                linhas = exportar(
+                    conn, f"""
+                        SELECT nome, cpf, quarto, data_entrada, data_saida, status, motivo_cancelamento
+                        FROM reservas
+                        WHERE data_entrada >= ? AND data_entrada < date(?, '+1 day') {filtros}
+                        ORDER BY data_entrada DESC, id DESC
+                    """, params, caminho, formato=formato.lower(),
+                    # CSV para leitura na planilha; Parquet com datas tipadas e nomes das colunas do banco
+                    transformar=_formatar_historico if formato == "CSV" else _datas_historico,
+                    progresso=progresso,
+                )
+                barra.progress(1.0, text=f"✅ {linhas} linha(s) exportada(s).")
+                with open(caminho, "rb") as arquivo:
+                    st.download_button(
+                        label=f"📥 Baixar histórico em {formato}",
+                        data=arquivo,
+                        file_name=f"historico_estadias_{data_inicio}_{data_fim}{extensao}",
+                        mime=tipo
+                    )
+            finally:
+                os.remove(caminho)
+
+
+def _datas_iso(serie):
+    # Datas ISO gravadas pela migração 5; texto legado que não converte vira
+    # vazio em vez de interromper a exportação no meio de um lote
+    return pd.to_datetime(serie, format="%Y-%m-%d", errors="coerce")
+
+
+def _datas_historico(df):
+    df["data_entrada"] = _datas_iso(df["data_entrada"])
+    df["data_saida"] = _datas_iso(df["data_saida"])
+    return df
+
+
+def _formatar_historico(df):
+    # Datas no formato brasileiro e colunas na ordem/nomes da tela
+    df["data_entrada"] = _datas_iso(df["data_entrada"]).dt.strftime("%d/%m/%Y")
+    df["data_saida"] = _datas_iso(df["data_saida"]).dt.strftime("%d/%m/%Y")
+    df = df[["nome", "cpf", "quarto", "data_saida", "data_entrada", "status", "motivo_cancelamento"]]
+    df.columns = ["Nome", "CPF", "Quarto", "Data Saída", "Data Entrada", "Status", "Motivo Cancelamento"]
+    return df
 
 # 🔹 3. Consultar detalhes de reservas
 def detalhes_reservas():
     st.header("🧾 Detalhes de Reservas")
-    busca = st.text_input("🔍 Buscar por CPF ou número do quarto")
+    busca = st.text_input("🔍 Buscar por CPF ou número do quarto").strip()
 
     if busca:
-        df = pd.read_sql_query("""
+        df = ler_df("""
             SELECT nome, cpf, quarto, data_entrada, data_saida
             FROM reservas
-            WHERE cpf LIKE ? OR quarto LIKE ?
+            WHERE cpf_digitos = ? OR quarto = ?
             ORDER BY data_entrada DESC
-        """, conn, params=(f"%{busca}%", f"%{busca}%"))
+        """, (somente_digitos(busca), busca))
 
         if df.empty:
             st.warning("Nenhuma reserva encontrada.")
@@ -1312,11 +1070,11 @@ def detalhes_reservas():
 def reagendar_estadia():
     st.header("🔁 Reagendar Estadia")
 
-    reservas = cursor.execute("""
+    reservas = ler("""
         SELECT id, nome, quarto, data_entrada, data_saida, cpf
         FROM reservas
         WHERE status = 'Ativa'
-    """).fetchall()
+    """)
 
     if not reservas:
         st.info("❌ Nenhuma reserva ativa disponível para reagendamento.")
@@ -1328,11 +1086,12 @@ def reagendar_estadia():
     if selecao:
         reserva_id = int(selecao.split("ID: ")[-1].replace(")", ""))
         dados = cursor.execute("""
-            SELECT nome, cpf, quarto, data_entrada, data_saida 
+            SELECT nome, cpf, quarto, data_entrada, data_saida, valor, COALESCE(valor_centavos, 0),
+                dia_entrada, dia_saida
             FROM reservas WHERE id = ?
         """, (reserva_id,)).fetchone()
 
-        nome, cpf, quarto, antiga_entrada, antiga_saida = dados
+        nome, cpf, quarto, antiga_entrada, antiga_saida, valor, valor_centavos, dia_entrada, dia_saida = dados
 
         nova_entrada = st.date_input("📅 Novo Check-in", value=pd.to_datetime(antiga_entrada))
         nova_saida = st.date_input("📅 Novo Check-out", value=pd.to_datetime(antiga_saida))
@@ -1343,30 +1102,81 @@ def reagendar_estadia():
                 st.warning("⚠️ Por favor, informe o motivo do reagendamento.")
                 return
 
-            # Atualiza reserva antiga com status e motivo
-            cursor.execute("""
-                UPDATE reservas 
-                SET status = ?, motivo_cancelamento = ?
-                WHERE id = ?
-            """, ("Reagendada", motivo, reserva_id))
+            try:
+                campos = campos_reserva(nova_entrada, nova_saida, valor_centavos / 100)
+            except ValueError as e:
+                st.warning(f"⚠️ {e}")
+                return
 
-            # Cria nova reserva como ativa
-            cursor.execute("""
-                INSERT INTO reservas (nome, cpf, data_entrada, data_saida, quarto, status)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (nome, cpf, str(nova_entrada), str(nova_saida), quarto, "Ativa"))
+            # O novo período não pode colidir com outras reservas do quarto
+            mapa = obter_disponibilidade()
+            propria = (dia_entrada, dia_saida) if dia_entrada is not None and dia_saida is not None else None
+            if not mapa.livre(quarto, campos["dia_entrada"], campos["dia_saida"], ignorar=propria):
+                st.warning(f"⚠️ O quarto {quarto} já está reservado entre {nova_entrada.strftime('%d/%m/%Y')} e {nova_saida.strftime('%d/%m/%Y')}.")
+                return
+
+            # Situação atual do quarto: muda só se hoje entra ou sai do período da estadia
+            hoje = numero_dia(datetime.today())
+            ocupava_hoje = propria is not None and dia_entrada <= hoje < dia_saida
+            ocupa_hoje = campos["dia_entrada"] <= hoje < campos["dia_saida"]
+
+            try:
+                with mapa.alterando_reservas(conn) as alteracoes:
+                    # Confere de novo já com o lock: outra sessão pode ter reservado o quarto
+                    mapa.garantir_livre(conn, quarto, campos["dia_entrada"], campos["dia_saida"], ignorar=propria)
+
+                    if ocupa_hoje and not ocupava_hoje:
+                        status_quarto = cursor.execute(
+                            "SELECT status FROM quartos WHERE quarto = ?", (quarto,)
+                        ).fetchone()[0]
+                        if status_quarto in STATUS_QUARTO_INDISPONIVEL:
+                            raise QuartoIndisponivel(status_quarto)
+
+                    # Atualiza reserva antiga com status e motivo
+                    cursor.execute("""
+                        UPDATE reservas 
+                        SET status = ?, motivo_cancelamento = ?
+                        WHERE id = ?
+                    """, ("Reagendada", motivo, reserva_id))
+                    atualizar_noites(conn, reserva_id)
+                    if propria:
+                        alteracoes.append((quarto, dia_entrada, dia_saida, -1))
+
+                    # Cria nova reserva como ativa, mantendo a diária da original
+                    cursor.execute("""
+                        INSERT INTO reservas (nome, cpf, cpf_digitos, data_entrada, data_saida, quarto, status,
+                                              valor, dia_entrada, dia_saida, valor_centavos)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """, (nome, cpf, somente_digitos(cpf), campos["data_entrada"], campos["data_saida"], quarto, "Ativa",
+                          valor, campos["dia_entrada"], campos["dia_saida"], campos["valor_centavos"]))
+                    atualizar_noites(conn, cursor.lastrowid)
+                    alteracoes.append((quarto, campos["dia_entrada"], campos["dia_saida"], 1))
+
+                    # Mesmas gravações do agendamento (entrada hoje) e do cancelamento
+                    if ocupa_hoje and not ocupava_hoje:
+                        cursor.execute("UPDATE quartos SET status = ? WHERE quarto = ?", ("Ocupado", quarto))
+                    elif ocupava_hoje and not ocupa_hoje:
+                        cursor.execute(
+                            "UPDATE quartos SET status = 'Livre' WHERE quarto = ? AND status IN ('Ocupado', 'Em Uso')",
+                            (quarto,)
+                        )
+            except QuartoOcupado:
+                st.warning(f"⚠️ O quarto {quarto} acabou de ser reservado por outra sessão no novo período.")
+                return
+            except QuartoIndisponivel as e:
+                st.warning(f"⚠️ O quarto {quarto} está atualmente com status: {e.status}.")
+                return
 
-            conn.commit()
             st.success(f"✅ Reserva reagendada com sucesso para {nome} no quarto {quarto} de {nova_entrada.strftime('%d/%m/%Y')} a {nova_saida.strftime('%d/%m/%Y')}.")
 
 def cancelar_reserva():
     st.header("❌ Cancelar Reserva")
 
-    reservas = cursor.execute("""
+    reservas = ler("""
         SELECT id, nome, quarto, data_entrada, data_saida
         FROM reservas
         WHERE status = 'Ativa'
-    """).fetchall()
+    """)
 
     if not reservas:
         st.info("✅ Nenhuma reserva ativa disponível para cancelamento.")
@@ -1377,8 +1187,8 @@ def cancelar_reserva():
 
     if selecao:
         reserva_id = int(selecao.split("ID: ")[-1].replace(")", ""))
-        dados = cursor.execute("SELECT nome, quarto FROM reservas WHERE id = ?", (reserva_id,)).fetchone()
-        nome, quarto = dados
+        dados = cursor.execute("SELECT nome, quarto, dia_entrada, dia_saida FROM reservas WHERE id = ?", (reserva_id,)).fetchone()
+        nome, quarto, dia_entrada, dia_saida = dados
 
         motivo = st.text_area("✏️ Motivo do Cancelamento", max_chars=300)
 
@@ -1387,21 +1197,25 @@ def cancelar_reserva():
                 st.warning("⚠️ Por favor, informe o motivo do cancelamento.")
                 return
 
-            # Atualiza status da reserva para "Cancelada" e salva o motivo
-            cursor.execute("""
-                UPDATE reservas 
-                SET status = ?, motivo_cancelamento = ?
-                WHERE id = ?
-            """, ("Cancelada", motivo, reserva_id))
+            with obter_disponibilidade().alterando_reservas(conn) as alteracoes:
+                # Atualiza status da reserva para "Cancelada" e salva o motivo
+                cursor.execute("""
+                    UPDATE reservas 
+                    SET status = ?, motivo_cancelamento = ?
+                    WHERE id = ?
+                """, ("Cancelada", motivo, reserva_id))
+                atualizar_noites(conn, reserva_id)
+                if dia_entrada is not None and dia_saida is not None:
+                    alteracoes.append((quarto, dia_entrada, dia_saida, -1))
 
-            # Atualiza o status do quarto para "Livre"
-            cursor.execute("""
-                UPDATE quartos 
-                SET status = 'Livre'
-                WHERE quarto = ?
-            """, (quarto,))
+                # Atualiza o status do quarto para "Livre" (reservas futuras não ocupam o quarto hoje)
+                if dia_entrada is None or dia_entrada <= numero_dia(datetime.today()):
+                    cursor.execute("""
+                        UPDATE quartos 
+                        SET status = 'Livre'
+                        WHERE quarto = ?
+                    """, (quarto,))
 
-            conn.commit()
             st.success(f"❌ Reserva cancelada com sucesso. Quarto {quarto} está agora disponível.")
 
 def arrumacao():
@@ -1424,19 +1238,18 @@ def arrumacao():
     st.markdown(f"### Modo selecionado: **{modo}**")
 
     if modo == "Nova tarefa":
-        cursor.execute('''
+        quartos_disponiveis = [row[0] for row in ler('''
             SELECT quarto FROM quartos 
             WHERE quarto NOT IN (
                 SELECT quarto FROM arrumacoes WHERE status = 'Pendente'
             )
-        ''')
-        quartos_disponiveis = [row[0] for row in cursor.fetchall()]
+        ''')]
 
         if not quartos_disponiveis:
             st.warning("Todos os quartos já possuem tarefas pendentes.")
             return
 
-        funcionarios = cursor.execute("SELECT nome FROM funcionarios").fetchall()
+        funcionarios = ler("SELECT nome FROM funcionarios")
         lista_funcionarios = ["Selecione um funcionário..."] + [f[0] for f in funcionarios]
 
         with st.form(key="form_arrumacao", clear_on_submit=True):
@@ -1486,8 +1299,7 @@ def arrumacao():
     # ------------------------- CONCLUIR TAREFA -----------------------------------
     elif modo == "Concluir tarefa":
 
-        cursor.execute("SELECT quarto, funcao FROM arrumacoes WHERE status = 'Pendente'")
-        tarefas_pendentes = cursor.fetchall()
+        tarefas_pendentes = ler("SELECT quarto, funcao FROM arrumacoes WHERE status = 'Pendente'")
         if not tarefas_pendentes:
             st.info("Nenhuma tarefa pendente.")
             return
@@ -1505,23 +1317,22 @@ def arrumacao():
         else:
             st.info("Nenhum item registrado ainda.")
 
-    # ---------------- FORM 1: ADICIONAR ITENS USADOS --------------------------------
-        with st.form("form_saida_itens", clear_on_submit=True):
-
-            tarefa_selecionada = st.selectbox("🧾 Selecione uma tarefa", tarefas_display)
+    # ---------------- ADICIONAR ITENS USADOS ----------------------------------------
+        # Fora de formulário: trocar a categoria precisa recarregar a lista de produtos
+        tarefa_selecionada = st.selectbox("🧾 Selecione uma tarefa", tarefas_display)
 
         # Carregar categorias
-        categorias = [row[0] for row in cursor.execute("SELECT DISTINCT categoria FROM estoque").fetchall()]
+        categorias = [row[0] for row in ler("SELECT DISTINCT categoria FROM estoque")]
         categoria_sel = st.selectbox("📂 Categoria", ["Selecionar Categoria..."] + categorias)
 
         nome_sel = None
         produto_dict = {}
 
         if categoria_sel != "Selecionar Categoria...":
-            produtos = cursor.execute(
+            produtos = ler(
                 "SELECT id, nome, quantidade FROM estoque WHERE categoria = ? AND quantidade > 0",
                 (categoria_sel,)
-            ).fetchall()
+            )
 
             if produtos:
                 produto_dict = {nome: (pid, qtd) for pid, nome, qtd in produtos}
@@ -1535,9 +1346,7 @@ def arrumacao():
             produto_id, estoque_atual = produto_dict[nome_sel]
             qtd_saida = st.number_input("🔻 Quantidade usada", min_value=1, max_value=estoque_atual, value=1)
 
-        registrar_item = st.form_submit_button("📤 Registrar item usado")
-
-        if registrar_item:
+        if st.button("📤 Registrar item usado"):
             if nome_sel and nome_sel != "Selecionar Produto...":
                 st.session_state.itens_usados.append({
                     "id": produto_id,
@@ -1548,12 +1357,11 @@ def arrumacao():
             else:
                 st.warning("Selecione um item válido.")
 
-    # ---------------- FORM 2: CONCLUIR TAREFA ---------------------------------------
-    with st.form("form_concluir_final", clear_on_submit=True):
-
-        tempo_gasto = st.text_input("🕒 Tempo gasto (ex: 00:50)")
-        observacao_final = st.text_area("📋 Observação (se necessário)")
-        concluir = st.form_submit_button("✅ Concluir tarefa")
+    # ---------------- FORM: CONCLUIR TAREFA ----------------------------------------
+        with st.form("form_concluir_final", clear_on_submit=True):
+            tempo_gasto = st.text_input("🕒 Tempo gasto (ex: 00:50)")
+            observacao_final = st.text_area("📋 Observação (se necessário)")
+            concluir = st.form_submit_button("✅ Concluir tarefa")
 
         if concluir:
 
@@ -1583,97 +1391,58 @@ def arrumacao():
             if t_gasto > t_prev and not observacao_final.strip():
                 st.warning("⚠️ Tempo maior que o previsto — necessária observação.")
                 return
-            # ------------------------------------------
-# BAIXAR ESTOQUE E REGISTRAR USO DOS ITENS
-# ------------------------------------------
-    data_hoje = datetime.now().strftime("%Y-%m-%d")
-    hora_agora = datetime.now().strftime("%H:%M:%S")
-
-# Recupera o ID da arrumação concluída
-    cursor.execute("""
-        SELECT id FROM arrumacoes
-        WHERE quarto = ? AND funcao = ? AND status = 'Pendente'
-    """, (quarto_sel, funcao_sel))
-    arrumacao_id = cursor.fetchone()[0]
-
-    for item in st.session_state.itens_usados:
-        produto_id = item["id"]
-        quantidade_usada = item["qtd"]
-
-    # Obter quantidade atual e valor unitário
-        cursor.execute("""
-            SELECT quantidade, valor_unitario
-            FROM estoque
-            WHERE id = ?
-        """, (produto_id,))
-        quantidade_atual, valor_unitario = cursor.fetchone()
-
-    # Nova quantidade
-        nova_qtd = quantidade_atual - quantidade_usada
-
-    # Baixar estoque
-        cursor.execute("""
-            UPDATE estoque 
-            SET quantidade = ?
-            WHERE id = ?
-        """, (nova_qtd, produto_id))
-
-    # Registrar movimentação (SAÍDA)
-        valor_total = quantidade_usada * valor_unitario
-        cursor.execute("""
-            INSERT INTO movimentacoes_estoque 
-            (produto_id, tipo, quantidade, data, hora, valor_total, observacao)
-            VALUES (?, 'Saída', ?, ?, ?, ?, ?)
-        """, (
-            produto_id,
-            quantidade_usada,
-            data_hoje,
-            hora_agora,
-            valor_total,
-            f"Uso em arrumação do quarto {quarto_sel}"
-        ))
-
-    # Registrar item vinculado à arrumação
-        cursor.execute("""
-        INSERT INTO arrumacoes_itens
-            (arrumacao_id, produto_id, quantidade, valor_unitario, valor_total, data, hora)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            arrumacao_id,
-            produto_id,
-            quantidade_usada,
-            valor_unitario,
-            valor_total,
-            data_hoje,
-            hora_agora
-        ))
-
-            # ---------------- BAIXAR ESTOQUE --------------------
-        for item in st.session_state.itens_usados:
-                cursor.execute("""
-                    UPDATE estoque 
-                    SET quantidade = quantidade - ?
-                    WHERE id = ?
-                """, (item["qtd"], item["id"]))
 
-            # Limpa lista após salvar
-        st.session_state.itens_usados = []
+            # ---------------- BAIXAR ESTOQUE E REGISTRAR USO DOS ITENS ----------------
+            # Tudo numa transação: se faltar saldo de algum item nada é gravado
+            data_hoje = datetime.now().strftime("%Y-%m-%d")
+            hora_agora = datetime.now().strftime("%H:%M:%S")
 
-            # Atualiza tarefa
-        cursor.execute("""
-                UPDATE arrumacoes SET status = ?, tempo_gasto = ?, observacao = ?
-                WHERE quarto = ? AND funcao = ? AND status = 'Pendente'
-            """, ("Concluído", tempo_gasto, observacao_final, quarto_sel, funcao_sel))
+            try:
+                with movimentando_estoque(conn):
+                    arrumacao_id = cursor.execute("""
+                        SELECT id FROM arrumacoes
+                        WHERE quarto = ? AND funcao = ? AND status = 'Pendente'
+                    """, (quarto_sel, funcao_sel)).fetchone()[0]
+
+                    # Todos os itens em conjunto: saldos e preços numa leitura, baixas e
+                    # movimentações em executemany
+                    itens = st.session_state.itens_usados
+                    valores = baixar_lote(
+                        conn, "estoque", [(item["id"], item["qtd"]) for item in itens],
+                        observacao=f"Uso em arrumação do quarto {quarto_sel}", data=data_hoje, hora=hora_agora
+                    )
 
-            # Libera o quarto
-        cursor.execute("UPDATE quartos SET status = 'Livre' WHERE quarto = ?", (quarto_sel,))
-        conn.commit()
+                    # Registrar itens vinculados à arrumação
+                    cursor.executemany("""
+                        INSERT INTO arrumacoes_itens
+                        (arrumacao_id, produto_id, quantidade, valor_unitario, valor_total, data, hora)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, [
+                        (arrumacao_id, item["id"], item["qtd"], valor_unitario, valor_total, data_hoje, hora_agora)
+                        for item, (valor_unitario, valor_total) in zip(itens, valores)
+                    ])
+
+                    # Atualiza tarefa
+                    cursor.execute("""
+                        UPDATE arrumacoes SET status = ?, tempo_gasto = ?, observacao = ?
+                        WHERE quarto = ? AND funcao = ? AND status = 'Pendente'
+                    """, ("Concluído", tempo_gasto, observacao_final, quarto_sel, funcao_sel))
+
+                    # Libera o quarto
+                    cursor.execute("UPDATE quartos SET status = 'Livre' WHERE quarto = ?", (quarto_sel,))
+            except EstoqueInsuficiente as e:
+                st.warning(f"⚠️ {e} Ajuste os itens usados e conclua novamente.")
+                return
+
+            # Limpa lista após salvar
+            st.session_state.itens_usados = []
+            st.success(f"✅ Tarefa de {funcao_sel} concluída no quarto {quarto_sel}.")
 
-    df = pd.read_sql_query("""
+    df = ler_df("""
         SELECT quarto, funcao, nome, status, data, hora, tempo_previsto, tempo_gasto, observacao 
         FROM arrumacoes 
         ORDER BY id DESC
-    """, conn)
+    """)
 
     if df.empty:
         st.info("Nenhum registro no histórico.")
@@ -1732,9 +1501,8 @@ def mensagens():
     st.subheader("📋 Comunicados Enviados")
 
     # Exibir comunicados
-    df = pd.read_sql_query(
-        "SELECT id, mensagem, destinatario, data, hora FROM comunicados ORDER BY data DESC, hora DESC",
-        conn
+    df = ler_df(
+        "SELECT id, mensagem, destinatario, data, hora FROM comunicados ORDER BY data DESC, hora DESC"
     )
 
     if df.empty:
@@ -1759,29 +1527,26 @@ def mensagens():
                 
 def emitir_estadia():
     st.title("📁 Emissão de Comprovante de Estadia")
-    cpf = st.text_input("Digite o CPF do hóspede para gerar comprovante:").replace(".", "").replace("-", "").strip()
+    cpf = somente_digitos(st.text_input("Digite o CPF do hóspede para gerar comprovante:"))
 
     if cpf:
-        df = pd.read_sql_query("""
-            SELECT id, nome, REPLACE(REPLACE(REPLACE(cpf, '.', ''), '-', ''), ' ', '') as cpf,
-                quarto, data_entrada, data_saida, valor
+        df = ler_df("""
+            SELECT id, nome, cpf_digitos as cpf, quarto, dia_entrada, dia_saida,
+                COALESCE(valor_centavos, 0) AS valor_centavos
             FROM reservas
-            WHERE REPLACE(REPLACE(REPLACE(cpf, '.', ''), '-', ''), ' ', '') = ?
+            WHERE cpf_digitos = ?
             AND status = 'Ativa'
-            ORDER BY data_entrada DESC
-        """, conn, params=(cpf,))
+            AND dia_entrada IS NOT NULL AND dia_saida IS NOT NULL
+            ORDER BY dia_entrada DESC
+        """, (cpf,))
 
         if df.empty:
             st.warning("⚠️ Nenhuma estadia encontrada para este CPF.")
             return
 
-        df["data_entrada"] = pd.to_datetime(df["data_entrada"], errors="coerce")
-        df["data_saida"] = pd.to_datetime(df["data_saida"], errors="coerce")
-        df = df.dropna(subset=["data_entrada", "data_saida"])
-
-        df["valor"] = pd.to_numeric(df["valor"], errors="coerce").fillna(0.0)
-        df["dias"] = (df["data_saida"] - df["data_entrada"]).dt.days.clip(lower=1)
-        df["total_estadia"] = df["dias"] * df["valor"]
+        # Datas já vêm tipadas do banco: conversão vetorizada, sem parse de texto
+        df["data_entrada"] = pd.to_datetime(df["dia_entrada"].to_numpy(), unit="D")
+        df["data_saida"] = pd.to_datetime(df["dia_saida"].to_numpy(), unit="D")
 
         opcoes = df.apply(
             lambda row: f"{row['nome']} - Quarto {row['quarto']} ({row['data_entrada'].strftime('%d/%m/%Y')} a {row['data_saida'].strftime('%d/%m/%Y')})",
@@ -1793,73 +1558,100 @@ def emitir_estadia():
         if selecionado:
             index = opcoes.index(selecionado)
             reserva = df.iloc[index]
-
-            nome = reserva["nome"]
-            quarto = reserva["quarto"]
-            entrada = reserva["data_entrada"]
-            saida = reserva["data_saida"]
-            valor_diaria = float(reserva["valor"])
-            dias = reserva["dias"]
-            valor_total = reserva["total_estadia"]
-            hoje = datetime.now().strftime("%d/%m/%Y %H:%M")
-            codigo_autenticacao = f"HTL-{cpf[-4:]}-{entrada.strftime('%d%m')}{saida.strftime('%d%m')}"
+            dados = dados_comprovante(reserva["nome"], cpf, reserva["quarto"], reserva["dia_entrada"],
+                                      reserva["dia_saida"], reserva["valor_centavos"])
+            dias = dados["dias"]
 
             st.success("✅ Estadia selecionada!")
 
             st.markdown(f"""
-            **Nome:** {nome}  
+            **Nome:** {dados['nome']}  
             **CPF:** {cpf}  
-            **Quarto:** {quarto}  
-            **Check-in:** {entrada.strftime('%d/%m/%Y')}  
-            **Check-out:** {saida.strftime('%d/%m/%Y')}  
+            **Quarto:** {dados['quarto']}  
+            **Check-in:** {dados['entrada']}  
+            **Check-out:** {dados['saida']}  
             **Duração:** {dias} {'dia' if dias == 1 else 'dias'}  
-            **Valor da Diária:** R$ {valor_diaria:.2f}  
-            **Valor Total:** R$ {valor_total:.2f}  
-            **Código de Autenticação:** `{codigo_autenticacao}`  
+            **Valor da Diária:** R$ {dados['valor_diaria']:.2f}  
+            **Valor Total:** R$ {dados['valor_total']:.2f}  
+            **Código de Autenticação:** `{dados['codigo_autenticacao']}`  
             """)
 
-            if st.button("📄 Gerar PDF do Comprovante"):
-                qr_img = qrcode.make(f"https://meuhotel.com/comprovante/{codigo_autenticacao}")
-                qr_buffer = io.BytesIO()
-                qr_img.save(qr_buffer)
-                qr_buffer.seek(0)
-
-                buffer = io.BytesIO()
-                doc = SimpleDocTemplate(buffer, pagesize=A4)
-                styles = getSampleStyleSheet()
-
-                conteudo = [
-                    Paragraph("🏨 Hotel Pousada do Sol", styles['Title']),
-                    Spacer(1, 12),
-                    Paragraph("📑 COMPROVANTE DE ESTADIA", styles['Heading2']),
-                    Spacer(1, 20),
-                    Paragraph(f"<b>Nome do Hóspede:</b> {nome}", styles['Normal']),
-                    Paragraph(f"<b>CPF:</b> {cpf}", styles['Normal']),
-                    Paragraph(f"<b>Quarto:</b> {quarto}", styles['Normal']),
-                    Paragraph(f"<b>Check-in:</b> {entrada.strftime('%d/%m/%Y')}", styles['Normal']),
-                    Paragraph(f"<b>Check-out:</b> {saida.strftime('%d/%m/%Y')}", styles['Normal']),
-                    Paragraph(f"<b>Duração:</b> {dias} {'dia' if dias == 1 else 'dias'}", styles['Normal']),
-                    Paragraph(f"<b>Valor da Diária:</b> R$ {valor_diaria:.2f}", styles['Normal']),
-                    Paragraph(f"<b>Valor Total:</b> R$ {valor_total:.2f}", styles['Normal']),
-                    Paragraph(f"<b>Código de Autenticação:</b> {codigo_autenticacao}", styles['Normal']),
-                    Spacer(1, 12),
-                    Paragraph(f"📅 Emitido em: {hoje}", styles['Italic']),
-                    Spacer(1, 20),
-                    Paragraph("Este documento confirma a estadia conforme os dados acima. Emitido automaticamente pelo sistema de hotelaria.", styles['Normal']),
-                    Spacer(1, 20),
-                    Paragraph("___________________________", styles['Normal']),
-                    Paragraph("Assinatura do Responsável", styles['Normal']),
-                    Spacer(1, 20),
-                    Image(qr_buffer, 1.5 * inch, 1.5 * inch),
-                    Paragraph("🔍 Verificação online disponível via QR Code", styles['Italic'])
-                ]
-
-                doc.build(conteudo)
-                buffer.seek(0)
-
-                b64 = base64.b64encode(buffer.read()).decode()
-                href = f'<a href="data:application/pdf;base64,{b64}" download="comprovante_estadia_{cpf}.pdf">📥 Clique aqui para baixar o comprovante em PDF</a>'
-                st.markdown(href, unsafe_allow_html=True)
+            # PDF servido como bytes pelo download_button (sem base64 na página),
+            # gerado uma vez por estadia e reaproveitado enquanto ela não mudar
+            st.download_button(
+                label="📥 Baixar comprovante em PDF",
+                data=_comprovante_pdf(dados["codigo_autenticacao"], assinatura_estadia(dados), dados),
+                file_name=f"comprovante_estadia_{cpf}.pdf",
+                mime="application/pdf"
+            )
+
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def _comprovante_pdf(codigo_autenticacao, assinatura, _dados):
+    # Chave: código de autenticação + hash do conteúdo da estadia; ``_dados``
+    # fica fora do hash do cache (já representado pela assinatura)
+    return pdf_comprovante(_dados, datetime.now().strftime("%d/%m/%Y %H:%M"))
+
+
+@st.cache_resource(show_spinner=False)
+def _executor_comprovantes():
+    # Pool de processos do processo do Streamlit, compartilhado pelas sessões.
+    # "spawn" porque o servidor tem várias threads e fork não é seguro nesse caso
+    return ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=multiprocessing.get_context("spawn"))
+
+
+def emitir_comprovantes_lote():
+    st.title("🗂️ Comprovantes em Lote")
+
+    col1, col2, col3 = st.columns(3)
+    inicio = col1.date_input("📅 Saídas de:", datetime.today())
+    fim = col2.date_input("📅 Até:", datetime.today())
+    formato = col3.radio("📦 Arquivo", ["ZIP (um PDF por estadia)", "PDF único"])
+
+    estadias = ler("""
+        SELECT nome, COALESCE(cpf_digitos, ''), quarto, dia_entrada, dia_saida, COALESCE(valor_centavos, 0)
+        FROM reservas
+        WHERE dia_saida BETWEEN ? AND ?
+        AND status IN ('Ativa', 'Finalizada') AND dia_entrada IS NOT NULL
+        ORDER BY dia_saida, quarto
+    """, (numero_dia(inicio), numero_dia(fim)))
+    st.caption(f"🧾 {len(estadias)} estadia(s) com saída no período.")
+
+    if not estadias:
+        st.info("📭 Nenhuma estadia com saída entre as datas escolhidas.")
+        return
+
+    if st.button("⚙️ Gerar comprovantes"):
+        lista = [dados_comprovante(*estadia) for estadia in estadias]
+        emitido_em = datetime.now().strftime("%d/%m/%Y %H:%M")
+        barra = st.progress(0.0, text="Gerando comprovantes...")
+        inicio_lote = time.perf_counter()
+
+        def progresso(feitos):
+            barra.progress(feitos / len(lista), text=f"{feitos} de {len(lista)} comprovante(s)")
+
+        # Um PDF por estadia em paralelo nos dois formatos; o PDF único só
+        # junta as páginas já renderizadas
+        resultados = gerar_lote(_executor_comprovantes(), lista, emitido_em, progresso)
+        pdfs = [pdf for pdf, _ in resultados]
+        if formato == "PDF único":
+            arquivo = juntar_pdfs(pdfs)
+            nome_arquivo, mime = f"comprovantes_{inicio}_{fim}.pdf", "application/pdf"
+        else:
+            arquivo = zip_comprovantes(lista, pdfs)
+            nome_arquivo, mime = f"comprovantes_{inicio}_{fim}.zip", "application/zip"
+        tempos = pd.DataFrame({
+            "Quarto": [dados["quarto"] for dados in lista],
+            "Hóspede": [dados["nome"] for dados in lista],
+            "Código": [dados["codigo_autenticacao"] for dados in lista],
+            "Tempo (s)": [round(segundos, 3) for _, segundos in resultados],
+        })
+
+        decorrido = time.perf_counter() - inicio_lote
+        barra.progress(1.0, text=f"✅ {len(lista)} comprovante(s) em {decorrido:.1f} s")
+        st.download_button(label="📥 Baixar comprovantes", data=arquivo, file_name=nome_arquivo, mime=mime)
+        st.dataframe(tempos, hide_index=True, use_container_width=True)
+
 
 def cadastrar_produto():
     st.title("📦 Cadastrar Produto")
@@ -1890,23 +1682,33 @@ def cadastrar_produto():
             elif not codigo_barras:
                 st.warning("⚠️ Preencha o código de barras.")
             else:
-                # Verifica duplicidade de código de barras
-                existente = cursor.execute("SELECT COUNT(*) FROM estoquelj WHERE codigo_barras = ?", (codigo_barras,)).fetchone()[0]
-                if existente > 0:
+                # Duplicidade pelo índice em memória; o índice UNIQUE do banco
+                # recusa o código se outra sessão o cadastrar ao mesmo tempo
+                indice = obter_codigos_barras()
+                if indice.produto(codigo_barras) is not None:
                     st.error("❌ Este código de barras já está cadastrado para outro produto.")
                     return
 
-                cursor.execute("""
-                    INSERT INTO estoquelj (
-                        nome, codigo_barras, categoria, unidade, quantidade, valor_unitario,
-                        status, observacao, estoque_minimo, estoque_maximo
-                    )
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    nome, codigo_barras, categoria, unidade, quantidade, valor,
-                    status, observacao, estoque_minimo, estoque_maximo
-                ))
-                conn.commit()
+                try:
+                    with indice.alterando_codigos(conn) as alteracoes:
+                        cursor.execute("""
+                            INSERT INTO estoquelj (
+                                nome, codigo_barras, categoria, unidade, quantidade, valor_unitario,
+                                status, observacao, estoque_minimo, estoque_maximo
+                            )
+                            VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?, ?)
+                        """, (
+                            nome, codigo_barras, categoria, unidade, valor,
+                            status, observacao, estoque_minimo, estoque_maximo
+                        ))
+                        produto_id = cursor.lastrowid
+                        alteracoes.append((None, codigo_barras, produto_id))
+                        if quantidade > 0:
+                            dar_entrada(conn, "estoquelj", produto_id, quantidade, tipo="Abertura",
+                                        observacao="Quantidade inicial do cadastro")
+                except sqlite3.IntegrityError:
+                    st.error("❌ Este código de barras já está cadastrado para outro produto.")
+                    return
                 st.success("✅ Produto cadastrado com sucesso!")
 
 
@@ -1914,6 +1716,11 @@ def cadastrar_produto():
 def saida_produto():
     st.title("🛍️ Venda de Produto / Saída de Estoque")
 
+    modo = st.radio("🧾 Modo de venda", ["🛍️ Produto a produto", "🛒 Carrinho"], horizontal=True)
+    if modo == "🛒 Carrinho":
+        venda_carrinho()
+        return
+
     st.markdown("🔍 **Busque pelo código de barras ou selecione manualmente o produto.**")
 
     codigo_barras = st.text_input("📷 Leitor de Código de Barras (digite ou escaneie):")
@@ -1921,27 +1728,30 @@ def saida_produto():
     produto_info = None
 
     if codigo_barras:
-        produto_info = cursor.execute("""
-            SELECT id, nome, quantidade, valor_unitario, unidade, categoria, estoque_minimo 
-            FROM estoquelj WHERE codigo_barras = ?
-        """, (codigo_barras.strip(),)).fetchone()
+        # Código -> produto pelo índice em memória; do banco só a linha do produto
+        produto_id = obter_codigos_barras().produto(codigo_barras)
+        if produto_id is not None:
+            produto_info = cursor.execute("""
+                SELECT id, nome, quantidade, valor_unitario, unidade, categoria, estoque_minimo
+                FROM estoquelj WHERE id = ?
+            """, (produto_id,)).fetchone()
 
         if not produto_info:
             st.warning("⚠️ Produto com este código de barras não encontrado.")
             return
 
     if not produto_info:
-        categorias = [row[0] for row in cursor.execute("SELECT DISTINCT categoria FROM estoquelj").fetchall()]
+        categorias = [row[0] for row in ler("SELECT DISTINCT categoria FROM estoquelj")]
         categoria_sel = st.selectbox("📂 Filtrar por Categoria", ["Selecionar Categoria..."] + categorias)
 
         if categoria_sel == "Selecionar Categoria...":
             st.info("👈 Por favor, selecione uma categoria para continuar.")
             return
 
-        produtos = cursor.execute("""
+        produtos = ler("""
             SELECT id, nome FROM estoquelj 
             WHERE categoria = ? AND quantidade > 0
-        """, (categoria_sel,)).fetchall()
+        """, (categoria_sel,))
 
         if not produtos:
             st.info("📭 Nenhum produto com estoque disponível nesta categoria.")
@@ -1974,9 +1784,9 @@ def saida_produto():
     """, unsafe_allow_html=True)
 
     # 🔍 Buscar hóspedes com reservas ativas
-    reservas_ativas = cursor.execute("""
+    reservas_ativas = ler("""
         SELECT nome, quarto FROM reservas WHERE status = 'Ativa'
-    """).fetchall()
+    """)
 
     if not reservas_ativas:
         st.warning("⚠️ Nenhum hóspede com reserva ativa encontrado.")
@@ -1992,31 +1802,155 @@ def saida_produto():
         registrar = st.form_submit_button("💰 Registrar Venda")
 
     if registrar:
-        nova_qtd = qtd - qtd_saida
-        total = qtd_saida * valor
-        data = datetime.now().strftime("%Y-%m-%d")
-        hora = datetime.now().strftime("%H:%M:%S")
-
         try:
-            # Atualiza estoque
-            cursor.execute("UPDATE estoquelj SET quantidade = ? WHERE id = ?", (nova_qtd, pid))
+            # Baixa condicional e venda na mesma transação
+            _, total = registrar_saida(conn, "estoquelj", pid, qtd_saida, tipo="Venda", observacao=observacao,
+                                       cliente=nome_hospede, quarto=quarto)
 
-            # Registra movimentação
-            cursor.execute("""
-                INSERT INTO movimentacoes_estoquelj (
-                    produto_id, tipo, quantidade, data, hora, valor_total, observacao, cliente, quarto
-                ) VALUES (?, 'Venda', ?, ?, ?, ?, ?, ?, ?)
-            """, (pid, qtd_saida, data, hora, total, observacao, nome_hospede, quarto))
+            st.success(f"✅ Venda registrada com sucesso!\nProduto: **{nome}**, Hóspede: **{nome_hospede}**, Quarto: **{quarto}**, Total: R$ {total:.2f}")
 
-            conn.commit()
+        except EstoqueInsuficiente as e:
+            st.warning(f"⚠️ {e}")
+        except Exception as e:
+            st.error(f"❌ Erro ao registrar a venda: {e}")
 
-            st.success(f"✅ Venda registrada com sucesso!\nProduto: **{nome}**, Hóspede: **{nome_hospede}**, Quarto: **{quarto}**, Total: R$ {total:.2f}")
 
+# -------------------- CARRINHO DA LOJINHA --------------------
+def _produto_loja(produto_id):
+    # Saldo e preço pela leitura em cache, refeita só quando estoquelj muda
+    linhas = ler("SELECT id, nome, quantidade, valor_unitario, unidade FROM estoquelj WHERE id = ?", (produto_id,))
+    return linhas[0] if linhas else None
+
+
+def _remover_do_carrinho(produto_id):
+    st.session_state.carrinho_loja.pop(produto_id, None)
+
+
+def _esvaziar_carrinho():
+    st.session_state.carrinho_loja = {}
+
+
+def venda_carrinho():
+    # Vários itens lidos em sequência e uma única venda ao final: as leituras
+    # são conferidas contra o saldo em cache e só o fechamento grava no banco
+    if "carrinho_loja" not in st.session_state:
+        st.session_state.carrinho_loja = {}   # {produto_id: {nome, qtd, valor}}
+    carrinho = st.session_state.carrinho_loja
+
+    if "venda_carrinho_ok" in st.session_state:
+        st.success(st.session_state.pop("venda_carrinho_ok"))
+
+    # Enter do leitor envia o formulário e limpa o campo para o próximo item
+    with st.form("form_leitura_carrinho", clear_on_submit=True):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            codigo = st.text_input("📷 Código de barras (digite ou escaneie)")
+        with col2:
+            qtd_leitura = st.number_input("🔢 Quantidade", min_value=1, value=1, step=1)
+        adicionar = st.form_submit_button("➕ Adicionar ao carrinho")
+
+    if adicionar and codigo.strip():
+        produto_id = obter_codigos_barras().produto(codigo)
+        produto = _produto_loja(produto_id) if produto_id is not None else None
+        if produto is None:
+            st.warning("⚠️ Produto com este código de barras não encontrado.")
+        else:
+            pid, nome, disponivel, valor, unidade = produto
+            no_carrinho = carrinho[pid]["qtd"] if pid in carrinho else 0
+            if no_carrinho + qtd_leitura > (disponivel or 0):
+                st.warning(f"⚠️ Estoque insuficiente de {nome}: {disponivel or 0} {unidade} disponível(is), "
+                           f"{no_carrinho} já no carrinho.")
+            else:
+                carrinho[pid] = {"nome": nome, "qtd": no_carrinho + qtd_leitura, "valor": valor or 0}
+
+    if not carrinho:
+        st.info("🛒 Carrinho vazio. Escaneie os produtos para adicioná-los.")
+        return
+
+    itens = pd.DataFrame([
+        {"Produto": item["nome"], "Quantidade": item["qtd"], "Valor Unitário": item["valor"],
+         "Subtotal": item["qtd"] * item["valor"]}
+        for item in carrinho.values()
+    ])
+    st.dataframe(itens.style.format({"Valor Unitário": "R$ {:.2f}", "Subtotal": "R$ {:.2f}"}),
+                 use_container_width=True, hide_index=True)
+    st.metric("💰 Total do carrinho", f"R$ {itens['Subtotal'].sum():.2f}")
+
+    col1, col2, col3 = st.columns([2, 1, 1])
+    with col1:
+        nomes = {item["nome"]: pid for pid, item in carrinho.items()}
+        remover = st.selectbox("Item", list(nomes), label_visibility="collapsed")
+    col2.button("🗑️ Remover item", on_click=_remover_do_carrinho, args=(nomes[remover],))
+    col3.button("🧹 Esvaziar", on_click=_esvaziar_carrinho)
+
+    reservas_ativas = ler("""
+        SELECT nome, quarto FROM reservas WHERE status = 'Ativa'
+    """)
+    if not reservas_ativas:
+        st.warning("⚠️ Nenhum hóspede com reserva ativa encontrado.")
+        return
+
+    hospede_dict = {f"{nome} - Quarto {quarto}": (nome, quarto) for nome, quarto in reservas_ativas}
+    selecionado = st.selectbox("👤 Lançar no quarto do hóspede (Reserva Ativa)", list(hospede_dict.keys()))
+    nome_hospede, quarto = hospede_dict[selecionado]
+    observacao = st.text_input("📝 Observação (opcional)")
+
+    if st.button("💰 Fechar venda"):
+        try:
+            # Todos os itens numa transação: saldos conferidos no banco, um
+            # executemany das vendas e um único commit
+            with movimentando_estoque(conn):
+                valores = baixar_lote(
+                    conn, "estoquelj", [(pid, item["qtd"]) for pid, item in carrinho.items()],
+                    tipo="Venda", observacao=observacao, cliente=nome_hospede, quarto=quarto
+                )
+        except EstoqueInsuficiente as e:
+            st.warning(f"⚠️ Estoque insuficiente de {carrinho[e.produto_id]['nome']}: {e.disponivel} disponível(is). "
+                       "Ajuste o carrinho e feche a venda novamente.")
         except Exception as e:
             st.error(f"❌ Erro ao registrar a venda: {e}")
+        else:
+            total = sum(valor_total for _, valor_total in valores)
+            st.session_state.carrinho_loja = {}
+            st.session_state.venda_carrinho_ok = (
+                f"✅ Venda registrada! {len(valores)} produto(s) para **{nome_hospede}**, "
+                f"Quarto: **{quarto}**, Total: R$ {total:.2f}"
+            )
+            st.rerun()
 
 
 # -------------------- ALMOXARIFADO --------------------
+# Cartões por página no almoxarifado
+CARTOES_POR_PAGINA = 24
+
+
+def _cartao_estoque(prod):
+    # HTML de um cartão de produto (linha do DataFrame do almoxarifado); todo
+    # campo editável pelo usuário passa por html.escape
+    cor_status = "#2ecc71" if prod.status == "✅ Ativo" else "#e74c3c"
+    cor_fundo = "#fff0f0" if prod.baixo else "#f0fdf4"
+    cor_qtd = "#e60000" if prod.baixo else "#2e8b57"
+    categoria = prod.categoria or ""
+    icone_categoria = html.escape(categoria.split()[0]) if categoria.strip() else "📦"
+    obs = (prod.observacao or "").strip()
+    unidade, status = html.escape(str(prod.unidade or "")), html.escape(str(prod.status or ""))
+    minimo, maximo = html.escape(str(prod.estoque_minimo)), html.escape(str(prod.estoque_maximo))
+    return f"""
+    <div style="background-color:{cor_fundo}; padding:15px; border:1px solid #ccc; border-radius:10px; margin-bottom:15px;">
+        <h4 style="margin-bottom:10px;">{icone_categoria} <strong>{html.escape(str(prod.nome))}</strong></h4>
+        <div style="line-height: 1.7;">
+            <b>📂 Categoria:</b> {html.escape(categoria)} &nbsp;&nbsp;&nbsp;
+            <b>📏 Unidade:</b> {unidade}<br>
+            <b>🔢 Quantidade:</b> <span style="color:{cor_qtd}">{html.escape(str(prod.quantidade))}</span> &nbsp;&nbsp;&nbsp;
+            <b>📊 Mín/Máx:</b> {minimo}/{maximo}<br>
+            <b>💰 Valor Unitário:</b> R$ {prod.valor_unitario:.2f} &nbsp;&nbsp;&nbsp;
+            <b>🔘 Status:</b> <span style="color:{cor_status}">{status}</span><br>
+            {"<b>📝 Observações:</b> " + html.escape(obs) if obs else ""}
+            {"<div style='color:red; margin-top:8px;'><b>⚠️ Estoque abaixo do mínimo!</b></div>" if prod.baixo else ""}
+        </div>
+    </div>"""
+
+
 def modulo_almoxarifado():
     st.title("🏷️ Almoxarifado - Itens em Estoque")
 
@@ -2024,10 +1958,10 @@ def modulo_almoxarifado():
     with st.expander("🔍 Filtros"):
         col1, col2 = st.columns(2)
         filtro_nome = col1.text_input("🔎 Buscar por nome:")
-        categorias = ["Todas"] + [row[0] for row in cursor.execute("SELECT DISTINCT categoria FROM estoque").fetchall()]
+        categorias = ["Todas"] + [row[0] for row in ler("SELECT DISTINCT categoria FROM estoque")]
         filtro_categoria = col2.selectbox("📂 Filtrar por Categoria", categorias)
 
-    # 📦 Consulta com filtros
+    # 📦 Uma consulta com filtros alimenta cartões, tabela e alerta
     query = """
         SELECT id, nome, categoria, unidade, quantidade, estoque_minimo,
             estoque_maximo, valor_unitario, status, observacao
@@ -2044,76 +1978,60 @@ def modulo_almoxarifado():
         params.append(filtro_categoria)
 
     query += " ORDER BY nome ASC"
-    produtos = cursor.execute(query, tuple(params)).fetchall()
+    df = ler_df(query, tuple(params))
 
-    if not produtos:
+    if df.empty:
         st.info("📭 Nenhum item encontrado com os filtros aplicados.")
         return
 
-    # 🧾 Exibição de produtos em "cartões" visuais
-    st.markdown("### 🗃️ Detalhamento por Produto")
-    for prod in produtos:
-        id_, nome, categoria, unidade, qtd, min_estoque, max_estoque, valor, status, obs = prod
-        cor_status = "#2ecc71" if status == "✅ Ativo" else "#e74c3c"
-        cor_fundo = "#f0fdf4" if qtd > min_estoque else "#fff0f0"
-        cor_qtd = "#2e8b57" if qtd > min_estoque else "#e60000"
-        icone_categoria = categoria.split()[0] if categoria else "📦" 
-        
-        st.markdown(f"""
-        <div style="background-color:{cor_fundo}; padding:15px; border:1px solid #ccc; border-radius:10px; margin-bottom:15px;">
-            <h4 style="margin-bottom:10px;">{icone_categoria} <strong>{nome}</strong></h4>
-            <div style="line-height: 1.7;">
-                <b>📂 Categoria:</b> {categoria} &nbsp;&nbsp;&nbsp;
-                <b>📏 Unidade:</b> {unidade}<br>
-                <b>🔢 Quantidade:</b> <span style="color:{cor_qtd}">{qtd}</span> &nbsp;&nbsp;&nbsp;
-                <b>📊 Mín/Máx:</b> {min_estoque}/{max_estoque}<br>
-                <b>💰 Valor Unitário:</b> R$ {valor:.2f} &nbsp;&nbsp;&nbsp;
-                <b>🔘 Status:</b> <span style="color:{cor_status}">{status}</span><br>
-                {"<b>📝 Observações:</b> " + obs if obs.strip() else ""}
-                {"<div style='color:red; margin-top:8px;'><b>⚠️ Estoque abaixo do mínimo!</b></div>" if qtd <= min_estoque else ""}
-            </div>
-        </div>
-        """, unsafe_allow_html=True)
+    # Máscara de estoque baixo calculada uma vez para todas as linhas
+    df["baixo"] = (df["quantidade"] <= df["estoque_minimo"]).to_numpy()
 
-    # 📊 Tabela Estilizada com Destaque
+    # 🧾 Cartões da página atual, enviados num único bloco HTML
+    st.markdown("### 🗃️ Detalhamento por Produto")
+    paginas = -(-len(df) // CARTOES_POR_PAGINA)
+    col1, col2 = st.columns([1, 3])
+    pagina = col1.number_input("📄 Página", min_value=1, max_value=paginas, value=1, step=1)
+    inicio = (pagina - 1) * CARTOES_POR_PAGINA
+    col2.caption(f"Itens {inicio + 1}–{min(inicio + CARTOES_POR_PAGINA, len(df))} de {len(df)} · {paginas} página(s)")
+    cartoes = "".join(_cartao_estoque(prod) for prod in df.iloc[inicio:inicio + CARTOES_POR_PAGINA].itertuples())
+    st.markdown(cartoes, unsafe_allow_html=True)
+
+    # 📊 Tabela com os mesmos dados e destaque pela máscara
     st.markdown("### 📋 Visão Geral dos Itens em Tabela")
 
-    df = pd.read_sql_query("""
-        SELECT nome AS Produto, categoria AS Categoria, unidade AS Unidade,
-            quantidade AS Quantidade, estoque_minimo AS 'Estoque Mínimo',
-            estoque_maximo AS 'Estoque Máximo', valor_unitario AS 'Valor Unitário (R$)', status AS Status
-        FROM estoque
-        WHERE quantidade > 0
-        ORDER BY nome ASC
-    """, conn)
+    tabela = df[["nome", "categoria", "unidade", "quantidade", "estoque_minimo", "estoque_maximo",
+                 "valor_unitario", "status"]]
+    tabela.columns = ["Produto", "Categoria", "Unidade", "Quantidade", "Estoque Mínimo", "Estoque Máximo",
+                      "Valor Unitário (R$)", "Status"]
+    baixo = df["baixo"].to_numpy()
 
-    def destacar_estoque_baixo(row):
-        return ['background-color: #ffe6e6' if row['Quantidade'] <= row['Estoque Mínimo'] else '' for _ in row]
+    def destacar_estoque_baixo(dados):
+        # Estilo da tabela inteira de uma vez: linhas com estoque baixo em vermelho claro
+        cores = np.where(baixo, "background-color: #ffe6e6", "")
+        return pd.DataFrame(np.repeat(cores[:, None], dados.shape[1], axis=1),
+                            index=dados.index, columns=dados.columns)
 
-    st.dataframe(df.style.apply(destacar_estoque_baixo, axis=1), use_container_width=True)
+    st.dataframe(tabela.style.apply(destacar_estoque_baixo, axis=None), use_container_width=True, hide_index=True)
 
     # ⚠️ Alerta para itens críticos
-    df_critico = df[df["Quantidade"] <= df["Estoque Mínimo"]]
-    if not df_critico.empty:
+    if baixo.any():
         st.markdown("### ⚠️ Itens com Estoque Crítico")
-        st.dataframe(df_critico.style.apply(highlight, axis=1), use_container_width=True)
+        st.dataframe(tabela[baixo].style.set_properties(**{"background-color": "#fff3cd"}),
+                     use_container_width=True, hide_index=True)
 
 
-# Estilo extra (opcional): função para aplicar destaque amarelo
-def highlight(row):
-    return ['background-color: #fff3cd'] * len(row)
-
 def entrada_produto():
     st.title("📥 Entrada de Produto")
 
-    categorias = [row[0] for row in cursor.execute("SELECT DISTINCT categoria FROM estoquelj").fetchall()]
+    categorias = [row[0] for row in ler("SELECT DISTINCT categoria FROM estoquelj")]
     categoria_sel = st.selectbox("📂 Filtrar por Categoria", ["Selecionar Categoria..."] + categorias)
 
     if categoria_sel == "Selecionar Categoria...":
         st.info("👈 Por favor, selecione uma categoria.")
         return
 
-    produtos = cursor.execute("SELECT id, nome FROM estoquelj WHERE categoria = ?", (categoria_sel,)).fetchall()
+    produtos = ler("SELECT id, nome FROM estoquelj WHERE categoria = ?", (categoria_sel,))
 
     if not produtos:
         st.info("📭 Nenhum produto disponível nesta categoria.")
@@ -2157,24 +2075,10 @@ def entrada_produto():
         enviar = st.form_submit_button("✅ Registrar Entrada")
 
         if enviar:
-            nova_qtd = qtd + qtd_entrada
-            valor_total = qtd_entrada * novo_valor
-            data = datetime.now().strftime("%Y-%m-%d")
-            hora = datetime.now().strftime("%H:%M:%S")
-
             try:
-                # Atualiza estoque
-                cursor.execute("""
-                    UPDATE estoque SET quantidade = ?, valor_unitario = ? WHERE id = ?
-                """, (nova_qtd, novo_valor, produto_id))
-
-                # Registra movimentação
-                cursor.execute("""
-                    INSERT INTO movimentacoes_estoque (produto_id, tipo, quantidade, data, hora, valor_total, observacao)
-                    VALUES (?, 'Entrada', ?, ?, ?, ?, ?)
-                """, (produto_id, qtd_entrada, data, hora, valor_total, observacao))
-
-                conn.commit()
+                # A entrada é só uma movimentação no razão; o saldo é somado pelo banco
+                registrar_entrada(conn, "estoquelj", produto_id, qtd_entrada, valor_unitario=novo_valor,
+                                  observacao=observacao)
                 st.success(f"✅ Entrada registrada com sucesso para o produto **{nome_sel}**!")
             except Exception as e:
                 st.error(f"❌ Erro ao registrar entrada: {e}")
@@ -2192,45 +2096,36 @@ def modulo_contabil():
         data_fim = st.date_input("📅 Data Fim", value=None)
 
     # Carrega lista de CPFs
-    cpfs = pd.read_sql_query("SELECT DISTINCT cpf FROM reservas", conn)["cpf"].dropna().tolist()
+    cpfs = ler_df("SELECT DISTINCT cpf_digitos AS cpf FROM reservas WHERE cpf_digitos <> ''")["cpf"].dropna().tolist()
     cpf_sel = None
 
     if cpfs:
         cpf_sel = st.selectbox("👤 Selecione um CPF (opcional)", options=["Todos"] + cpfs)
 
-    # Define filtro base
-    filtro_data = ""
+    # Define filtro base: noites dentro do período, como no livro diário
+    filtro_dia = ""
     params = []
 
     if data_inicio and data_fim:
-        filtro_data = " AND data_entrada BETWEEN ? AND ? "
-        params.extend([str(data_inicio), str(data_fim)])
+        filtro_dia = " AND n.dia BETWEEN ? AND ? "
+        params.extend([numero_dia(data_inicio), numero_dia(data_fim)])
 
-    # Consulta reservas
     if cpf_sel and cpf_sel != "Todos":
-        query_reservas = f"SELECT data_entrada, data_saida, valor FROM reservas WHERE cpf = ? {filtro_data}"
-        params_cpf = [cpf_sel] + params
-    else:
-        query_reservas = f"SELECT data_entrada, data_saida, valor FROM reservas WHERE 1=1 {filtro_data}"
-        params_cpf = params
-
-    reservas = pd.read_sql_query(query_reservas, conn, params=params_cpf)
-    reservas["valor"] = pd.to_numeric(reservas["valor"], errors="coerce")
-    reservas["data_entrada"] = pd.to_datetime(reservas["data_entrada"], errors="coerce")
-    reservas["data_saida"] = pd.to_datetime(reservas["data_saida"], errors="coerce")
-    reservas = reservas.dropna(subset=["valor", "data_entrada", "data_saida"])
-    reservas["dias"] = (reservas["data_saida"] - reservas["data_entrada"]).dt.days.clip(lower=1)
-    reservas["total"] = reservas["valor"] * reservas["dias"]
-    total_reserva = reservas["total"].sum()
-
-    # Consulta vendas
-    if cpf_sel and cpf_sel != "Todos":
-        vendas = pd.read_sql_query("SELECT valor_total FROM movimentacoes_estoquelj WHERE tipo = 'Venda' AND cliente = ?", conn, params=(cpf_sel,))
-    else:
-        vendas = pd.read_sql_query("SELECT valor_total FROM movimentacoes_estoquelj WHERE tipo = 'Venda'", conn)
+        # Por hóspede: noites e vendas do CPF
+        query_reservas = SQL_RECEITA_HOSPEDE.format(filtro_dia=filtro_dia)
+        total_reserva = cursor.execute(query_reservas, [cpf_sel] + params).fetchone()[0]
 
-    vendas["valor_total"] = pd.to_numeric(vendas["valor_total"], errors="coerce")
-    receita_vendas = vendas["valor_total"].sum() if not vendas.empty else 0.0
+        vendas = ler_df("SELECT valor_total FROM movimentacoes_estoquelj WHERE tipo = 'Venda' AND cliente = ?", (cpf_sel,))
+        vendas["valor_total"] = pd.to_numeric(vendas["valor_total"], errors="coerce")
+        receita_vendas = vendas["valor_total"].sum() if not vendas.empty else 0.0
+    else:
+        # Todos os hóspedes: totais do livro diário no período (ou em todo o histórico)
+        if data_inicio and data_fim:
+            livro = totais_livro(conn, data_inicio, data_fim)
+        else:
+            livro = totais_livro(conn)
+        total_reserva = livro["receita_quartos"] / 100
+        receita_vendas = livro["receita_vendas"] / 100
 
     st.info(f"💼 Total com Reservas: R$ {float(total_reserva):.2f}")
     st.info(f"🛍️ Total com Compras: R$ {float(receita_vendas):.2f}")
@@ -2248,93 +2143,45 @@ def modulo_contabil():
     if data_inicial and data_final:
         st.subheader("📈 DRE - Demonstração do Resultado do Exercício")
 
-    # ✅ Reservas no período
-        reservas = pd.read_sql_query("""
-            SELECT data_entrada, data_saida, valor FROM reservas
-            WHERE data_saida >= ? AND data_entrada <= ?
-        """, conn, params=(data_inicial.strftime("%Y-%m-%d"), data_final.strftime("%Y-%m-%d")))
-
-        reservas["valor"] = pd.to_numeric(reservas["valor"], errors="coerce")
-        reservas["data_entrada"] = pd.to_datetime(reservas["data_entrada"], errors="coerce")
-        reservas["data_saida"] = pd.to_datetime(reservas["data_saida"], errors="coerce")
-        reservas = reservas.dropna(subset=["valor", "data_entrada", "data_saida"])
-        reservas["dias"] = (reservas["data_saida"] - reservas["data_entrada"]).dt.days.clip(lower=1)
-        reservas["total"] = reservas["valor"] * reservas["dias"]
-        receita_reservas = reservas["total"].sum()
-
-    # ✅ Vendas no período
-        vendas = pd.read_sql_query("""
-            SELECT valor_total FROM movimentacoes_estoquelj
-            WHERE tipo = 'Venda' AND data BETWEEN ? AND ?
-        """, conn, params=(data_inicial.strftime("%Y-%m-%d"), data_final.strftime("%Y-%m-%d")))
-        vendas["valor_total"] = pd.to_numeric(vendas["valor_total"], errors="coerce")
-        receita_vendas = vendas["valor_total"].sum() if not vendas.empty else 0.0
-
-    # ✅ Compras (Entrada) no almoxarifado no período
-        compras_am = pd.read_sql_query("""
-            SELECT valor_total FROM movimentacoes_estoque
-            WHERE tipo = 'Entrada' AND data BETWEEN ? AND ?
-        """, conn, params=(data_inicial.strftime("%Y-%m-%d"), data_final.strftime("%Y-%m-%d")))
-        compras_am["valor_total"] = pd.to_numeric(compras_am["valor_total"], errors="coerce")
-        total_compras_am = compras_am["valor_total"].sum() if not compras_am.empty else 0.0
-
-    # ✅ Custos com arrumação no período
-        arrumacao = pd.read_sql_query("""
-            SELECT valor_total FROM movimentacoes_estoquelj
-            WHERE tipo = 'Saída' AND LOWER(observacao) LIKE '%arrumação%' AND data BETWEEN ? AND ?
-        """, conn, params=(data_inicial.strftime("%Y-%m-%d"), data_final.strftime("%Y-%m-%d")))
-        arrumacao["valor_total"] = pd.to_numeric(arrumacao["valor_total"], errors="coerce")
-        custo_arrumacao = arrumacao["valor_total"].sum() if not arrumacao.empty else 0.0
-
-    # ✅ Cálculo dos totais
-        receita_total = receita_reservas + receita_vendas
-        custo_total = total_compras_am + custo_arrumacao
-        lucro_bruto = receita_total - custo_total
+    # ✅ Todas as linhas da DRE de uma vez, em cache até algum lançamento do período mudar
+        dre = _dre_periodo(data_inicial, data_final, marca_periodo_livro(conn, data_inicial, data_final))
 
     # ✅ Exibição dos resultados
         st.markdown(f"""
-        **Receita de Reservas:** R$ {receita_reservas:.2f}  
-        **Receita com Vendas:** R$ {receita_vendas:.2f}  
-        **🔹 Receita Total:** R$ {receita_total:.2f}  
+        **Receita de Reservas:** R$ {dre['receita_reservas']:.2f}  
+        **Receita com Vendas:** R$ {dre['receita_vendas']:.2f}  
+        **🔹 Receita Total:** R$ {dre['receita_total']:.2f}  
 
-        **(-) Compras para Almoxarifado:** R$ {total_compras_am:.2f}  
-        **(-) Custos com Arrumação:** R$ {custo_arrumacao:.2f}  
-        **💵 Lucro Bruto:** R$ {lucro_bruto:.2f}
+        **(-) Compras para Almoxarifado:** R$ {dre['compras_almoxarifado']:.2f}  
+        **(-) Custos com Arrumação:** R$ {dre['custo_arrumacao']:.2f}  
+        **💵 Lucro Bruto:** R$ {dre['lucro_bruto']:.2f}
         """)
 
         st.markdown("---")
 
         st.subheader("💸 Fluxo de Caixa (Simplificado)")
-        st.metric("Entradas (Receita Total)", f"R$ {receita_total:.2f}")
-        st.metric("Saídas (Compras + Arrumação)", f"R$ {custo_total:.2f}")
-        st.metric("Saldo Operacional", f"R$ {lucro_bruto:.2f}")
+        st.metric("Entradas (Receita Total)", f"R$ {dre['receita_total']:.2f}")
+        st.metric("Saídas (Compras + Arrumação)", f"R$ {dre['custo_total']:.2f}")
+        st.metric("Saldo Operacional", f"R$ {dre['lucro_bruto']:.2f}")
 
         st.markdown("---")
 
         st.subheader("📊 Indicadores Financeiros")
-        total_clientes = pd.read_sql_query("SELECT COUNT(DISTINCT cpf) AS total FROM reservas", conn).iloc[0]["total"]
-        ticket_medio = receita_total / total_clientes if total_clientes else 0
-        margem_lucro = (lucro_bruto / receita_total * 100) if receita_total else 0
-        custo_pct = (custo_total / receita_total * 100) if receita_total else 0
+        total_quartos = cursor.execute("SELECT COUNT(*) FROM quartos").fetchone()[0]
+        noites_disponiveis = total_quartos * max((data_final - data_inicial).days + 1, 0)
+        taxa_ocupacao = (dre["noites"] / noites_disponiveis * 100) if noites_disponiveis else 0
 
         st.markdown(f"""
-        - **🎯 Ticket Médio por Cliente:** R$ {ticket_medio:.2f}  
-        - **📈 Margem de Lucro:** {margem_lucro:.2f}%  
-        - **💰 Custo Total (% Receita):** {custo_pct:.2f}%
+        - **🎯 Ticket Médio por Cliente:** R$ {dre['ticket_medio']:.2f}  
+        - **📈 Margem de Lucro:** {dre['margem_lucro']:.2f}%  
+        - **💰 Custo Total (% Receita):** {dre['custo_pct']:.2f}%  
+        - **🛏️ Taxa de Ocupação:** {taxa_ocupacao:.2f}% ({dre['noites']} noites)
         """)
 
         st.markdown("---")
 
         st.subheader("🏆 Top 5 Produtos Mais Vendidos")
-        top_vendas = pd.read_sql_query("""
-            SELECT p.nome, SUM(m.quantidade) as total_qtd, SUM(m.valor_total) as total_valor
-            FROM movimentacoes_estoquelj m
-            JOIN estoquelj p ON p.id = m.produto_id
-            WHERE m.tipo = 'Venda' AND m.data BETWEEN ? AND ?
-            GROUP BY p.nome
-            ORDER BY total_valor DESC
-            LIMIT 5
-        """, conn, params=(data_inicial.strftime("%Y-%m-%d"), data_final.strftime("%Y-%m-%d")))
+        top_vendas = dre["top_vendas"]
 
         if not top_vendas.empty:
             st.table(top_vendas.rename(columns={
@@ -2345,41 +2192,22 @@ def modulo_contabil():
         else:
             st.info("📭 Sem vendas registradas no período.")
 
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def _dre_periodo(inicio, fim, marca):
+    # ``marca`` (marca_periodo_livro) só muda quando um lançamento do período
+    # é alterado; trocar de mês e voltar reaproveita o resultado
+    return calcular_dre(obter_cubo(), inicio, fim)
+
 def modulo_financeiro():
     st.title("💼 Módulo Financeiro")
 
-    # Receitas
-    reservas = pd.read_sql_query("SELECT data_entrada, data_saida, valor FROM reservas", conn)
-    reservas["valor"] = pd.to_numeric(reservas["valor"], errors="coerce")
-    reservas["data_entrada"] = pd.to_datetime(reservas["data_entrada"], errors="coerce")
-    reservas["data_saida"] = pd.to_datetime(reservas["data_saida"], errors="coerce")
-    reservas = reservas.dropna(subset=["valor", "data_entrada", "data_saida"])
-    reservas["dias"] = (reservas["data_saida"] - reservas["data_entrada"]).dt.days.clip(lower=1)
-    reservas["total"] = reservas["valor"] * reservas["dias"]
-    receita_reservas = reservas["total"].sum()
-
-    vendas = pd.read_sql_query("""
-        SELECT valor_total FROM movimentacoes_estoquelj 
-        WHERE tipo = 'Venda'
-    """, conn)
-    vendas["valor_total"] = pd.to_numeric(vendas["valor_total"], errors="coerce")
-    receita_vendas = vendas["valor_total"].sum() if not vendas.empty else 0.0
-
-    # Despesas - Compras para Almoxarifado
-    compras = pd.read_sql_query("""
-        SELECT valor_total FROM movimentacoes_estoque 
-        WHERE tipo = 'Entrada'
-    """, conn)
-    compras["valor_total"] = pd.to_numeric(compras["valor_total"], errors="coerce")
-    custo_compras = compras["valor_total"].sum() if not compras.empty else 0.0
-
-    # Despesas - Arrumação
-    arrumacao = pd.read_sql_query("""
-        SELECT valor_total FROM movimentacoes_estoquelj
-        WHERE tipo = 'Saída' AND LOWER(observacao) LIKE '%arrumação%'
-    """, conn)
-    arrumacao["valor_total"] = pd.to_numeric(arrumacao["valor_total"], errors="coerce")
-    custo_arrumacao = arrumacao["valor_total"].sum() if not arrumacao.empty else 0.0
+    # Receitas e despesas somadas a partir do livro diário (um registro por dia)
+    livro = totais_livro(conn)
+    receita_reservas = livro["receita_quartos"] / 100
+    receita_vendas = livro["receita_vendas"] / 100
+    custo_compras = livro["compras_almoxarifado"] / 100
+    custo_arrumacao = livro["custo_arrumacao"] / 100
 
     # Totais
     receita_total = receita_reservas + receita_vendas
@@ -2425,10 +2253,71 @@ def modulo_financeiro():
         fig = px.bar(df_fin, x="Categoria", y="Valor", text="Valor", title="💹 Comparativo Financeiro")
         st.plotly_chart(fig)
 
+# Rótulos das dimensões e contas do cubo na tela de análise
+DIMENSOES_ANALISE = {
+    "Andar": "andar",
+    "Quarto": "quarto",
+    "Dia da semana": "dia_semana",
+    "Dia": "dia",
+    "Categoria": "categoria",
+    "Produto": "produto",
+    "Hóspede": "hospede",
+    "Conta": "conta",
+}
+NOMES_CONTAS = {
+    "receita_quartos": "Receita de Hospedagem",
+    "receita_vendas": "Receita com Vendas",
+    "compras_almoxarifado": "Compras para Almoxarifado",
+    "custo_arrumacao": "Custos com Arrumação",
+}
+
+
+def analise_receitas():
+    st.title("🔎 Análise de Receitas")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        data_inicial = st.date_input("📅 Data Inicial", datetime.today().replace(day=1))
+    with col2:
+        data_final = st.date_input("📅 Data Final", datetime.today())
+
+    col1, col2 = st.columns(2)
+    with col1:
+        rotulo = st.selectbox("📊 Agrupar por", list(DIMENSOES_ANALISE))
+    with col2:
+        nomes = st.multiselect("💰 Contas", list(NOMES_CONTAS.values()),
+                               default=[NOMES_CONTAS[conta] for conta in CONTAS_RECEITA])
+    contas = [conta for conta, nome in NOMES_CONTAS.items() if nome in nomes]
+    recorrentes = st.checkbox("🔁 Apenas hóspedes recorrentes (mais de uma estadia)")
+
+    dimensao = DIMENSOES_ANALISE[rotulo]
+    df = obter_cubo().agrupar(dimensao, data_inicial, data_final, contas=contas, recorrentes=recorrentes)
+
+    if df.empty:
+        st.info("📭 Nenhum lançamento no período para os filtros escolhidos.")
+        return
+
+    if dimensao == "conta":
+        df["conta"] = df["conta"].map(NOMES_CONTAS)
+    df = df.sort_values("valor", ascending=False) if dimensao not in ("dia", "dia_semana", "andar") else df
+
+    st.metric("💵 Total", f"R$ {df['valor'].sum():.2f}")
+    st.bar_chart(df.set_index(dimensao)["valor"])
+    st.dataframe(df.rename(columns={
+        dimensao: rotulo,
+        "valor": "Valor (R$)",
+        "quantidade": "Quantidade",
+        "estadias": "Estadias"
+    }), hide_index=True, use_container_width=True)
+
+
 def dashboard():
     st.header("📊 Dashboard")
     st.write("Gráficos e estatísticas virão em breve.")
     st.line_chart([10, 20, 15, 30, 50])
 
 if __name__ == "__main__":
-    main()
+    # Cada execução do script usa a sua própria conexão e cursor do pool
+    with obter_pool().conexao() as conn:
+        cursor = conn.cursor()
+        main()
@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from banco import abrir_conexao, aplicar_migracoes  # noqa: E402
+
+
+@pytest.fixture
+def conn():
+    # Banco em memória com o schema completo das migrações
+    conexao = abrir_conexao(":memory:")
+    aplicar_migracoes(conexao)
+    yield conexao
+    conexao.close()
+
+
+@pytest.fixture
+def produto(conn):
+    # Fábrica de produtos do almoxarifado/loja com saldo inicial pelo razão
+    from estoque import registrar_entrada
+
+    def criar(tabela="estoque", quantidade=10, valor_unitario=2.0, nome="Sabonete"):
+        cursor = conn.execute(
+            f"INSERT INTO {tabela} (nome, categoria, unidade, quantidade, valor_unitario, status) "
+            "VALUES (?, 'Higiene', 'un', 0, ?, '✅ Ativo')",
+            (nome, valor_unitario),
+        )
+        conn.commit()
+        if quantidade:
+            registrar_entrada(conn, tabela, cursor.lastrowid, quantidade, tipo="Abertura")
+        return cursor.lastrowid
+
+    return criar
@@ -0,0 +1,44 @@
+import pytest
+
+from estoque import EstoqueInsuficiente, baixar_lote, movimentando_estoque
+
+
+def _quantidade(conn, produto_id):
+    return conn.execute("SELECT quantidade FROM estoque WHERE id = ?", (produto_id,)).fetchone()[0]
+
+
+def test_produto_repetido_soma_as_quantidades(conn, produto):
+    lencol = produto(quantidade=10, valor_unitario=3.0, nome="Lençol")
+    toalha = produto(quantidade=4, valor_unitario=1.5, nome="Toalha")
+
+    with movimentando_estoque(conn):
+        valores = baixar_lote(conn, "estoque", [(lencol, 2), (toalha, 1), (lencol, 3)], observacao="Arrumação")
+
+    assert valores == [(3.0, 6.0), (1.5, 1.5), (3.0, 9.0)]
+    assert _quantidade(conn, lencol) == 5 and _quantidade(conn, toalha) == 3
+    saidas = conn.execute(
+        "SELECT produto_id, quantidade FROM movimentacoes_estoque WHERE tipo = 'Saída' ORDER BY id"
+    ).fetchall()
+    assert saidas == [(lencol, 2), (toalha, 1), (lencol, 3)]
+
+
+def test_soma_maior_que_o_saldo_nao_baixa_nada(conn, produto):
+    # Cada linha cabe no saldo, mas a soma do produto repetido não
+    lencol = produto(quantidade=4, nome="Lençol")
+    toalha = produto(quantidade=4, nome="Toalha")
+
+    with pytest.raises(EstoqueInsuficiente) as erro:
+        with movimentando_estoque(conn):
+            baixar_lote(conn, "estoque", [(toalha, 1), (lencol, 3), (lencol, 2)])
+
+    assert (erro.value.produto_id, erro.value.quantidade, erro.value.disponivel) == (lencol, 5, 4)
+    assert _quantidade(conn, lencol) == 4 and _quantidade(conn, toalha) == 4
+    assert conn.execute("SELECT COUNT(*) FROM movimentacoes_estoque WHERE tipo = 'Saída'").fetchone()[0] == 0
+
+
+def test_quantidade_invalida_e_recusada(conn, produto):
+    lencol = produto(quantidade=4)
+    with pytest.raises(ValueError):
+        with movimentando_estoque(conn):
+            baixar_lote(conn, "estoque", [(lencol, 0)])
+    assert _quantidade(conn, lencol) == 4
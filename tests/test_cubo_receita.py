@@ -0,0 +1,88 @@
+from datetime import date
+
+import pandas as pd
+
+from banco import atualizar_noites, numero_dia
+from cubo_receita import CuboReceita
+from estoque import registrar_saida
+
+HOJE = numero_dia(date.today())
+
+
+def _reservar(conn, nome, cpf, quarto, entrada, saida, valor_centavos=10000, status="Ativa"):
+    cursor = conn.execute(
+        "INSERT INTO reservas (nome, cpf, cpf_digitos, quarto, data_entrada, data_saida, status, "
+        "dia_entrada, dia_saida, valor_centavos) VALUES (?, ?, ?, ?, '', '', ?, ?, ?, ?)",
+        (nome, cpf, cpf, quarto, status, entrada, saida, valor_centavos),
+    )
+    atualizar_noites(conn, cursor.lastrowid)
+    conn.commit()
+    return cursor.lastrowid
+
+
+def _vender(conn, produto_id, cliente, quarto, quantidade=1):
+    registrar_saida(conn, "estoquelj", produto_id, quantidade, tipo="Venda", cliente=cliente, quarto=quarto)
+
+
+def _visao(cubo, por):
+    df = cubo.agrupar(por, HOJE - 30, HOJE + 30)
+    return df.sort_values(por).reset_index(drop=True)
+
+
+def _assert_igual_a_reconstrucao(conn, cubo):
+    completo = CuboReceita().atualizar(conn)
+    for por in ("hospede", "quarto", "conta", "dia"):
+        pd.testing.assert_frame_equal(_visao(cubo, por), _visao(completo, por))
+    assert cubo.totais(HOJE - 30, HOJE + 30) == completo.totais(HOJE - 30, HOJE + 30)
+
+
+def test_atualizacao_incremental_igual_a_carga_completa(conn, produto):
+    agua = produto("estoquelj", quantidade=50, valor_unitario=5.0, nome="Água")
+    _reservar(conn, "Ana", "111", "1-1", HOJE - 3, HOJE + 1)
+    _vender(conn, agua, "Ana", "1-1", 2)
+    cubo = CuboReceita().atualizar(conn)
+    marca = cubo.marca
+
+    # Novos lançamentos no livro: outra estadia, outra venda e um cancelamento
+    bruno = _reservar(conn, "Bruno", "222", "2-1", HOJE - 1, HOJE + 2, valor_centavos=15000)
+    _reservar(conn, "Ana", "111", "3-1", HOJE + 5, HOJE + 7)
+    _vender(conn, agua, "Bruno", "2-1", 3)
+    conn.execute("UPDATE reservas SET status = 'Cancelada' WHERE id = ?", (bruno,))
+    atualizar_noites(conn, bruno)
+    conn.commit()
+
+    cubo.atualizar(conn)
+    assert cubo.marca > marca
+    _assert_igual_a_reconstrucao(conn, cubo)
+
+
+def test_venda_passa_ao_cpf_quando_a_reserva_aparece(conn, produto):
+    agua = produto("estoquelj", quantidade=50, valor_unitario=5.0, nome="Água")
+    _vender(conn, agua, "Carla", "4-1")
+    cubo = CuboReceita().atualizar(conn)
+    assert _visao(cubo, "hospede")["hospede"].tolist() == [""]
+
+    # Estadia que não tem noite no dia da venda: o dia da venda não muda no livro
+    _reservar(conn, "Carla", "333", "4-1", HOJE - 5, HOJE - 3)
+    cubo.atualizar(conn)
+    assert "Carla — CPF 333" in _visao(cubo, "hospede")["hospede"].tolist()
+    _assert_igual_a_reconstrucao(conn, cubo)
+
+
+def test_homonimos_distintos_e_recorrentes_por_cpf(conn):
+    _reservar(conn, "Ana", "111", "1-1", HOJE - 10, HOJE - 8)
+    _reservar(conn, "Ana", "111", "1-2", HOJE - 2, HOJE)
+    _reservar(conn, "Ana", "999", "1-3", HOJE - 2, HOJE)
+    cubo = CuboReceita().atualizar(conn)
+
+    assert set(_visao(cubo, "hospede")["hospede"]) == {"Ana — CPF 111", "Ana — CPF 999"}
+    recorrentes = cubo.agrupar("hospede", HOJE - 30, HOJE + 30, recorrentes=True)
+    assert recorrentes["hospede"].tolist() == ["Ana — CPF 111"]
+    assert cubo.contar_distintos("hospede", HOJE - 30, HOJE + 30, contas=["receita_quartos"]) == 2
+
+
+def test_nenhuma_conta_escolhida_nao_traz_linhas(conn):
+    _reservar(conn, "Ana", "111", "1-1", HOJE - 1, HOJE + 1)
+    cubo = CuboReceita().atualizar(conn)
+    assert cubo.agrupar("conta", HOJE - 30, HOJE + 30, contas=[]).empty
+    assert not cubo.agrupar("conta", HOJE - 30, HOJE + 30).empty
@@ -0,0 +1,79 @@
+from datetime import date
+
+import pytest
+
+from banco import abrir_conexao, aplicar_migracoes, numero_dia
+from disponibilidade import MapaDisponibilidade, QuartoOcupado
+
+HOJE = numero_dia(date.today())
+
+
+def _inserir_reserva(conn, quarto, entrada, saida, status="Ativa"):
+    cursor = conn.execute(
+        "INSERT INTO reservas (nome, cpf, quarto, data_entrada, data_saida, status, dia_entrada, dia_saida) "
+        "VALUES ('Hóspede', '1', ?, '', '', ?, ?, ?)",
+        (quarto, status, entrada, saida),
+    )
+    return cursor.lastrowid
+
+
+@pytest.fixture
+def mapa(conn):
+    _inserir_reserva(conn, "1-1", HOJE + 10, HOJE + 13)
+    _inserir_reserva(conn, "1-2", HOJE + 10, HOJE + 13, status="Cancelada")
+    conn.commit()
+    mapa = MapaDisponibilidade()
+    mapa.carregar(conn)
+    return mapa
+
+
+def test_saida_de_uma_estadia_e_entrada_de_outra_nao_colidem(mapa):
+    # Estadia ocupa as noites [entrada, saída): o dia do check-out fica livre
+    assert mapa.livre("1-1", HOJE + 13, HOJE + 15)
+    assert mapa.livre("1-1", HOJE + 8, HOJE + 10)
+    assert not mapa.livre("1-1", HOJE + 12, HOJE + 14)
+    assert not mapa.livre("1-1", HOJE + 9, HOJE + 11)
+    assert not mapa.livre("1-1", HOJE + 11, HOJE + 11)  # mesmo dia conta como uma noite
+    assert mapa.livre("1-2", HOJE + 10, HOJE + 13)  # reservas canceladas não ocupam
+
+
+def test_ignorar_desconta_so_a_propria_estadia(mapa, conn):
+    propria = (HOJE + 10, HOJE + 13)
+    assert mapa.livre("1-1", HOJE + 11, HOJE + 14, ignorar=propria)
+
+    with mapa.alterando_reservas(conn) as alteracoes:
+        _inserir_reserva(conn, "1-1", HOJE + 13, HOJE + 16)
+        alteracoes.append(("1-1", HOJE + 13, HOJE + 16, 1))
+    assert not mapa.livre("1-1", HOJE + 11, HOJE + 14, ignorar=propria)
+    assert mapa.livre("1-1", HOJE + 11, HOJE + 13, ignorar=propria)
+
+
+def test_garantir_livre_fora_da_transacao_e_recusado(mapa, conn):
+    with pytest.raises(RuntimeError):
+        mapa.garantir_livre(conn, "1-1", HOJE, HOJE + 1)
+
+
+def test_garantir_livre_ve_reserva_gravada_por_outra_conexao(tmp_path):
+    caminho = str(tmp_path / "hotel.db")
+    primeira, segunda = abrir_conexao(caminho), abrir_conexao(caminho)
+    aplicar_migracoes(primeira)
+    mapa = MapaDisponibilidade()
+    mapa.carregar(primeira)
+    assert mapa.livre("2-1", HOJE, HOJE + 3)
+
+    # Outra sessão reserva o quarto depois que a tela consultou o mapa
+    _inserir_reserva(segunda, "2-1", HOJE + 2, HOJE + 4)
+    segunda.commit()
+
+    with pytest.raises(QuartoOcupado):
+        with mapa.alterando_reservas(primeira) as alteracoes:
+            mapa.garantir_livre(primeira, "2-1", HOJE, HOJE + 3)
+            _inserir_reserva(primeira, "2-1", HOJE, HOJE + 3)
+            alteracoes.append(("2-1", HOJE, HOJE + 3, 1))
+
+    assert primeira.execute("SELECT COUNT(*) FROM reservas WHERE quarto = '2-1'").fetchone()[0] == 1
+    assert not mapa.livre("2-1", HOJE + 2, HOJE + 3)
+    with mapa.alterando_reservas(primeira):
+        mapa.garantir_livre(primeira, "2-1", HOJE, HOJE + 2)  # termina no check-in da outra
+    primeira.close()
+    segunda.close()
@@ -0,0 +1,86 @@
+import pytest
+
+from banco import divergencias_estoque, saldo_estoque, tirar_retratos
+from estoque import (EstoqueInsuficiente, _lancar, baixar, movimentando_estoque, registrar_entrada,
+                     registrar_saida)
+
+
+def _quantidade(conn, produto_id, tabela="estoque"):
+    return conn.execute(f"SELECT quantidade FROM {tabela} WHERE id = ?", (produto_id,)).fetchone()[0]
+
+
+def _movimentacoes(conn, produto_id):
+    return conn.execute(
+        "SELECT COUNT(*) FROM movimentacoes_estoque WHERE produto_id = ?", (produto_id,)
+    ).fetchone()[0]
+
+
+def test_saida_e_entrada_mantem_quantidade_igual_ao_razao(conn, produto):
+    pid = produto(quantidade=10)
+    assert registrar_saida(conn, "estoque", pid, 3) == (2.0, 6.0)
+    registrar_entrada(conn, "estoque", pid, 5, valor_unitario=2.5)
+
+    assert _quantidade(conn, pid) == 12
+    assert saldo_estoque(conn, "estoque", pid) == 12
+    assert divergencias_estoque(conn) == []
+
+
+def test_saida_maior_que_o_saldo_desfaz_tudo(conn, produto):
+    pid = produto(quantidade=5)
+    outro = produto(quantidade=5, nome="Toalha")
+    antes = _movimentacoes(conn, pid)
+
+    with pytest.raises(EstoqueInsuficiente) as erro:
+        with movimentando_estoque(conn):
+            baixar(conn, "estoque", outro, 1)
+            baixar(conn, "estoque", pid, 6)
+
+    assert (erro.value.produto_id, erro.value.quantidade, erro.value.disponivel) == (pid, 6, 5)
+    assert _quantidade(conn, pid) == 5 and _quantidade(conn, outro) == 5
+    assert _movimentacoes(conn, pid) == antes
+    assert not conn.in_transaction
+
+
+def test_recusa_do_gatilho_vira_estoque_insuficiente(conn, produto):
+    # Gravação que não passa pela conferência de baixar: só o gatilho decide
+    pid = produto(quantidade=2)
+    with pytest.raises(EstoqueInsuficiente) as erro:
+        with movimentando_estoque(conn):
+            _lancar(conn, "estoque", [(pid, 1, 2.0), (pid, 2, 4.0)], "Saída", "", None, None, {})
+
+    assert (erro.value.quantidade, erro.value.disponivel) == (2, 1)
+    assert _quantidade(conn, pid) == 2
+
+
+def test_baixar_fora_de_transacao_e_recusado(conn, produto):
+    pid = produto(quantidade=2)
+    with pytest.raises(RuntimeError):
+        baixar(conn, "estoque", pid, 1)
+    assert _quantidade(conn, pid) == 2
+
+
+def test_movimentacoes_nao_aceitam_update_nem_delete(conn, produto):
+    pid = produto(quantidade=2)
+    with pytest.raises(Exception):
+        conn.execute("UPDATE movimentacoes_estoque SET quantidade = 50 WHERE produto_id = ?", (pid,))
+    with pytest.raises(Exception):
+        conn.execute("DELETE FROM movimentacoes_estoque WHERE produto_id = ?", (pid,))
+    conn.rollback()
+    assert saldo_estoque(conn, "estoque", pid) == 2
+
+
+def test_saldo_por_data_usa_retrato_e_cauda(conn, produto):
+    pid = produto(quantidade=0)
+    with movimentando_estoque(conn):
+        _lancar(conn, "estoque", [(pid, 10, 20.0)], "Entrada", "", "2024-05-01", None, {})
+        _lancar(conn, "estoque", [(pid, 4, 8.0)], "Saída", "", "2024-05-10", None, {})
+    with movimentando_estoque(conn):
+        assert tirar_retratos(conn, minimo=1) == 1
+    with movimentando_estoque(conn):
+        _lancar(conn, "estoque", [(pid, 7, 14.0)], "Entrada", "", "2024-06-01", None, {})
+        _lancar(conn, "estoque", [(pid, 2, 4.0)], "Saída", "", "2024-06-15", None, {})
+
+    assert saldo_estoque(conn, "estoque", pid, "2024-05-05") == 10
+    assert saldo_estoque(conn, "estoque", pid, "2024-05-31") == 6
+    assert saldo_estoque(conn, "estoque", pid, "2024-06-10") == 13
+    assert saldo_estoque(conn, "estoque", pid) == 11 == _quantidade(conn, pid)